@@ -1,4 +1,6 @@
 import os
+import time
+import click
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
@@ -11,8 +13,9 @@ from logging.handlers import RotatingFileHandler
 # Load environment variables
 load_dotenv()
 
-# Initialize SQLAlchemy
-db = SQLAlchemy()
+# Initialize SQLAlchemy; the session reads from the replica bind on read-only requests
+from app.replica import RoutingSession
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Initialize LoginManager
 login_manager = LoginManager()
@@ -21,7 +24,11 @@ login_manager.login_view = 'auth.login'
 # Initialize CSRF protection
 csrf = CSRFProtect()
 
+# Seconds after startup before stalled population jobs are resumed (negative disables)
+POPULATION_RESUME_DELAY = float(os.environ.get('POPULATION_RESUME_DELAY', 30))
+
 def create_app(test_config=None):
+    started = time.perf_counter()
     # Create and configure the app
     app = Flask(__name__, instance_relative_config=True)
     
@@ -53,6 +60,7 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev'),
         SQLALCHEMY_DATABASE_URI=os.environ.get('DATABASE_URL', 'sqlite:///overflew.db'),
+        SQLALCHEMY_REPLICA_URI=os.environ.get('DATABASE_REPLICA_URL'),
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
     )
 
@@ -69,9 +77,17 @@ def create_app(test_config=None):
     except OSError:
         pass
 
+    # Apply the database profile (SQLite pragmas, replica bind) before the engines are created
+    from app.database import configure_database
+    configure_database(app)
+
     # Initialize db with app
     db.init_app(app)
 
+    # Send read-only requests to the read replica, if there is one
+    from app.replica import init_replica
+    init_replica(app)
+
     # Initialize login manager with app
     login_manager.init_app(app)
 
@@ -103,28 +119,138 @@ def create_app(test_config=None):
     app.register_blueprint(api_bp)
     app.register_blueprint(comments_bp)
 
-    # Import models
-    from app.models import User, Question, Answer, Comment, Vote, Tag, QuestionTag, AIPersonality
-    from app.models.site_settings import SiteSettings
-
-    # Create tables and initialize settings
     with app.app_context():
-        db.create_all()  # Make sure tables exist first
-        SiteSettings.init_settings()
-        app.logger.info('Database tables created and site settings initialized')
+        # Schema creation and settings seeding are `flask init-db`; startup only reads the version
+        from app.schema import check_schema
+        check_schema(app)
+
+        # Background write batches go through a single writer thread if enabled
+        from app.services.db_writer import start_writer
+        start_writer(app)
+
+        # Fold the reputation ledger into user reputation in the background
+        from app.services.reputation_service import start_reputation_aggregator
+        start_reputation_aggregator(app)
+
+        # Write buffered question view counts in batches
+        from app.services.view_counter import start_view_counter
+        start_view_counter(app)
+
+        # Write throttled last_seen updates in batches
+        from app.services.user_cache import start_last_seen_writer
+        start_last_seen_writer(app)
+
+        # Pick up population jobs interrupted by a crash or restart, off the boot path
+        if 'OPENAI_API_KEY' in os.environ and POPULATION_RESUME_DELAY >= 0:
+            from app.services.llm_service import queue_task_later, PRIORITY_BULK
+            from app.services.population_service import resume_population_jobs
+            queue_task_later(POPULATION_RESUME_DELAY, resume_population_jobs, priority=PRIORITY_BULK)
+
+    app.logger.info(f'Overflew started in {time.perf_counter() - started:.3f}s')
 
     # Create database tables
     @app.cli.command('init-db')
-    def init_db():
-        db.create_all()
-        print('Database initialized!')
+    @click.option('--force', is_flag=True, help='Run create_all and seed settings even if the schema is current')
+    def init_db(force):
+        from app.schema import init_schema, latest_version
+        if init_schema(force=force):
+            print(f'Database initialized at schema version {latest_version()}!')
+        else:
+            print(f'Database already at schema version {latest_version()}, nothing to do (use --force to re-run)')
 
-    # User loader callback
+    # Apply pending schema migrations
+    @app.cli.command('upgrade-db')
+    @click.option('--to', 'target', type=int, help='Stop after this version')
+    @click.option('--batch-size', type=int, help='Rows per transaction in data migrations')
+    def upgrade_db(target, batch_size):
+        from app.schema import run_migrations, MIGRATION_BATCH_SIZE
+        applied = run_migrations(target=target, batch_size=batch_size or MIGRATION_BATCH_SIZE)
+        print(f'Applied {len(applied)} migrations' + (f': {applied}' if applied else ''))
+
+    # List the migrations and whether they have been applied
+    @app.cli.command('db-status')
+    def db_status():
+        from app.schema import list_migrations, get_applied_migrations
+        applied = get_applied_migrations()
+        for version, name, module_name in list_migrations():
+            if version in applied:
+                print(f'{version:4d} {name:40s} applied {applied[version][1]}')
+            else:
+                print(f'{version:4d} {name:40s} pending')
+
+    # Add any missing default site settings
+    @app.cli.command('seed-settings')
+    def seed_settings():
+        from app.models.site_settings import SiteSettings
+        print(f'Added {SiteSettings.init_settings()} default settings')
+
+    # Recompute the related questions of every question
+    @app.cli.command('rebuild-related')
+    def rebuild_related():
+        from app.services.related_service import rebuild_related_questions
+        count = rebuild_related_questions()
+        print(f'Rebuilt related questions for {count} questions')
+
+    # Recompute every user's reputation from the ledger
+    @app.cli.command('rebuild-reputation')
+    def rebuild_reputation_command():
+        from app.services.reputation_service import rebuild_reputation
+        count = rebuild_reputation()
+        print(f'Rebuilt reputation for {count} users')
+
+    # Merge one tag into another (for tags too large for the admin page)
+    @app.cli.command('merge-tags')
+    @click.argument('source')
+    @click.argument('target')
+    def merge_tags_command(source, target):
+        from app.models.tag import Tag
+        from app.services.bulk_ops import merge_tags
+        source_tag = Tag.query.filter_by(name=source).first()
+        target_tag = Tag.query.filter_by(name=target).first()
+        if not source_tag or not target_tag or source_tag.id == target_tag.id:
+            print('Both tags must exist and be different')
+            return
+        moved = merge_tags(source_tag.id, target_tag.id,
+                           progress=lambda step, done, total: print(f'{step}: {done}/{total}'))
+        print(f'Merged {source} into {target} ({moved} questions)')
+
+    # Delete a user (or, with --personality, an AI personality and its users)
+    @app.cli.command('delete-user')
+    @click.argument('user_id', type=int)
+    @click.option('--personality', is_flag=True, help='Treat the id as an AI personality id')
+    def delete_user_command(user_id, personality):
+        from app.services.bulk_ops import delete_user, delete_ai_personality
+        progress = lambda step, done, total: print(f'{step}: {done}/{total}')
+        if personality:
+            print(f'Deleted {delete_ai_personality(user_id, progress=progress)} AI users')
+        else:
+            print(f'Deleted user {user_id}: {delete_user(user_id, progress=progress)}')
+
+    # Resume stalled thread population jobs
+    @app.cli.command('resume-population')
+    def resume_population():
+        from app.services.population_service import resume_population_jobs
+        resumed = resume_population_jobs()
+        print(f'Resumed {resumed} population jobs')
+
+    # User loader callback, served from a short-lived cache
     @login_manager.user_loader
     def load_user(user_id):
-        from app.models.user import User
-        return User.query.get(int(user_id))
+        from app.services.user_cache import load_user as load_cached_user
+        return load_cached_user(int(user_id))
+
+    # Track activity without a write per request
+    @app.before_request
+    def record_activity():
+        from flask_login import current_user
+        if current_user.is_authenticated:
+            from app.services.user_cache import touch_last_seen
+            touch_last_seen(current_user.id)
     
+    # Rendered fragments shared between requests ({% call fragment_cache(...) %})
+    from app.services.fragment_cache import init_fragment_cache
+    init_fragment_cache(app)
+
     # Add template context processors
     @app.context_processor
     def utility_processor():
@@ -0,0 +1,170 @@
+"""
+Database engine profiles.
+
+DATABASE_URL selects the backend. SQLite is the default and suits a single
+box; PostgreSQL lets several web and worker nodes share one database.
+
+The production profile tunes SQLite for a web process that reads while the
+LLM worker threads write: WAL journaling so readers never wait for the
+writer, a busy timeout so writers queue for the lock instead of failing with
+"database is locked", synchronous=NORMAL (safe under WAL), and a larger page
+cache and memory map. The pragmas are applied to every new connection.
+
+For PostgreSQL the engine gets a sized connection pool (shared by the request
+threads and the LLM workers), pre-ping so connections dropped by a failover
+or an idle timeout are replaced instead of failing a request, periodic
+recycling, and a per-connection statement timeout so one runaway query can't
+hold a pool slot forever.
+
+DATABASE_REPLICA_URL adds a read replica (a PostgreSQL streaming replica, or
+a periodically refreshed copy of the SQLite file) as the "replica" bind, with
+the same profile as the primary; app.replica decides which requests read
+from it.
+
+Set DATABASE_PROFILE=development to use the drivers' defaults.
+"""
+import os
+import sqlite3
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE', 'production')
+
+# Connection pool for server databases (PostgreSQL), per process
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+# Seconds a request waits for a free connection before failing
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+# Seconds after which a connection is replaced
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+# Milliseconds a single statement may run (0 disables)
+DB_STATEMENT_TIMEOUT = int(os.environ.get('DB_STATEMENT_TIMEOUT', 30000))
+# Milliseconds a connection waits for the write lock before giving up
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))
+# Page cache per connection, in KiB
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 65536))
+# Bytes of the database file mapped into memory
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 268435456))
+
+# Bind key of the read replica engine
+REPLICA_BIND = 'replica'
+
+_pragmas_registered = False
+
+
+def is_sqlite(uri):
+    return (uri or '').startswith('sqlite')
+
+
+def is_postgres(uri):
+    return (uri or '').startswith(('postgresql', 'postgres:'))
+
+
+def normalize_uri(uri):
+    """Accept the postgres:// scheme many hosting providers hand out"""
+    if uri and uri.startswith('postgres://'):
+        return 'postgresql://' + uri[len('postgres://'):]
+    return uri
+
+
+def dialect_name(session=None):
+    """Name of the dialect a session is bound to ('sqlite', 'postgresql', ...)"""
+    from app import db
+    return (session or db.session).get_bind().dialect.name
+
+
+def postgres_engine_options():
+    """Pool and connection settings of the PostgreSQL production profile"""
+    options = {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+        'connect_args': {'application_name': 'overflew'},
+    }
+    if DB_STATEMENT_TIMEOUT:
+        options['connect_args']['options'] = f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'
+    return options
+
+
+def sqlite_engine_options():
+    """Connection settings of the SQLite production profile"""
+    # Connections are shared with the background threads; the driver's own wait matches busy_timeout
+    return {'connect_args': {'check_same_thread': False, 'timeout': SQLITE_BUSY_TIMEOUT / 1000}}
+
+
+def sqlite_pragmas():
+    """The PRAGMA statements of the production profile, in the order they're applied"""
+    return [
+        'PRAGMA journal_mode=WAL',
+        f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}',
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}',
+        f'PRAGMA mmap_size={SQLITE_MMAP_SIZE}',
+        'PRAGMA temp_store=MEMORY',
+    ]
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma in sqlite_pragmas():
+            cursor.execute(pragma)
+    finally:
+        cursor.close()
+
+
+def _merge_options(options, defaults):
+    """Fill in engine options (and connect_args) that aren't configured explicitly"""
+    for key, value in defaults.items():
+        if key == 'connect_args':
+            connect_args = options.setdefault('connect_args', {})
+            for arg, arg_value in value.items():
+                connect_args.setdefault(arg, arg_value)
+        else:
+            options.setdefault(key, value)
+    return options
+
+
+def _register_sqlite_pragmas():
+    global _pragmas_registered
+    if not _pragmas_registered:
+        event.listen(Engine, 'connect', _apply_sqlite_pragmas)
+        _pragmas_registered = True
+
+
+def configure_database(app):
+    """Apply the database profile to the app config; call before db.init_app()"""
+    uri = normalize_uri(app.config.get('SQLALCHEMY_DATABASE_URI'))
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    _configure_replica(app)
+    if DATABASE_PROFILE != 'production':
+        return
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    if is_postgres(uri):
+        _merge_options(options, postgres_engine_options())
+        app.logger.info(f"Using the PostgreSQL production profile (pool {options['pool_size']}"
+                        f"+{options['max_overflow']}, pre-ping, statement timeout {DB_STATEMENT_TIMEOUT}ms)")
+    elif is_sqlite(uri):
+        _merge_options(options, sqlite_engine_options())
+        _register_sqlite_pragmas()
+        app.logger.info('Using the SQLite production profile (WAL, busy timeout, tuned cache)')
+
+
+def _configure_replica(app):
+    uri = normalize_uri(app.config.get('SQLALCHEMY_REPLICA_URI'))
+    if not uri:
+        return
+    # Binds don't inherit SQLALCHEMY_ENGINE_OPTIONS, so the replica gets its own profile
+    bind = {'url': uri}
+    if DATABASE_PROFILE == 'production':
+        if is_postgres(uri):
+            _merge_options(bind, postgres_engine_options())
+            bind['connect_args']['application_name'] = 'overflew-replica'
+        elif is_sqlite(uri):
+            _merge_options(bind, sqlite_engine_options())
+            _register_sqlite_pragmas()
+    app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA_BIND] = bind
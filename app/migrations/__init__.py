@@ -0,0 +1,6 @@
+"""
+Versioned schema migrations, applied in order by app.schema.run_migrations().
+
+Add a module named vNNN_description.py with an upgrade(migration) function;
+see app/schema.py for the helpers it receives.
+"""
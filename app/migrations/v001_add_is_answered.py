@@ -0,0 +1,5 @@
+"""Add the is_answered flag to questions"""
+
+
+def upgrade(migration):
+    migration.add_column('questions', 'is_answered', "BOOLEAN DEFAULT FALSE")
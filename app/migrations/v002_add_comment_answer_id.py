@@ -0,0 +1,5 @@
+"""Add the temporary answer_id column that links legacy comments to the answer they were posted on"""
+
+
+def upgrade(migration):
+    migration.add_column('comments', 'answer_id', "INTEGER REFERENCES answers(id)")
@@ -0,0 +1,34 @@
+"""
+Add the denormalized score columns to questions and comments, backfill them
+from the votes table, and create the population job tables (adding the
+discussion round columns to a population_jobs table made before them).
+"""
+from app.models.population_job import PopulationJob, PopulationUnit
+from app.models.vote import recalculate_scores
+
+NEW_COLUMNS = [
+    ('questions', 'score', "INTEGER NOT NULL DEFAULT 0"),
+    ('comments', 'score', "INTEGER NOT NULL DEFAULT 0"),
+    ('population_jobs', 'round', "INTEGER DEFAULT 0"),
+    ('population_jobs', 'max_rounds', "INTEGER DEFAULT 1"),
+    ('population_jobs', 'round_started_at', "TIMESTAMP"),
+    ('population_jobs', 'score_snapshot', "TEXT"),
+    ('population_jobs', 'token_budget', "INTEGER DEFAULT 0"),
+    ('population_jobs', 'tokens_used', "INTEGER DEFAULT 0"),
+    ('population_jobs', 'stop_reason', "VARCHAR(64)"),
+]
+
+
+def upgrade(migration):
+    migration.create_table(PopulationJob)
+    migration.create_table(PopulationUnit)
+    for table, column, definition in NEW_COLUMNS:
+        migration.add_column(table, column, definition)
+    for table in ('questions', 'comments'):
+        migration.create_index(table, 'score')
+
+    migration.log("  Backfilling scores from votes...")
+    for ids in migration.batches('questions'):
+        recalculate_scores(question_ids=ids, comment_ids=[])
+    for ids in migration.batches('comments'):
+        recalculate_scores(question_ids=[], comment_ids=ids)
@@ -0,0 +1,8 @@
+"""
+Add the duplicate_of_id column to questions, used to link new questions to an
+existing answered thread instead of regenerating answers.
+"""
+
+
+def upgrade(migration):
+    migration.add_column('questions', 'duplicate_of_id', "INTEGER REFERENCES questions(id)")
@@ -0,0 +1,24 @@
+"""
+Create the reputation_events ledger. Each user's current reputation is
+recorded as an already applied 'baseline' event, so rebuilding reputation
+from the ledger keeps the points earned before it existed.
+"""
+from app.models.reputation_event import ReputationEvent
+
+
+def upgrade(migration):
+    migration.create_table(ReputationEvent)
+
+    # The baseline is whatever part of the reputation the applied events don't explain
+    result = migration.execute("""
+        INSERT INTO reputation_events (user_id, points, reason, applied, created_at)
+        SELECT id, points, 'baseline', :applied, CURRENT_TIMESTAMP FROM (
+            SELECT u.id AS id, COALESCE(u.reputation, 0) - COALESCE(
+                (SELECT SUM(e.points) FROM reputation_events e
+                 WHERE e.user_id = u.id AND e.applied = :applied), 0) AS points
+            FROM users u
+            WHERE NOT EXISTS (SELECT 1 FROM reputation_events b
+                              WHERE b.user_id = u.id AND b.reason = 'baseline')
+        ) baselines WHERE points != 0
+    """, {'applied': True})
+    migration.log(f"  Recorded baseline reputation for {result.rowcount} users")
@@ -0,0 +1,25 @@
+"""
+Add the denormalized thread statistics (answer_count, comment_count,
+has_accepted, last_activity_at) to questions and backfill them from comments.
+"""
+from app.models.comment import recalculate_question_stats
+
+NEW_COLUMNS = [
+    ('answer_count', "INTEGER NOT NULL DEFAULT 0"),
+    ('comment_count', "INTEGER NOT NULL DEFAULT 0"),
+    ('has_accepted', "BOOLEAN NOT NULL DEFAULT FALSE"),
+    ('last_activity_at', "TIMESTAMP"),
+]
+
+NEW_INDEXES = ['answer_count', 'has_accepted', 'last_activity_at']
+
+
+def upgrade(migration):
+    for column, definition in NEW_COLUMNS:
+        migration.add_column('questions', column, definition)
+    for column in NEW_INDEXES:
+        migration.create_index('questions', column)
+
+    migration.log("  Backfilling thread statistics from comments...")
+    for ids in migration.batches('questions'):
+        recalculate_question_stats(ids)
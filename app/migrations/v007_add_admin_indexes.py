@@ -0,0 +1,14 @@
+"""Add the indexes behind the sortable columns of the admin question and user consoles"""
+
+NEW_INDEXES = [
+    ('questions', 'created_at'),
+    ('questions', 'views'),
+    ('users', 'reputation'),
+    ('users', 'created_at'),
+    ('users', 'last_seen'),
+]
+
+
+def upgrade(migration):
+    for table, column in NEW_INDEXES:
+        migration.create_index(table, column)
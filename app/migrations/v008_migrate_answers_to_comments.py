@@ -0,0 +1,88 @@
+"""
+Copy the legacy answers into top-level comments of the unified comment system.
+
+Each batch of answers is one transaction of set-based statements: the answers
+are copied with INSERT ... SELECT, then the comments posted on them become
+replies to their copies and their votes move to the copies. An answer counts
+as copied when a top-level comment with the same question, author and
+creation time exists, which also recognizes answers copied by the old
+one-row-at-a-time script, so running this again never duplicates anything.
+
+Reputation is not touched: the points from answer votes are already part of
+the users' baseline in the reputation ledger.
+"""
+from sqlalchemy import and_, exists, false, func, null, or_, select
+from app import db
+from app.models.answer import LegacyAnswer
+from app.models.comment import Comment, recalculate_question_stats
+from app.models.vote import recalculate_scores
+
+answers = LegacyAnswer.__table__
+comments = Comment.__table__
+
+# The top-level comment an answer was copied to, for a correlated answer id column
+COPY_OF = """
+    SELECT c.id FROM comments c, answers a
+    WHERE a.id = {answer_id}
+      AND c.question_id = a.question_id AND c.user_id = a.user_id
+      AND (c.created_at = a.created_at OR (c.created_at IS NULL AND a.created_at IS NULL))
+      AND c.parent_comment_id IS NULL AND c.answer_id IS NULL
+    ORDER BY c.id LIMIT 1
+"""
+
+
+def _matches(copy):
+    """Join condition between answers and their top-level comment copies"""
+    return and_(
+        copy.c.question_id == answers.c.question_id,
+        copy.c.user_id == answers.c.user_id,
+        or_(copy.c.created_at == answers.c.created_at,
+            and_(copy.c.created_at.is_(None), answers.c.created_at.is_(None))),
+        copy.c.parent_comment_id.is_(None),
+        copy.c.answer_id.is_(None),
+    )
+
+
+def upgrade(migration):
+    # Copies are looked up by question, legacy replies and votes by answer_id
+    migration.create_index('comments', 'question_id')
+    migration.create_index('comments', 'answer_id')
+    move_votes = migration.has_column('votes', 'answer_id')
+    if move_votes:
+        migration.create_index('votes', 'answer_id')
+
+    copy = comments.alias('c')
+    for ids in migration.batches('answers'):
+        batch = answers.c.id.in_(ids)
+
+        db.session.execute(comments.insert().from_select(
+            ['body', 'user_id', 'question_id', 'parent_comment_id', 'created_at', 'updated_at',
+             'is_deleted', 'is_accepted', 'score'],
+            select(answers.c.body, answers.c.user_id, answers.c.question_id, null(),
+                   answers.c.created_at, answers.c.updated_at,
+                   func.coalesce(answers.c.is_deleted, false()),
+                   func.coalesce(answers.c.is_accepted, false()), 0)
+            .where(batch, ~exists().where(_matches(copy)))
+        ))
+
+        # Comments posted on an answer become replies to its copy
+        migration.execute(f"""
+            UPDATE comments SET parent_comment_id = ({COPY_OF.format(answer_id='comments.answer_id')})
+            WHERE answer_id IN :ids AND parent_comment_id IS NULL
+        """, {'ids': ids}, expanding=['ids'])
+        migration.execute("UPDATE comments SET answer_id = NULL WHERE answer_id IN :ids",
+                          {'ids': ids}, expanding=['ids'])
+
+        if move_votes:
+            migration.execute(f"""
+                UPDATE votes SET comment_id = ({COPY_OF.format(answer_id='votes.answer_id')}), answer_id = NULL
+                WHERE answer_id IN :ids
+            """, {'ids': ids}, expanding=['ids'])
+
+        # Core statements skip the Comment and Vote events
+        comment_ids = [row[0] for row in db.session.execute(
+            select(copy.c.id).select_from(answers.join(copy, _matches(copy))).where(batch))]
+        question_ids = [row[0] for row in db.session.execute(
+            select(answers.c.question_id).where(batch).distinct())]
+        recalculate_scores(question_ids=[], comment_ids=comment_ids)
+        recalculate_question_stats(question_ids)
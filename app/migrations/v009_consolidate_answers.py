@@ -0,0 +1,27 @@
+"""
+Finish retiring the legacy answers table.
+
+Adds the partial indexes that serve answer queries straight from the comments
+table, then deletes every legacy answer that has a top-level comment copy
+(made by migration 8), in batches. Anything without a copy is copied first,
+so no answer is lost even if rows were added after migration 8 ran.
+"""
+from app.migrations import v008_migrate_answers_to_comments as copy_answers
+
+ANSWER_INDEXES = [
+    ('ix_comments_answers_question', 'question_id, score'),
+    ('ix_comments_answers_user', 'user_id, created_at'),
+]
+
+
+def upgrade(migration):
+    for name, columns in ANSWER_INDEXES:
+        migration.execute(f"CREATE INDEX IF NOT EXISTS {name} ON comments ({columns}) "
+                          f"WHERE parent_comment_id IS NULL")
+
+    copy_answers.upgrade(migration)
+
+    for ids in migration.batches('answers'):
+        migration.execute(f"""
+            DELETE FROM answers WHERE id IN :ids AND EXISTS ({copy_answers.COPY_OF.format(answer_id='answers.id')})
+        """, {'ids': ids}, expanding=['ids'])
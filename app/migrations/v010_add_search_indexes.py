@@ -0,0 +1,23 @@
+"""
+Add the GIN expression indexes used by full-text search on PostgreSQL.
+
+The expressions must stay identical to question_document() and
+comment_document() in app/services/search_service.py. Other databases
+search with LIKE and need nothing here.
+"""
+from app.services.search_service import SEARCH_LANGUAGE
+
+
+def upgrade(migration):
+    if migration.dialect != 'postgresql':
+        migration.log("  Not PostgreSQL, nothing to do")
+        return
+    config = f"'{SEARCH_LANGUAGE}'::regconfig"
+    migration.execute(f"""
+        CREATE INDEX IF NOT EXISTS ix_questions_fts ON questions
+        USING GIN (to_tsvector({config}, coalesce(title, '') || ' ' || coalesce(body, '')))
+    """)
+    migration.execute(f"""
+        CREATE INDEX IF NOT EXISTS ix_comments_fts ON comments
+        USING GIN (to_tsvector({config}, coalesce(body, '')))
+    """)
@@ -0,0 +1,19 @@
+"""
+Create the population job and related questions tables.
+
+Before migrations had to create new tables, migration 3 skipped the
+population_jobs columns when the table was missing and the related_questions
+table had no migration at all, so databases upgraded with `flask upgrade-db`
+never got them. Creating a table that already exists does nothing.
+"""
+from app.models.population_job import PopulationJob, PopulationUnit
+from app.models.related_question import RelatedQuestion
+
+
+def upgrade(migration):
+    for model in (PopulationJob, PopulationUnit, RelatedQuestion):
+        if migration.has_table(model.__tablename__):
+            migration.log(f"  {model.__tablename__} already exists")
+        else:
+            migration.create_table(model)
+            migration.log(f"  Created {model.__tablename__}")
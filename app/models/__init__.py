@@ -1,7 +1,11 @@
 from app.models.user import User
 from app.models.question import Question
-from app.models.answer import Answer
+from app.models.answer import LegacyAnswer
 from app.models.comment import Comment
 from app.models.vote import Vote
 from app.models.tag import Tag, QuestionTag
 from app.models.ai_personality import AIPersonality
+from app.models.population_job import PopulationJob, PopulationUnit
+from app.models.related_question import RelatedQuestion
+from app.models.reputation_event import ReputationEvent
+from app.models.schema_version import SchemaVersion
@@ -1,7 +1,12 @@
 from datetime import datetime
 import markdown
+from sqlalchemy import event
+from sqlalchemy.ext.hybrid import hybrid_property
 from app import db
 
+# Reputation awarded to the author of an accepted answer
+ACCEPT_REPUTATION = 15
+
 
 class Comment(db.Model):
     __tablename__ = 'comments'
@@ -9,13 +14,24 @@ class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     body = db.Column(db.Text, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=False, index=True)
     parent_comment_id = db.Column(db.Integer, db.ForeignKey('comments.id'), nullable=True)
     answer_id = db.Column(db.Integer, db.ForeignKey('answers.id'), nullable=True)  # Temporary field for migration
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_deleted = db.Column(db.Boolean, default=False)
     is_accepted = db.Column(db.Boolean, default=False)  # True if this comment is accepted by the question author
+    score = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)  # Denormalized vote total, kept in sync by Vote events
+
+    __table_args__ = (
+        # Partial indexes over the answers (top-level comments), for per-question and per-user answer lists
+        db.Index('ix_comments_answers_question', 'question_id', 'score',
+                 sqlite_where=db.text('parent_comment_id IS NULL'),
+                 postgresql_where=db.text('parent_comment_id IS NULL')),
+        db.Index('ix_comments_answers_user', 'user_id', 'created_at',
+                 sqlite_where=db.text('parent_comment_id IS NULL'),
+                 postgresql_where=db.text('parent_comment_id IS NULL')),
+    )
 
     # Relationships
     votes = db.relationship('Vote', backref='comment', lazy='dynamic', cascade='all, delete-orphan')
@@ -33,13 +49,6 @@ class Comment(db.Model):
         self.is_deleted = False
         self.is_accepted = False
 
-    @property
-    def score(self):
-        """Calculate the score based on upvotes and downvotes"""
-        upvotes = sum(1 for vote in self.votes if vote.vote_type == 1)
-        downvotes = sum(1 for vote in self.votes if vote.vote_type == -1)
-        return upvotes - downvotes
-
     @property
     def html_content(self):
         """Convert markdown to HTML for display"""
@@ -48,10 +57,53 @@ class Comment(db.Model):
         return markdown.markdown(self.body, extensions=['fenced_code', 'codehilite'])
     
     @property
+    def body_html(self):
+        """Answer-style alias of html_content"""
+        return self.html_content
+
+    @hybrid_property
     def is_answer(self):
         """A comment is an answer if it's a top-level comment (no parent)"""
         return self.parent_comment_id is None
 
+    @is_answer.expression
+    def is_answer(cls):
+        return cls.parent_comment_id.is_(None)
+
+    @classmethod
+    def answers(cls):
+        """Query over all answers (live and deleted)"""
+        return cls.query.filter(cls.is_answer)
+
+    def accept(self, actor_id=None):
+        """
+        Mark this answer as the accepted one for its question
+
+        Acceptance moves from any previously accepted answer, taking its
+        reputation with it. Changes are added to the session, not committed.
+
+        Returns:
+            bool: False if this answer was already accepted
+        """
+        from app.services.reputation_service import record_reputation
+
+        previous = Comment.query.filter(
+            Comment.question_id == self.question_id,
+            Comment.is_accepted == True,
+            Comment.id != self.id
+        ).all()
+        for answer in previous:
+            answer.is_accepted = False
+            record_reputation(answer.user_id, -ACCEPT_REPUTATION, 'accept', actor_id=actor_id,
+                              question_id=self.question_id, comment_id=answer.id)
+
+        if self.is_accepted:
+            return False
+        self.is_accepted = True
+        record_reputation(self.user_id, ACCEPT_REPUTATION, 'accept', actor_id=actor_id,
+                          question_id=self.question_id, comment_id=self.id)
+        return True
+
     def soft_delete(self):
         """Marks the comment as deleted without removing it from the database"""
         self.is_deleted = True
@@ -63,3 +115,100 @@ class Comment(db.Model):
             return f'<Answer {self.id} for Question {self.question_id}>'
         else:
             return f'<Comment {self.id} replying to {self.parent_comment_id}>'
+
+
+def _update_question_stats(connection, question_id, answers=0, comments=0, activity_at=None, accepted=False):
+    """Apply a comment change to the denormalized statistics of its question"""
+    from app.models.question import Question
+
+    if question_id is None:
+        return
+    questions = Question.__table__
+    comments_table = Comment.__table__
+    values = {}
+    if answers:
+        values['answer_count'] = questions.c.answer_count + answers
+    if comments:
+        values['comment_count'] = questions.c.comment_count + comments
+    if activity_at is not None:
+        values['last_activity_at'] = activity_at
+    if accepted:
+        # Recomputed rather than toggled, so moving an acceptance between answers stays correct
+        values['has_accepted'] = db.exists().where(
+            comments_table.c.question_id == question_id,
+            comments_table.c.parent_comment_id.is_(None),
+            comments_table.c.is_accepted == True,
+            comments_table.c.is_deleted == False
+        )
+    if not values:
+        return
+    # Single atomic UPDATE; keep updated_at so activity doesn't show up as an edit
+    values['updated_at'] = questions.c.updated_at
+    connection.execute(questions.update().where(questions.c.id == question_id).values(values))
+
+
+def _live(comment):
+    return 0 if comment.is_deleted else 1
+
+
+@event.listens_for(Comment, 'after_insert')
+def _comment_inserted(mapper, connection, comment):
+    live = _live(comment)
+    _update_question_stats(connection, comment.question_id,
+                           answers=live if comment.parent_comment_id is None else 0,
+                           comments=live,
+                           activity_at=comment.created_at or datetime.utcnow(),
+                           accepted=bool(comment.is_accepted))
+
+
+@event.listens_for(Comment, 'after_update')
+def _comment_updated(mapper, connection, comment):
+    state = db.inspect(comment)
+    deleted = state.attrs.is_deleted.history
+    accepted = state.attrs.is_accepted.history
+    delta = 0
+    if deleted.deleted and bool(deleted.deleted[0]) != bool(comment.is_deleted):
+        delta = -1 if comment.is_deleted else 1
+    _update_question_stats(connection, comment.question_id,
+                           answers=delta if comment.parent_comment_id is None else 0,
+                           comments=delta,
+                           accepted=bool(delta or accepted.deleted))
+
+
+@event.listens_for(Comment, 'after_delete')
+def _comment_deleted(mapper, connection, comment):
+    live = _live(comment)
+    _update_question_stats(connection, comment.question_id,
+                           answers=-live if comment.parent_comment_id is None else 0,
+                           comments=-live,
+                           accepted=bool(comment.is_accepted))
+
+
+def recalculate_question_stats(question_ids=None):
+    """
+    Recompute the denormalized thread statistics of questions from the comments table
+
+    Needed after bulk changes that bypass the ORM events, e.g. query.update().
+    Pass None to recompute every question.
+    """
+    from app.models.question import Question
+
+    if question_ids is not None and not question_ids:
+        return
+    live = db.and_(Comment.question_id == Question.id, Comment.is_deleted == False)
+    answers = db.select(db.func.count(Comment.id)).where(
+        live, Comment.parent_comment_id.is_(None)).scalar_subquery()
+    comments = db.select(db.func.count(Comment.id)).where(live).scalar_subquery()
+    accepted = db.exists().where(live, Comment.parent_comment_id.is_(None), Comment.is_accepted == True)
+    last_comment = db.select(db.func.max(Comment.created_at)).where(live).scalar_subquery()
+
+    query = db.session.query(Question)
+    if question_ids is not None:
+        query = query.filter(Question.id.in_(question_ids))
+    query.update({
+        Question.answer_count: answers,
+        Question.comment_count: comments,
+        Question.has_accepted: accepted,
+        Question.last_activity_at: db.func.coalesce(last_comment, Question.created_at),
+        Question.updated_at: Question.updated_at,
+    }, synchronize_session=False)
@@ -0,0 +1,99 @@
+from datetime import datetime
+from app import db
+
+
+class PopulationJob(db.Model):
+    """A thread population run with persisted progress so it can be resumed"""
+    __tablename__ = 'population_jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, running, completed, failed
+    personality_ids = db.Column(db.Text, nullable=False, default='')  # Comma-separated ids selected for this run
+    max_comments = db.Column(db.Integer, nullable=False)
+    existing_ai_comments = db.Column(db.Integer, default=0)  # AI comments already in the thread when the job started
+    reviews_planned = db.Column(db.Boolean, default=False)  # True once the first review round has been planned
+    comments_created = db.Column(db.Integer, default=0)
+    votes_created = db.Column(db.Integer, default=0)
+    round = db.Column(db.Integer, default=0)  # Current discussion round, 0 until the first round is planned
+    max_rounds = db.Column(db.Integer, default=1)
+    round_started_at = db.Column(db.DateTime)  # Items created or edited after this are new for the next round
+    score_snapshot = db.Column(db.Text)  # JSON {comment_id: score} taken when the current round started
+    token_budget = db.Column(db.Integer, default=0)  # Estimated tokens allowed for the job, 0 for no limit
+    tokens_used = db.Column(db.Integer, default=0)
+    stop_reason = db.Column(db.String(64))  # Why the discussion ended (converged, max rounds, token budget, ...)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    heartbeat_at = db.Column(db.DateTime)  # Last time a worker made progress on this job
+    finished_at = db.Column(db.DateTime)
+
+    # Relationships
+    question = db.relationship('Question', backref=db.backref('population_jobs', lazy='dynamic'))
+    units = db.relationship('PopulationUnit', backref='job', lazy='dynamic',
+                            cascade='all, delete-orphan', order_by='PopulationUnit.position')
+
+    @property
+    def personality_id_list(self):
+        """The selected personality ids as a list of integers"""
+        return [int(pid) for pid in self.personality_ids.split(',') if pid]
+
+    @property
+    def is_active(self):
+        return self.status in ('pending', 'running')
+
+    def progress(self):
+        """Get a summary of unit progress for this job"""
+        counts = dict(
+            db.session.query(PopulationUnit.status, db.func.count(PopulationUnit.id))
+            .filter(PopulationUnit.job_id == self.id)
+            .group_by(PopulationUnit.status)
+            .all()
+        )
+        total = sum(counts.values())
+        finished = total - counts.get('pending', 0)
+        return {
+            'total': total,
+            'pending': counts.get('pending', 0),
+            'done': counts.get('done', 0),
+            'skipped': counts.get('skipped', 0),
+            'failed': counts.get('failed', 0),
+            'percent': int(finished * 100 / total) if total else 0,
+        }
+
+    def __repr__(self):
+        return f'<PopulationJob {self.id} for Question {self.question_id} [{self.status}]>'
+
+
+class PopulationUnit(db.Model):
+    """
+    A single planned (personality, item) step of a population job.
+
+    Raw completions are stored on the unit as soon as they arrive, so a crash
+    between the LLM call and writing the vote or reply never loses the text.
+    """
+    __tablename__ = 'population_units'
+
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, db.ForeignKey('population_jobs.id'), nullable=False)
+    position = db.Column(db.Integer, nullable=False)  # Execution order within the job
+    kind = db.Column(db.String(20), nullable=False)  # 'answer' (answer the question) or 'review' (vote and maybe reply)
+    personality_id = db.Column(db.Integer, db.ForeignKey('ai_personalities.id'), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('comments.id'), nullable=True)  # Comment being reviewed
+    wants_reply = db.Column(db.Boolean, default=False)  # Decided when the unit was planned
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, done, skipped, failed
+    attempts = db.Column(db.Integer, default=0)
+    vote_response = db.Column(db.Text)  # Raw evaluation completion
+    vote_type = db.Column(db.Integer)
+    vote_id = db.Column(db.Integer, db.ForeignKey('votes.id', ondelete='SET NULL'), nullable=True)
+    reply_text = db.Column(db.Text)  # Raw answer/reply completion
+    comment_id = db.Column(db.Integer, db.ForeignKey('comments.id', ondelete='SET NULL'), nullable=True)
+    last_error = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_population_units_job_status_position', 'job_id', 'status', 'position'),
+    )
+
+    def __repr__(self):
+        return f'<PopulationUnit {self.id} job={self.job_id} {self.kind} [{self.status}]>'
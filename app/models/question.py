@@ -10,13 +10,20 @@ class Question(db.Model):
     title = db.Column(db.String(120), nullable=False)
     body = db.Column(db.Text, nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    views = db.Column(db.Integer, default=0)
+    views = db.Column(db.Integer, default=0, index=True)
     is_closed = db.Column(db.Boolean, default=False)
     close_reason = db.Column(db.String(120))
     is_deleted = db.Column(db.Boolean, default=False)
     is_answered = db.Column(db.Boolean, default=False)
+    score = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)  # Denormalized vote total, kept in sync by Vote events
+    duplicate_of_id = db.Column(db.Integer, db.ForeignKey('questions.id'), nullable=True)  # Answered thread this question duplicates
+    # Thread statistics, kept in sync by Comment events
+    answer_count = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)  # Live top-level comments
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Live comments of any depth
+    has_accepted = db.Column(db.Boolean, nullable=False, default=False, server_default='0', index=True)
+    last_activity_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     # Relationships
     # Note: No user relationship here as it's defined in the User model with backref='author'
@@ -24,6 +31,7 @@ class Question(db.Model):
                               primaryjoin="Comment.question_id==Question.id")
     tags = db.relationship('QuestionTag', backref='question', lazy='dynamic', cascade='all, delete-orphan')
     votes = db.relationship('Vote', backref='question', lazy='dynamic', cascade='all, delete-orphan')
+    duplicate_of = db.relationship('Question', remote_side=[id], foreign_keys=[duplicate_of_id])
 
     @property
     def answers(self):
@@ -36,13 +44,6 @@ class Question(db.Model):
     
     # Since answers and top-level comments are now the same thing in our model,
     # we don't need a separate top_comments property
-
-    @property
-    def score(self):
-        """Calculate the score based on upvotes and downvotes"""
-        upvotes = sum(1 for vote in self.votes if vote.vote_type == 1)
-        downvotes = sum(1 for vote in self.votes if vote.vote_type == -1)
-        return upvotes - downvotes
         
     @property
     def body_html(self):
@@ -51,15 +52,13 @@ class Question(db.Model):
             return "<em>[This question has been deleted]</em>"
         return markdown.markdown(self.body, extensions=['extra', 'codehilite'])
     
-    @property
-    def answer_count(self):
-        """Get the number of answers (top-level comments) for this question"""
-        return self.answers.count()
-    
     def increment_view(self):
-        """Increment the view count for this question"""
-        self.views += 1
-        db.session.commit()
+        """Count a view of this question; the database is updated in batches by the view counter"""
+        from sqlalchemy.orm.attributes import set_committed_value
+        from app.services.view_counter import record_view
+        record_view(self.id)
+        # Show the viewer an up-to-date count without marking the question dirty
+        set_committed_value(self, 'views', (self.views or 0) + 1)
         
     def soft_delete(self):
         """Marks the question as deleted without removing it from the database"""
@@ -0,0 +1,20 @@
+from datetime import datetime
+from app import db
+
+
+class RelatedQuestion(db.Model):
+    """Precomputed top-N neighbours of a question, maintained by the related questions service"""
+    __tablename__ = 'related_questions'
+
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id', ondelete='CASCADE'), primary_key=True)
+    related_id = db.Column(db.Integer, db.ForeignKey('questions.id', ondelete='CASCADE'), primary_key=True)
+    rank = db.Column(db.Integer, nullable=False)  # 0 is the most related
+    score = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_related_questions_question_rank', 'question_id', 'rank'),
+    )
+
+    def __repr__(self):
+        return f'<RelatedQuestion {self.question_id} -> {self.related_id} ({self.score:.2f})>'
@@ -0,0 +1,20 @@
+from datetime import datetime
+from app import db
+
+
+class ReputationEvent(db.Model):
+    """Append-only ledger of reputation changes, folded into User.reputation by the reputation service"""
+    __tablename__ = 'reputation_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
+    points = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(32), nullable=False)  # 'vote', 'accept', 'baseline', 'adjustment'
+    actor_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='SET NULL'), nullable=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('questions.id', ondelete='SET NULL'), nullable=True)
+    comment_id = db.Column(db.Integer, db.ForeignKey('comments.id', ondelete='SET NULL'), nullable=True)
+    applied = db.Column(db.Boolean, nullable=False, default=False, server_default='0', index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<ReputationEvent {self.reason} {self.points:+d} for user {self.user_id}>'
@@ -0,0 +1,14 @@
+from datetime import datetime
+from app import db
+
+
+class SchemaVersion(db.Model):
+    """One row per schema version applied to the database, written by `flask init-db`"""
+    __tablename__ = 'schema_version'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(128), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<SchemaVersion {self.version} {self.name}>'
@@ -65,13 +65,14 @@ Respond to the following content in a way that reflects your personality and exp
                 'Default template for AI personality prompts')
         }
         
-        for key, (value, description) in default_settings.items():
-            setting = cls.query.filter_by(key=key).first()
-            if not setting:
-                setting = cls(key=key, value=value, description=description)
-                db.session.add(setting)
-        
-        db.session.commit()
+        # One query for all existing keys, then add the missing ones
+        existing = {key for (key,) in db.session.query(cls.key).filter(cls.key.in_(default_settings.keys()))}
+        missing = [cls(key=key, value=value, description=description)
+                   for key, (value, description) in default_settings.items() if key not in existing]
+        if missing:
+            db.session.add_all(missing)
+            db.session.commit()
+        return len(missing)
         
     def __repr__(self):
         return f'<SiteSettings {self.key}={self.value}>'
@@ -11,18 +11,21 @@ class User(db.Model, UserMixin):
     username = db.Column(db.String(64), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128))
-    reputation = db.Column(db.Integer, default=0)
+    reputation = db.Column(db.Integer, default=0, index=True)
     about_me = db.Column(db.Text)
     profile_image = db.Column(db.String(256))
     is_admin = db.Column(db.Boolean, default=False)
     is_ai = db.Column(db.Boolean, default=False)
     ai_personality_id = db.Column(db.Integer, db.ForeignKey('ai_personalities.id'), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    last_seen = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    last_seen = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
     # Relationships
     questions = db.relationship('Question', backref='author', lazy='dynamic')
-    answers = db.relationship('Answer', backref='author', lazy='dynamic')
+    # Answers are the user's top-level comments
+    answers = db.relationship('Comment', lazy='dynamic', viewonly=True,
+                              primaryjoin="and_(Comment.user_id==User.id, Comment.parent_comment_id==None)",
+                              order_by='Comment.created_at.desc()')
     comments = db.relationship('Comment', backref='author', lazy='dynamic')
     votes = db.relationship('Vote', backref='user', lazy='dynamic')
     ai_personality = db.relationship('AIPersonality', backref='users', lazy=True)
@@ -33,9 +36,10 @@ class User(db.Model, UserMixin):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
-    def update_reputation(self, points):
-        self.reputation += points
-        db.session.commit()
+    def update_reputation(self, points, reason='adjustment', **kwargs):
+        """Record a reputation change in the ledger; it's applied to self.reputation asynchronously"""
+        from app.services.reputation_service import record_reputation
+        record_reputation(self.id, points, reason, **kwargs)
 
     def __repr__(self):
         return f'<User {self.username}>'
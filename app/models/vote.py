@@ -1,4 +1,5 @@
 from datetime import datetime
+from sqlalchemy import event
 from app import db
 
 
@@ -29,3 +30,64 @@ class Vote(db.Model):
             return f'<Vote by User {self.user_id} on Question {self.question_id}>'
         else:
             return f'<Vote by User {self.user_id} on Comment {self.comment_id}>'
+
+
+def _apply_score_delta(connection, question_id, comment_id, delta):
+    """Apply a vote change to the denormalized score of the voted content"""
+    if not delta:
+        return
+    from app.models.comment import Comment
+    from app.models.question import Question
+
+    model, content_id = (Comment, comment_id) if comment_id is not None else (Question, question_id)
+    if content_id is None:
+        return
+
+    table = model.__table__
+    # Single atomic UPDATE; keep updated_at so votes don't show up as edits
+    connection.execute(
+        table.update()
+        .where(table.c.id == content_id)
+        .values(score=table.c.score + delta, updated_at=table.c.updated_at)
+    )
+
+
+@event.listens_for(Vote, 'after_insert')
+def _vote_inserted(mapper, connection, vote):
+    _apply_score_delta(connection, vote.question_id, vote.comment_id, vote.vote_type)
+
+
+@event.listens_for(Vote, 'after_update')
+def _vote_updated(mapper, connection, vote):
+    history = db.inspect(vote).attrs.vote_type.history
+    if history.deleted:
+        _apply_score_delta(connection, vote.question_id, vote.comment_id,
+                           vote.vote_type - history.deleted[0])
+
+
+@event.listens_for(Vote, 'after_delete')
+def _vote_deleted(mapper, connection, vote):
+    _apply_score_delta(connection, vote.question_id, vote.comment_id, -vote.vote_type)
+
+
+def recalculate_scores(question_ids=None, comment_ids=None):
+    """
+    Recompute denormalized scores from the votes table
+
+    Needed after bulk changes that bypass the ORM events, e.g. query.delete().
+    Pass None to recompute every row of that type, or an empty list to skip it.
+    """
+    from app.models.comment import Comment
+    from app.models.question import Question
+
+    for model, ids, column in ((Question, question_ids, Vote.question_id),
+                               (Comment, comment_ids, Vote.comment_id)):
+        if ids is not None and not ids:
+            continue
+        total = db.select(db.func.coalesce(db.func.sum(Vote.vote_type), 0)).where(
+            column == model.id).scalar_subquery()
+        query = db.session.query(model)
+        if ids is not None:
+            query = query.filter(model.id.in_(ids))
+        query.update({model.score: total, model.updated_at: model.updated_at},
+                     synchronize_session=False)
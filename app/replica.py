@@ -0,0 +1,100 @@
+"""
+Read replica routing.
+
+Almost every request only reads: the index, search, tag and user lists, the
+question page, its SSE stream and the JSON API. When a replica is configured
+(DATABASE_REPLICA_URL, see app.database), GET and HEAD requests to the
+blueprints in REPLICA_BLUEPRINTS (plus the endpoints in REPLICA_ENDPOINTS)
+read from it, so read traffic scales with the number of replicas instead of
+queueing on the primary.
+
+Writes always go to the primary: flushes, Core INSERT/UPDATE/DELETE
+statements and everything outside a request (LLM workers, background writers,
+CLI commands). Once a request has written, the rest of it reads from the
+primary too, and the user's session cookie pins their requests to the primary
+for REPLICA_STICKY_SECONDS so they see their own vote, comment or edit even
+while the replica is catching up. The delay should exceed the replica's usual
+lag; other users may briefly see slightly older data, which the read-only
+pages tolerate.
+"""
+import os
+import time
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from app.database import REPLICA_BIND
+
+# Blueprints whose GET requests read from the replica
+REPLICA_BLUEPRINTS = frozenset(filter(None, os.environ.get('REPLICA_BLUEPRINTS', 'main,questions,api').split(',')))
+# Extra endpoints (blueprint.view) whose GET requests read from the replica
+REPLICA_ENDPOINTS = frozenset(filter(None, os.environ.get('REPLICA_ENDPOINTS', '').split(',')))
+# Seconds a user's requests read from the primary after they wrote something
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+READ_METHODS = ('GET', 'HEAD')
+# Session cookie key holding the time until which the user reads from the primary
+STICKY_KEY = '_primary_until'
+
+
+def reading_replica():
+    """Whether the current request's reads go to the replica"""
+    return has_request_context() and g.get('db_replica', False)
+
+
+class RoutingSession(Session):
+    """db.session class that sends the reads of replica-routed requests to the replica engine"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not getattr(clause, 'is_dml', False)
+                and reading_replica()):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _pin_to_primary():
+    if has_request_context():
+        # Read what was just written, now and on the user's next requests
+        g.db_replica = False
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    _pin_to_primary()
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _before_execute(orm_execute_state):
+    # Core INSERT/UPDATE/DELETE through the session (vote upserts, bulk updates) skip the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _pin_to_primary()
+
+
+def _route_request():
+    if request.method not in READ_METHODS or not (
+            request.blueprint in REPLICA_BLUEPRINTS or request.endpoint in REPLICA_ENDPOINTS):
+        return
+    pinned_until = session.get(STICKY_KEY)
+    if pinned_until is not None:
+        if pinned_until > time.time():
+            return
+        session.pop(STICKY_KEY)
+    g.db_replica = True
+
+
+def _remember_write(response):
+    if g.get('db_wrote') and REPLICA_STICKY_SECONDS > 0:
+        session[STICKY_KEY] = time.time() + REPLICA_STICKY_SECONDS
+    return response
+
+
+def init_replica(app):
+    """Route read-only requests to the replica bind, if one is configured; call after db.init_app()"""
+    if REPLICA_BIND not in app.config.get('SQLALCHEMY_BINDS', {}):
+        return False
+    # Runs ahead of the hooks that load the current user, so that query is routed too
+    app.before_request_funcs.setdefault(None, []).insert(0, _route_request)
+    app.after_request(_remember_write)
+    app.logger.info(f"Routing reads of {', '.join(sorted(REPLICA_BLUEPRINTS | REPLICA_ENDPOINTS))} "
+                    f"to the read replica ({REPLICA_STICKY_SECONDS:g}s read-your-writes window)")
+    return True
@@ -2,18 +2,24 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from flask_login import login_required, current_user
 from app.models.user import User
 from app.models.question import Question
-from app.models.answer import Answer
 from app.models.tag import Tag, QuestionTag
 from app.models.ai_personality import AIPersonality
 from app.models.comment import Comment
-from app.models.vote import Vote
+from app.services import bulk_ops
 from app import db
 from functools import wraps
-from faker import Faker
+import os
 import random
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
-fake = Faker()
+
+# Rows per page in the admin consoles
+ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', 25))
+
+def _log_progress(step, done, total):
+    """Progress callback for long-running bulk operations"""
+    current_app.logger.info(f"Bulk operation {step}: {done}/{total}")
+
 
 # Admin required decorator
 def admin_required(f):
@@ -39,8 +45,8 @@ def index():
     stats = {
         'question_count': Question.query.count(),
         'question_today_count': Question.query.filter(Question.created_at >= today).count(),
-        'answer_count': Answer.query.count(),
-        'answer_today_count': Answer.query.filter(Answer.created_at >= today).count(),
+        'answer_count': Comment.answers().count(),
+        'answer_today_count': Comment.answers().filter(Comment.created_at >= today).count(),
         'user_count': User.query.count(),
         'user_today_count': User.query.filter(User.created_at >= today).count(),
         'tag_count': Tag.query.count(),
@@ -262,18 +268,9 @@ def delete_ai_personality(personality_id):
     ai_personality = AIPersonality.query.get_or_404(personality_id)
     
     try:
-        # Find AI users associated with this personality
-        ai_users = User.query.filter_by(ai_personality_id=ai_personality.id, is_ai=True).all()
-        
-        # Delete associated AI users
-        for user in ai_users:
-            db.session.delete(user)
-        
-        # Then delete the personality
-        db.session.delete(ai_personality)
-        db.session.commit()
-        
-        flash('AI Personality and associated AI users deleted successfully.', 'success')
+        # Associated AI users are deleted with their content soft deleted, in batches
+        deleted = bulk_ops.delete_ai_personality(ai_personality.id, progress=_log_progress)
+        flash(f'AI Personality and {deleted} associated AI users deleted successfully.', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error deleting AI personality: {str(e)}', 'danger')
@@ -285,8 +282,54 @@ def delete_ai_personality(personality_id):
 @login_required
 @admin_required
 def users():
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    search = request.args.get('search', '')
+    user_type = request.args.get('user_type', '')
+    sort_by = request.args.get('sort', 'username')
+    page = request.args.get('page', 1, type=int)
+    
+    query = User.query
+    if search:
+        query = query.filter(db.or_(
+            User.username.ilike(f'%{search}%'),
+            User.email.ilike(f'%{search}%')
+        ))
+    
+    if user_type == 'human':
+        query = query.filter(User.is_ai == False)
+    elif user_type == 'ai':
+        query = query.filter(User.is_ai == True)
+    elif user_type == 'admin':
+        query = query.filter(User.is_admin == True)
+    
+    # Every sort is on an indexed column, with the id as a stable tie-break
+    if sort_by == 'created_at':
+        query = query.order_by(User.created_at.desc(), User.id.desc())
+    elif sort_by == 'reputation':
+        query = query.order_by(User.reputation.desc(), User.id.desc())
+    elif sort_by == 'activity':
+        query = query.order_by(User.last_seen.desc(), User.id.desc())
+    else:
+        query = query.order_by(User.username.asc())
+    
+    pagination = query.paginate(page=page, per_page=ADMIN_PAGE_SIZE, error_out=False)
+    users = pagination.items
+    
+    # Question and answer counts for the whole page in a single query
+    user_meta = {}
+    if users:
+        question_count = db.select(db.func.count(Question.id)).where(
+            Question.user_id == User.id, Question.is_deleted == False
+        ).scalar_subquery()
+        answer_count = db.select(db.func.count(Comment.id)).where(
+            Comment.user_id == User.id, Comment.parent_comment_id.is_(None), Comment.is_deleted == False
+        ).scalar_subquery()
+        rows = db.session.query(User.id, question_count, answer_count).filter(
+            User.id.in_([user.id for user in users])
+        ).all()
+        user_meta = {user_id: {'question_count': questions, 'answer_count': answers}
+                     for user_id, questions, answers in rows}
+    
+    return render_template('admin/users.html', users=users, pagination=pagination, user_meta=user_meta)
 
 
 @admin_bp.route('/users/<int:user_id>/delete', methods=['POST'])
@@ -305,24 +348,16 @@ def delete_user(user_id):
         flash('Cannot delete admin users', 'danger')
         return redirect(url_for('admin.users'))
     
+    # The placeholder account owns the content of every deleted user
+    if user.username == bulk_ops.DELETED_USERNAME:
+        flash('Cannot delete the placeholder account for deleted users', 'danger')
+        return redirect(url_for('admin.users'))
+    
     try:
-        # Soft delete user's content instead of hard deleting it
-        for comment in user.comments:
-            comment.soft_delete()
-            
-        for answer in user.answers:
-            answer.soft_delete()
-            
-        for question in user.questions:
-            question.soft_delete()
-            
-        # Still delete votes as they don't need to maintain the structure
-        db.session.query(Vote).filter_by(user_id=user_id).delete()
-        
-        # Delete the user
-        db.session.delete(user)
-        db.session.commit()
-        flash('User deleted successfully', 'success')
+        # Content is soft deleted in batches, votes are removed and their reputation reversed
+        counts = bulk_ops.delete_user(user.id, progress=_log_progress)
+        flash(f"User deleted successfully ({counts['questions']} questions, {counts['comments']} comments "
+              f"and {counts['votes']} votes affected)", 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Error deleting user: {str(e)}', 'danger')
@@ -338,48 +373,63 @@ def questions():
     search = request.args.get('search', '')
     status = request.args.get('status', '')
     sort_by = request.args.get('sort', 'newest')
+    page = request.args.get('page', 1, type=int)
     
-    # Build query
-    query = Question.query
+    # Build query; authors are loaded with the page instead of one query per row
+    query = Question.query.options(db.joinedload(Question.author))
     
     # Apply search filter
     if search:
         query = query.filter(db.or_(
             Question.title.ilike(f'%{search}%'),
-            Question.content.ilike(f'%{search}%')
+            Question.body.ilike(f'%{search}%')
         ))
     
-    # Apply status filter
-    if status == 'answered':
-        query = query.filter(Question.answers.any())
+    # Apply status filter using the denormalized thread statistics
+    if status == 'open':
+        query = query.filter(Question.is_closed == False)
+    elif status == 'closed':
+        query = query.filter(Question.is_closed == True)
+    elif status == 'answered':
+        query = query.filter(Question.answer_count > 0)
     elif status == 'unanswered':
-        query = query.filter(~Question.answers.any())
+        query = query.filter(Question.answer_count == 0)
     
-    # Apply sorting
-    if sort_by == 'newest':
-        query = query.order_by(Question.created_at.desc())
-    elif sort_by == 'oldest':
-        query = query.order_by(Question.created_at.asc())
+    # Every sort is on an indexed column, with the id as a stable tie-break
+    if sort_by == 'oldest':
+        query = query.order_by(Question.created_at.asc(), Question.id.asc())
     elif sort_by == 'votes':
-        query = query.order_by(Question.upvotes.desc())
+        query = query.order_by(Question.score.desc(), Question.id.desc())
+    elif sort_by == 'activity':
+        query = query.order_by(Question.last_activity_at.desc(), Question.id.desc())
+    elif sort_by == 'answers':
+        query = query.order_by(Question.answer_count.desc(), Question.id.desc())
     elif sort_by == 'views':
-        query = query.order_by(Question.view_count.desc())
+        query = query.order_by(Question.views.desc(), Question.id.desc())
+    else:
+        query = query.order_by(Question.created_at.desc(), Question.id.desc())
     
-    # Get questions and pagination
-    questions = query.all()
+    pagination = query.paginate(page=page, per_page=ADMIN_PAGE_SIZE, error_out=False)
+    questions = pagination.items
     
-    # Create a dictionary to store metadata for each question
-    question_meta = {}
-    
-    # Process each question to convert lazy-loaded relationships to actual counts
-    for question in questions:
-        # Store answer count and has_accepted_answer in the metadata dictionary
-        question_meta[question.id] = {
-            'answer_count': question.answers.count(),
-            'has_accepted_answer': any(answer.is_accepted for answer in question.answers)
+    # Answer statistics are denormalized on the question; tags for the page come from one query
+    question_meta = {
+        question.id: {
+            'answer_count': question.answer_count,
+            'has_accepted_answer': question.has_accepted,
+            'tags': []
         }
+        for question in questions
+    }
+    if questions:
+        rows = db.session.query(QuestionTag.question_id, Tag.name).join(
+            Tag, Tag.id == QuestionTag.tag_id
+        ).filter(QuestionTag.question_id.in_(question_meta.keys())).order_by(Tag.name).all()
+        for question_id, tag_name in rows:
+            question_meta[question_id]['tags'].append(tag_name)
     
-    return render_template('admin/questions.html', questions=questions, question_meta=question_meta)
+    return render_template('admin/questions.html', questions=questions, pagination=pagination,
+                           question_meta=question_meta)
 
 
 @admin_bp.route('/questions/<int:question_id>/delete', methods=['POST'])
@@ -828,29 +878,9 @@ def merge_tags():
             flash('Cannot merge a tag with itself.', 'danger')
             return redirect(url_for('admin.tags'))
         
-        # Get all question_tags for the source tag
-        question_tags = QuestionTag.query.filter_by(tag_id=source_tag.id).all()
-        
-        for qt in question_tags:
-            # Check if the question already has the target tag
-            existing = QuestionTag.query.filter_by(
-                question_id=qt.question_id, 
-                tag_id=target_tag.id
-            ).first()
-            
-            if not existing:
-                # Update this question_tag to point to target tag
-                qt.tag_id = target_tag.id
-            else:
-                # Remove duplicate
-                db.session.delete(qt)
-        
-        # Delete the source tag
-        db.session.delete(source_tag)
-        
         try:
-            db.session.commit()
-            flash(f'Successfully merged "{source_tag_name}" into "{target_tag_name}".', 'success')
+            moved = bulk_ops.merge_tags(source_tag.id, target_tag.id, progress=_log_progress)
+            flash(f'Successfully merged "{source_tag_name}" into "{target_tag_name}" ({moved} questions).', 'success')
         except Exception as e:
             db.session.rollback()
             flash(f'Error merging tags: {str(e)}', 'danger')
@@ -882,18 +912,107 @@ def toggle_question_closed(question_id):
 def populate_thread(question_id):
     """Manually trigger auto-population of a thread"""
     from app.routes.questions import auto_populate_thread
-    from app.services.llm_service import queue_task
+    from app.services.llm_service import queue_task, PRIORITY_BULK
     
     # Get the question
     question = Question.query.get_or_404(question_id)
     
     # Run the auto-population
-    queue_task(auto_populate_thread, question_id, parallel=True)
+    queue_task(auto_populate_thread, question_id, priority=PRIORITY_BULK, key=question_id)
     
     flash(f'Auto-population started for question: {question.title}', 'success')
     return redirect(url_for('admin.questions'))
 
 
+@admin_bp.route('/population_jobs')
+@login_required
+@admin_required
+def population_jobs():
+    """List recent thread population jobs with their progress"""
+    from app.models.population_job import PopulationJob, PopulationUnit
+    
+    status = request.args.get('status')
+    query = PopulationJob.query
+    if status:
+        query = query.filter_by(status=status)
+    jobs = query.order_by(PopulationJob.created_at.desc()).limit(100).all()
+    
+    # Unit counts for all listed jobs in a single grouped query
+    progress = {job.id: {'total': 0, 'pending': 0, 'done': 0, 'skipped': 0, 'failed': 0} for job in jobs}
+    if jobs:
+        rows = db.session.query(
+            PopulationUnit.job_id, PopulationUnit.status, db.func.count(PopulationUnit.id)
+        ).filter(
+            PopulationUnit.job_id.in_(progress.keys())
+        ).group_by(PopulationUnit.job_id, PopulationUnit.status).all()
+        for job_id, unit_status, count in rows:
+            progress[job_id][unit_status] = count
+            progress[job_id]['total'] += count
+    for counts in progress.values():
+        finished = counts['total'] - counts['pending']
+        counts['percent'] = int(finished * 100 / counts['total']) if counts['total'] else 0
+    
+    return render_template('admin/population_jobs.html', jobs=jobs, progress=progress, status=status)
+
+
+@admin_bp.route('/population_jobs/<int:job_id>')
+@login_required
+@admin_required
+def population_job(job_id):
+    """Get the state of a population job as JSON"""
+    from flask import jsonify
+    from app.models.population_job import PopulationJob
+    
+    job = PopulationJob.query.get_or_404(job_id)
+    units = job.units.all()
+    
+    return jsonify({
+        'id': job.id,
+        'question_id': job.question_id,
+        'status': job.status,
+        'max_comments': job.max_comments,
+        'existing_ai_comments': job.existing_ai_comments,
+        'comments_created': job.comments_created,
+        'votes_created': job.votes_created,
+        'round': job.round,
+        'max_rounds': job.max_rounds,
+        'tokens_used': job.tokens_used,
+        'token_budget': job.token_budget,
+        'stop_reason': job.stop_reason,
+        'last_error': job.last_error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'heartbeat_at': job.heartbeat_at.isoformat() if job.heartbeat_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'progress': job.progress(),
+        'units': [{
+            'id': unit.id,
+            'position': unit.position,
+            'kind': unit.kind,
+            'personality_id': unit.personality_id,
+            'item_id': unit.item_id,
+            'status': unit.status,
+            'attempts': unit.attempts,
+            'vote_id': unit.vote_id,
+            'comment_id': unit.comment_id,
+            'last_error': unit.last_error
+        } for unit in units]
+    })
+
+
+@admin_bp.route('/population_jobs/<int:job_id>/resume', methods=['POST'])
+@login_required
+@admin_required
+def resume_population_job(job_id):
+    """Resume a failed or stalled population job"""
+    from app.services.population_service import resume_population_job as resume_job
+    
+    if resume_job(job_id):
+        flash(f'Population job {job_id} resumed', 'success')
+    else:
+        flash(f'Population job {job_id} cannot be resumed', 'warning')
+    return redirect(url_for('admin.population_jobs'))
+
+
 @admin_bp.route('/settings', methods=['GET', 'POST'])
 @login_required
 @admin_required
@@ -3,10 +3,10 @@ from flask_login import login_required, current_user
 from app import db
 from app.models.question import Question
 from app.models.comment import Comment
-from app.models.vote import Vote
-from app.models.user import User
 from app.models.ai_personality import AIPersonality
 from app.services.llm_service import get_completion, queue_task
+from app.services.vote_service import apply_votes
+from app.services.vote_events import emit_vote_events
 import os
 import random
 from datetime import datetime
@@ -100,25 +100,10 @@ def accept(answer_id):
     if question.user_id != current_user.id and not current_user.is_admin:
         abort(403)
     
-    # Clear any previously accepted answers
-    previously_accepted = Comment.query.filter_by(
-        question_id=question.id,
-        is_accepted=True
-    ).all()
-    
-    for prev in previously_accepted:
-        prev.is_accepted = False
-    
-    # Accept this answer
-    comment.is_accepted = True
+    # Moving the acceptance takes its reputation away from the previous answer's author
+    comment.accept(actor_id=current_user.id)
     db.session.commit()
     
-    # Award reputation points to the answer author
-    answerer = User.query.get(comment.user_id)
-    if answerer:
-        answerer.reputation += 15
-        db.session.commit()
-    
     flash('Answer accepted', 'success')
     return redirect(url_for('questions.view', question_id=question.id))
 
@@ -133,27 +118,13 @@ def vote(answer_id):
     if vote_type not in [-1, 0, 1]:
         abort(400)
     
-    # Look for an existing vote
-    existing_vote = Vote.query.filter_by(
-        user_id=current_user.id, comment_id=answer_id
-    ).first()
-    
-    if vote_type == 0 and existing_vote:
-        # Remove vote
-        db.session.delete(existing_vote)
-    elif existing_vote:
-        # Update vote
-        existing_vote.vote_type = vote_type
-    else:
-        # Create new vote
-        new_vote = Vote(
-            user_id=current_user.id,
-            comment_id=answer_id,
-            vote_type=vote_type
-        )
-        db.session.add(new_vote)
+    # Vote, score and reputation ledger entry are written in one transaction
+    outcome = apply_votes(current_user.id, [{'comment_id': answer_id, 'vote_type': vote_type}])
+    if outcome['errors']:
+        flash(outcome['errors'][0]['error'], 'danger')
     
-    db.session.commit()
+    # AI reactions are decided later, once votes on the answer have been coalesced
+    emit_vote_events(current_user, outcome['results'])
     
     # Redirect to the question page
     return redirect(url_for('questions.view', question_id=comment.question_id))
@@ -1,13 +1,19 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, url_for
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
 from app import db
 from app.models.question import Question
-from app.models.answer import Answer
 from app.models.comment import Comment
 from app.models.user import User
 from app.models.vote import Vote
 from app.models.ai_personality import AIPersonality
-from app.services.llm_service import get_completion, queue_task
+from app.services.llm_service import get_completion, queue_task, PRIORITY_INTERACTIVE
+from app.services.vote_service import apply_votes, MAX_BATCH_SIZE
+from app.services.vote_events import emit_vote_events
+from app.services.thread_sync import build_thread_payload, parse_cursor
+from app.services.thread_loader import link_thread, load_replies, walk_thread, MAX_REPLY_DEPTH
+from app.services.compression import compress
+from app.services.population_service import get_ai_user
 import os
 import random
 from datetime import datetime
@@ -39,7 +45,7 @@ def latest_questions():
                 'author': q.author.username,
                 'created_at': q.created_at.isoformat(),
                 'score': q.score,
-                'answers_count': q.answers.count(),
+                'answers_count': q.answer_count,
                 'views': q.views,
                 'tags': [tag.tag.name for tag in q.tags]
             } for q in questions.items
@@ -52,6 +58,47 @@ def latest_questions():
     return jsonify(result)
 
 
+@api_bp.route('/questions/similar')
+def similar_questions():
+    """API endpoint to suggest existing questions similar to one being typed"""
+    from app.services.duplicate_index import duplicate_index
+    
+    title = request.args.get('title', '').strip()
+    body = request.args.get('body', '').strip()
+    limit = min(request.args.get('limit', 5, type=int), 10)
+    
+    if len(title) < 10:
+        return jsonify({'questions': []})
+    
+    # Title matches drive suggestions; a close full-text match ranks first
+    matches = dict(duplicate_index.suggest(title, limit=limit))
+    if body:
+        for question_id, similarity in duplicate_index.find_duplicates(title, body, limit=limit):
+            matches[question_id] = max(similarity, matches.get(question_id, 0))
+    if not matches:
+        return jsonify({'questions': []})
+    
+    questions = Question.query.filter(
+        Question.id.in_(matches.keys()),
+        Question.is_deleted == False
+    ).all()
+    questions.sort(key=lambda q: matches[q.id], reverse=True)
+    
+    return jsonify({
+        'questions': [
+            {
+                'id': q.id,
+                'title': q.title,
+                'url': url_for('questions.view', question_id=q.id),
+                'score': q.score,
+                'answers_count': q.answer_count,
+                'is_answered': q.is_answered,
+                'similarity': round(matches[q.id], 2)
+            } for q in questions[:limit]
+        ]
+    })
+
+
 @api_bp.route('/questions/<int:question_id>')
 def get_question(question_id):
     """API endpoint to get a specific question with its answers"""
@@ -60,19 +107,34 @@ def get_question(question_id):
     # Increment the view count
     question.increment_view()
     
-    # Get the answers sorted by score
-    answers = question.answers.order_by(Comment.score.desc(), Comment.created_at.asc()).all()
+    # The whole thread, with authors, in one query; answers sorted by score
+    thread = Comment.query.options(joinedload(Comment.author)).filter(
+        Comment.question_id == question.id).order_by(Comment.id).all()
+    answers = link_thread(thread)
+    answers.sort(key=lambda answer: (-(answer.score or 0), answer.created_at or datetime.min))
+    
+    def author_data(user):
+        return {
+            'id': user.id,
+            'username': user.username,
+            'is_ai': user.is_ai,
+            'profile_image': user.profile_image
+        }
+    
+    def reply_data(comment):
+        return {
+            'id': comment.id,
+            'body': comment.body,
+            'author': author_data(comment.author),
+            'created_at': comment.created_at.isoformat(),
+            'score': comment.score
+        }
     
     result = {
         'id': question.id,
         'title': question.title,
         'body': question.body,
-        'author': {
-            'id': question.author.id,
-            'username': question.author.username,
-            'is_ai': question.author.is_ai,
-            'profile_image': question.author.profile_image
-        },
+        'author': author_data(question.author),
         'created_at': question.created_at.isoformat(),
         'updated_at': question.updated_at.isoformat(),
         'score': question.score,
@@ -80,48 +142,17 @@ def get_question(question_id):
         'is_closed': question.is_closed,
         'close_reason': question.close_reason,
         'tags': [{'id': tag.tag.id, 'name': tag.tag.name} for tag in question.tags],
-        'comments': [
-            {
-                'id': comment.id,
-                'body': comment.body,
-                'author': {
-                    'id': comment.author.id,
-                    'username': comment.author.username,
-                    'is_ai': comment.author.is_ai,
-                    'profile_image': comment.author.profile_image
-                },
-                'created_at': comment.created_at.isoformat(),
-                'score': comment.score
-            } for comment in question.comments
-        ],
+        'comments': [reply_data(comment) for comment in thread],
         'answers': [
             {
                 'id': answer.id,
                 'body': answer.body,
-                'author': {
-                    'id': answer.author.id,
-                    'username': answer.author.username,
-                    'is_ai': answer.author.is_ai,
-                    'profile_image': answer.author.profile_image
-                },
+                'author': author_data(answer.author),
                 'created_at': answer.created_at.isoformat(),
                 'updated_at': answer.updated_at.isoformat(),
                 'is_accepted': answer.is_accepted,
                 'score': answer.score,
-                'comments': [
-                    {
-                        'id': comment.id,
-                        'body': comment.body,
-                        'author': {
-                            'id': comment.author.id,
-                            'username': comment.author.username,
-                            'is_ai': comment.author.is_ai,
-                            'profile_image': comment.author.profile_image
-                        },
-                        'created_at': comment.created_at.isoformat(),
-                        'score': comment.score
-                    } for comment in answer.comments
-                ]
+                'comments': [reply_data(comment) for comment in answer.thread_replies]
             } for answer in answers
         ]
     }
@@ -132,15 +163,38 @@ def get_question(question_id):
             user_id=current_user.id, question_id=question.id).first()
         result['user_vote'] = user_question_vote.vote_type if user_question_vote else 0
         
-        # Add user votes on answers
-        for answer_data, answer in zip(result['answers'], answers):
-            user_answer_vote = Vote.query.filter_by(
-                user_id=current_user.id, comment_id=answer.id).first()
-            answer_data['user_vote'] = user_answer_vote.vote_type if user_answer_vote else 0
+        # Add user votes on answers, in one query
+        answer_votes = dict(db.session.query(Vote.comment_id, Vote.vote_type).filter(
+            Vote.user_id == current_user.id, Vote.comment_id.in_([answer.id for answer in answers])))
+        for answer_data in result['answers']:
+            answer_data['user_vote'] = answer_votes.get(answer_data['id'], 0)
     
     return jsonify(result)
 
 
+@api_bp.route('/questions/<int:question_id>/thread')
+def sync_thread(question_id):
+    """
+    API endpoint to get a question's thread as flat, normalized JSON
+
+    Query parameters: since (the cursor of a previous response, or a comment
+    id) to get only what changed, and html=1 to include rendered HTML.
+    """
+    question = Question.query.get_or_404(question_id)
+    try:
+        since = parse_cursor(request.args.get('since', ''))
+    except ValueError:
+        return jsonify({'error': 'Invalid since cursor'}), 400
+    
+    payload = build_thread_payload(
+        question,
+        since=since,
+        include_html=request.args.get('html', type=int) == 1,
+        user_id=current_user.id if current_user.is_authenticated else None
+    )
+    return compress(jsonify(payload))
+
+
 @api_bp.route('/vote', methods=['POST'])
 @login_required
 def vote():
@@ -150,91 +204,51 @@ def vote():
     if not data or 'vote_type' not in data or data['vote_type'] not in [1, -1, 0]:
         return jsonify({'error': 'Invalid vote data'}), 400
     
-    # Determine what is being voted on
-    question_id = data.get('question_id')
-    comment_id = data.get('comment_id')
-    
-    if not any([question_id, comment_id]):
+    if not any([data.get('question_id'), data.get('comment_id')]):
         return jsonify({'error': 'Must specify question_id or comment_id'}), 400
     
-    vote_type = data['vote_type']
+    try:
+        outcome = apply_votes(current_user.id, [data])
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error applying vote: {str(e)}")
+        return jsonify({'error': 'Failed to update vote'}), 500
     
-    # Handle removing vote if vote_type is 0
-    if vote_type == 0:
-        if question_id:
-            Vote.query.filter_by(
-                user_id=current_user.id, question_id=question_id).delete()
-        elif comment_id:
-            Vote.query.filter_by(
-                user_id=current_user.id, comment_id=comment_id).delete()
-        db.session.commit()
-        return jsonify({'success': True, 'message': 'Vote removed'})
-    
-    # Find existing vote
-    existing_vote = None
-    if question_id:
-        existing_vote = Vote.query.filter_by(
-            user_id=current_user.id, question_id=question_id).first()
-    elif comment_id:
-        existing_vote = Vote.query.filter_by(
-            user_id=current_user.id, comment_id=comment_id).first()
-    
-    # Update existing vote or create new one
-    if existing_vote:
-        # Don't update if vote is the same
-        if existing_vote.vote_type == vote_type:
-            return jsonify({'success': True, 'message': 'Vote already exists'})
-        
-        # Update the vote
-        existing_vote.vote_type = vote_type
-    else:
-        # Create new vote
-        new_vote = Vote(
-            user_id=current_user.id,
-            vote_type=vote_type
-        )
-        
-        if question_id:
-            new_vote.question_id = question_id
-        elif comment_id:
-            new_vote.comment_id = comment_id
-            
-        db.session.add(new_vote)
+    if outcome['errors']:
+        return jsonify({'error': outcome['errors'][0]['error']}), 404
+    
+    result = outcome['results'][0]
+    if not result['changed']:
+        return jsonify({'success': True, 'message': 'Vote already exists', 'score': result['score']})
+    if data['vote_type'] == 0:
+        return jsonify({'success': True, 'message': 'Vote removed', 'score': result['score']})
+    
+    emit_vote_events(current_user, [result])
+    
+    return jsonify({'success': True, 'score': result['score']})
+
+
+@api_bp.route('/votes/batch', methods=['POST'])
+@login_required
+def vote_batch():
+    """API endpoint to apply many votes by the current user in one transaction"""
+    data = request.json
+    
+    if not data or not isinstance(data.get('votes'), list):
+        return jsonify({'error': 'Expected a list of votes'}), 400
+    if len(data['votes']) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Batches are limited to {MAX_BATCH_SIZE} votes'}), 400
     
     try:
-        # Update reputation for voted content
-        if question_id:
-            question = Question.query.get_or_404(question_id)
-            owner = question.author
-            rep_change = 5 if vote_type == 1 else -2
-            owner.reputation += rep_change
-        elif comment_id:
-            comment = Comment.query.get_or_404(comment_id)
-            owner = comment.author
-            # Top-level comments (answers) get more reputation
-            if comment.parent_comment_id is None:
-                rep_change = 10 if vote_type == 1 else -2
-            else:
-                rep_change = 2 if vote_type == 1 else -1
-            owner.reputation += rep_change
-        
-        db.session.commit()
+        outcome = apply_votes(current_user.id, data['votes'])
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': 'Failed to update vote'}), 500
+        current_app.logger.error(f"Error applying vote batch: {str(e)}")
+        return jsonify({'error': 'Failed to update votes'}), 500
     
-    # Trigger AI response if this is a real user (not an AI)
-    if not current_user.is_ai:
-        # Queue AI response to the vote in the background
-        from app.routes.questions import ai_respond_to_vote
-        
-        # Instead of creating a new vote, use the existing one if it's an update
-        # or the new one if it's a new vote
-        vote_to_process = existing_vote if existing_vote else new_vote
-            
-        ai_respond_to_vote(vote_to_process)
+    emit_vote_events(current_user, outcome['results'])
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'results': outcome['results'], 'errors': outcome['errors']})
 
 
 @api_bp.route('/comments', methods=['POST'])
@@ -271,7 +285,8 @@ def add_comment():
     
     # Trigger AI responses to the comment
     from app.routes.comments import ai_respond_to_comment
-    queue_task(ai_respond_to_comment, comment.id, parallel=True)
+    queue_task(ai_respond_to_comment, comment.id, question_id=question_id, parallel=True,
+               priority=PRIORITY_INTERACTIVE, key=question_id)
     
     result = {
         'id': comment.id,
@@ -304,14 +319,10 @@ def accept_comment(comment_id):
     if comment.parent_comment_id is not None:
         return jsonify({'error': 'Only top-level comments can be accepted as answers'}), 400
     
-    # Accept the comment as an answer
-    comment.is_accepted = True
+    # Accept the comment as an answer, awarding reputation to its author in the same transaction
+    comment.accept(actor_id=current_user.id)
     db.session.commit()
     
-    # Award reputation points to comment author
-    comment_author = User.query.get(comment.user_id)
-    comment_author.update_reputation(15)  # Reputation for accepted answer
-    
     return jsonify({'success': True})
 
 
@@ -361,19 +372,7 @@ def ai_respond():
         return jsonify({'error': 'AI Personality not found'}), 404
     
     # Get or create the AI user for this personality
-    ai_user = User.query.filter_by(username=personality.name).first()
-    if not ai_user:
-        print(f"Creating AI user for {personality.name}")
-        from werkzeug.security import generate_password_hash
-        ai_user = User(
-            username=personality.name,
-            email=f"{personality.name.lower().replace(' ', '.')}@overflew.ai",
-            password_hash=generate_password_hash("AI_USER_PASSWORD"),
-            is_ai=True,
-            ai_personality_id=personality.id
-        )
-        db.session.add(ai_user)
-        db.session.commit()
+    ai_user = get_ai_user(personality)
     
     # Generate the AI response
     if content_type == 'question':
@@ -416,8 +415,10 @@ def get_comment_children(parent_id):
     # Get the parent comment
     parent_comment = Comment.query.get_or_404(parent_id)
     
+    depth = min(request.args.get('depth', 2, type=int), MAX_REPLY_DEPTH)
+    
     # Get child comments with pagination
-    child_comments = Comment.query.filter_by(
+    child_comments = Comment.query.options(joinedload(Comment.author)).filter_by(
         parent_comment_id=parent_id
     ).order_by(Comment.score.desc(), Comment.created_at.asc()).offset(skip).limit(limit).all()
     
@@ -425,12 +426,11 @@ def get_comment_children(parent_id):
     total_children = Comment.query.filter_by(parent_comment_id=parent_id).count()
     remaining = total_children - (skip + len(child_comments))
     
-    # Format the comments
-    comments_data = []
-    for comment in child_comments:
-        # Format each comment including replies
-        comment_data = format_comment_data(comment)
-        comments_data.append(comment_data)
+    # Their replies, one query per level, and the user's votes on all of them
+    replies = load_replies(child_comments, depth)
+    user_votes = get_user_comment_votes(child_comments + replies)
+    comments_data = [format_comment_data(comment, max_depth=depth, user_votes=user_votes)
+                     for comment in child_comments]
     
     return jsonify({
         'success': True,
@@ -448,17 +448,18 @@ def get_comment_thread(parent_id):
     # Get the parent comment
     parent_comment = Comment.query.get_or_404(parent_id)
     
+    depth = min(request.args.get('depth', 2, type=int), MAX_REPLY_DEPTH)
+    
     # Get all child comments (up to a reasonable limit)
-    child_comments = Comment.query.filter_by(
+    child_comments = Comment.query.options(joinedload(Comment.author)).filter_by(
         parent_comment_id=parent_id
     ).order_by(Comment.score.desc(), Comment.created_at.asc()).limit(50).all()
     
-    # Format the comments
-    comments_data = []
-    for comment in child_comments:
-        # Format each comment including replies
-        comment_data = format_comment_data(comment)
-        comments_data.append(comment_data)
+    # Their replies, one query per level, and the user's votes on all of them
+    replies = load_replies(child_comments, depth)
+    user_votes = get_user_comment_votes(child_comments + replies)
+    comments_data = [format_comment_data(comment, max_depth=depth, user_votes=user_votes)
+                     for comment in child_comments]
     
     return jsonify({
         'success': True,
@@ -466,41 +467,53 @@ def get_comment_thread(parent_id):
     })
 
 
-def format_comment_data(comment, include_replies=True, max_depth=2, current_depth=0):
+def get_user_comment_votes(comments):
+    """The current user's votes on some comments, as a {comment_id: vote_type} dict"""
+    if not current_user.is_authenticated or not comments:
+        return {}
+    return dict(db.session.query(Vote.comment_id, Vote.vote_type).filter(
+        Vote.user_id == current_user.id,
+        Vote.comment_id.in_([comment.id for comment in comments])
+    ).all())
+
+
+def format_comment_data(comment, include_replies=True, max_depth=2, current_depth=0, user_votes=None):
     """
     Helper function to format a comment and its replies into a JSON-serializable format
+
+    Replies come from the thread_replies set by load_replies(); comments
+    without them are expanded here, still with one query per level. Pass the
+    user's votes from get_user_comment_votes() to avoid looking them up again.
     """
-    # Get the user vote if authenticated
-    user_vote = 0
-    if current_user.is_authenticated:
-        vote = Vote.query.filter_by(user_id=current_user.id, comment_id=comment.id).first()
-        if vote:
-            user_vote = vote.vote_type
+    if include_replies and current_depth < max_depth and not hasattr(comment, 'thread_replies'):
+        load_replies([comment], max_depth - current_depth)
+    if user_votes is None:
+        user_votes = get_user_comment_votes(list(walk_thread([comment])))
     
     # Format the base comment data
     comment_data = {
         'id': comment.id,
         'body': comment.body,
         'html_content': comment.html_content,
-        'author_id': comment.author_id,
+        'author_id': comment.user_id,
         'author_username': comment.author.username if comment.author else '[deleted]',
         'author_is_ai': comment.author.is_ai if comment.author else False,
         'score': comment.score,
         'created_at': comment.created_at.isoformat(),
         'is_deleted': comment.is_deleted,
-        'user_vote': user_vote,
+        'user_vote': user_votes.get(comment.id, 0),
         'replies': []
     }
     
     # Include replies recursively, but limit depth to avoid too much data
     if include_replies and current_depth < max_depth:
-        replies = Comment.query.filter_by(parent_comment_id=comment.id).all()
-        for reply in replies:
+        for reply in comment.thread_replies:
             reply_data = format_comment_data(
                 reply, 
                 include_replies=True,
                 max_depth=max_depth,
-                current_depth=current_depth + 1
+                current_depth=current_depth + 1,
+                user_votes=user_votes
             )
             comment_data['replies'].append(reply_data)
     
@@ -574,7 +587,9 @@ def stream_question_updates(question_id):
     
     def generate():
         # Keep track of the last comment ID we've seen
-        last_comment_id = request.args.get('last_comment_id', 0, type=int)
+        # A reconnecting EventSource resumes after the last event it received
+        last_comment_id = max(request.args.get('last_comment_id', 0, type=int),
+                              request.headers.get('Last-Event-ID', 0, type=int))
         print(f"SSE: Starting stream for question {question_id}, last_comment_id={last_comment_id}")
         
         # Keep the connection alive for a reasonable amount of time (5 minutes)
@@ -618,7 +633,7 @@ def stream_question_updates(question_id):
                     # Send the data as an SSE event
                     data_json = json.dumps({'comments': comment_data})
                     print(f"SSE: Sending data: {data_json[:100]}...")  # Print first 100 chars for debugging
-                    yield f"data: {data_json}\n\n"
+                    yield f"id: {last_comment_id}\ndata: {data_json}\n\n"
                 
                 # Send a heartbeat periodically to keep the connection alive
                 if time.time() > heartbeat_time:
@@ -704,10 +719,7 @@ def generate_ai_response(content_type, content_id, ai_personality_id):
             return
             
         # Get the AI user associated with this personality
-        ai_user = User.query.filter_by(ai_personality_id=ai_personality.id, is_ai=True).first()
-        if not ai_user:
-            current_app.logger.warning(f"AI user for personality {ai_personality_id} not found")
-            return
+        ai_user = get_ai_user(ai_personality)
         
         # Check if the AI should respond based on its activity frequency
         if not ai_personality.should_respond():
@@ -731,11 +743,12 @@ def generate_ai_response(content_type, content_id, ai_personality_id):
                     
                 # Add existing answers if any (for more coherent thread)
                 existing_answers = []
-                for answer in question.answers:
-                    author = User.query.get(answer.user_id)
-                    author_name = author.username if author else "Unknown User"
-                    is_ai = " (AI)" if author and author.is_ai else ""
-                    existing_answers.append(f"ANSWER by {author_name}{is_ai}: {answer.body}")
+                for body, author_name, author_is_ai in db.session.query(
+                        Comment.body, User.username, User.is_ai).join(User, User.id == Comment.user_id).filter(
+                        Comment.question_id == question.id, Comment.is_answer, Comment.is_deleted == False
+                ).order_by(Comment.created_at):
+                    is_ai = " (AI)" if author_is_ai else ""
+                    existing_answers.append(f"ANSWER by {author_name}{is_ai}: {body}")
                 
                 if existing_answers:
                     context += "EXISTING ANSWERS:\n" + "\n\n".join(existing_answers)
@@ -786,6 +799,9 @@ def generate_ai_response(content_type, content_id, ai_personality_id):
         
         # Generate AI response
         response = get_completion(prompt, max_tokens=4096)
+        if not response:
+            current_app.logger.warning(f"No AI response generated for {content_type}:{content_id}")
+            return
         
         # Create the appropriate response based on content type
         result = None
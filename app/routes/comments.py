@@ -3,9 +3,11 @@ from flask_login import login_required, current_user
 from app import db
 from app.models.question import Question
 from app.models.comment import Comment
-from app.models.vote import Vote
-from app.models.user import User
-from app.services.llm_service import queue_task
+from app.services.llm_service import queue_task, PRIORITY_INTERACTIVE
+from app.services.persona_router import select_persona
+from app.services.population_service import get_ai_user
+from app.services.vote_service import apply_votes
+from app.services.vote_events import emit_vote_events
 
 comments_bp = Blueprint('comments', __name__, url_prefix='/comments')
 
@@ -48,9 +50,11 @@ def add():
     # Trigger appropriate AI response
     if not parent_comment_id:
         # This is a top-level comment (an answer)
-        queue_task(ai_respond_to_answer, comment.id, parallel=True)
+        queue_task(ai_respond_to_answer, comment.id, parallel=True,
+                   priority=PRIORITY_INTERACTIVE, key=question_id)
     else:
-        queue_task(ai_respond_to_comment, comment.id, question_id=question_id, parallel=True)
+        queue_task(ai_respond_to_comment, comment.id, question_id=question_id, parallel=True,
+                   priority=PRIORITY_INTERACTIVE, key=question_id)
     
     flash('Your content has been added', 'success')
     return redirect(url_for('questions.view', question_id=question_id))
@@ -115,17 +119,8 @@ def accept(comment_id):
         flash('Only answers can be accepted', 'danger')
         return redirect(url_for('questions.view', question_id=comment.question_id))
     
-    # Clear any previously accepted answers for this question
-    previously_accepted = Comment.query.filter_by(
-        question_id=comment.question_id,
-        is_accepted=True
-    ).all()
-    
-    for prev in previously_accepted:
-        prev.is_accepted = False
-    
-    # Mark this answer as accepted
-    comment.is_accepted = True
+    # Accept this answer instead of any previous one, moving the reputation with it
+    comment.accept(actor_id=current_user.id)
     db.session.commit()
     
     flash('Answer accepted', 'success')
@@ -142,35 +137,14 @@ def vote(comment_id):
     if vote_type not in [-1, 0, 1]:
         abort(400)  # Bad request
     
-    # Check if the user has already voted
-    existing_vote = Vote.query.filter_by(
-        user_id=current_user.id,
-        comment_id=comment_id
-    ).first()
+    # Vote, score and author reputation are updated in one transaction
+    outcome = apply_votes(current_user.id, [{'comment_id': comment_id, 'vote_type': vote_type}])
+    result = outcome['results'][0] if outcome['results'] else None
     
-    if existing_vote:
-        if vote_type == 0:
-            # Remove the vote
-            db.session.delete(existing_vote)
-        else:
-            # Update the vote
-            existing_vote.vote_type = vote_type
-    elif vote_type != 0:
-        # Create a new vote
-        vote = Vote(
-            user_id=current_user.id,
-            comment_id=comment_id,
-            vote_type=vote_type
-        )
-        db.session.add(vote)
-        
-        # Trigger AI response to vote if it's a vote on an answer (top-level comment)
-        if comment.parent_comment_id is None:
-            queue_task(ai_respond_to_vote, vote.id, parallel=True)
+    # AI reactions are decided later, once votes on the comment have been coalesced
+    emit_vote_events(current_user, outcome['results'])
     
-    db.session.commit()
-    
-    return jsonify({'success': True, 'score': comment.score})
+    return jsonify({'success': True, 'score': result['score'] if result else comment.score})
 
 
 # AI response functions
@@ -217,25 +191,12 @@ def ai_respond_to_answer(comment_id):
         db.session.commit()
         personalities = [default_personality]
     
-    # Select a random personality to respond
-    import random
-    personality = random.choice(personalities)
+    # Select the most relevant personality to respond
+    personality = select_persona(personalities, question, comment.body)
     print(f"Selected AI personality: {personality.name}")
     
     # Check if the AI user exists, create if not
-    ai_user = User.query.filter_by(username=personality.name).first()
-    if not ai_user:
-        print(f"Creating AI user for {personality.name}")
-        from werkzeug.security import generate_password_hash
-        ai_user = User(
-            username=personality.name,
-            email=f"{personality.name.lower().replace(' ', '.')}@overflew.ai",
-            password_hash=generate_password_hash("AI_USER_PASSWORD"),
-            is_ai=True,
-            ai_personality_id=personality.id
-        )
-        db.session.add(ai_user)
-        db.session.commit()
+    ai_user = get_ai_user(personality)
     
     # Construct the prompt for the AI
     prompt = f"""
@@ -330,24 +291,12 @@ def ai_respond_to_comment(comment_id, question_id):
         db.session.commit()
         personalities = [default_personality]
     
-    # Select a personality to respond
-    personality = random.choice(personalities)
+    # Select the most relevant personality to respond
+    personality = select_persona(personalities, question, comment.body)
     print(f"Selected AI personality: {personality.name}")
     
     # Check if the AI user exists, create if not
-    ai_user = User.query.filter_by(username=personality.name).first()
-    if not ai_user:
-        print(f"Creating AI user for {personality.name}")
-        from werkzeug.security import generate_password_hash
-        ai_user = User(
-            username=personality.name,
-            email=f"{personality.name.lower().replace(' ', '.')}@overflew.ai",
-            password_hash=generate_password_hash("AI_USER_PASSWORD"),
-            is_ai=True,
-            ai_personality_id=personality.id
-        )
-        db.session.add(ai_user)
-        db.session.commit()
+    ai_user = get_ai_user(personality)
     
     # Construct the context for the AI
     context = f"""
@@ -389,137 +338,3 @@ def ai_respond_to_comment(comment_id, question_id):
         print(f"AI {personality.name} responded to comment ID {comment_id}")
     else:
         print("Failed to get a response from the LLM service")
-
-
-def ai_respond_to_vote(vote_id):
-    """Have AI personalities respond to votes on answers/comments"""
-    # Import here to avoid circular imports
-    from app.models.ai_personality import AIPersonality
-    from app.services.llm_service import get_completion
-    
-    vote = Vote.query.get(vote_id)
-    if not vote:
-        print(f"Vote ID {vote_id} not found")
-        return
-    
-    # Only respond to votes on comments (including answers)
-    if not vote.comment_id:
-        print(f"Vote ID {vote_id} is not on a comment, skipping")
-        return
-    
-    comment = Comment.query.get(vote.comment_id)
-    if not comment:
-        print(f"Comment ID {vote.comment_id} not found")
-        return
-    
-    question = Question.query.get(comment.question_id)
-    if not question:
-        print(f"Question ID {comment.question_id} not found")
-        return
-    
-    # Check if the question is marked as answered
-    if question.is_answered:
-        print(f"Question {question.id} is marked as answered, skipping AI response to vote")
-        return
-    
-    # Only respond to significant votes (many upvotes or downvotes)
-    comment_score = comment.score
-    
-    # Check if this comment has a significant number of votes
-    # For this example, respond if it has at least 3 votes total (positive or negative)
-    if abs(comment_score) < 3:
-        print(f"Comment ID {comment.id} doesn't have enough votes ({comment_score}), skipping")
-        return
-    
-    # Decide if an AI personality should respond
-    # For votes, maybe have a higher chance based on the vote count
-    response_chance = min(0.1 * abs(comment_score), 0.8)  # Cap at 80% chance
-    
-    import random
-    if random.random() > response_chance:
-        print(f"Decided not to respond to votes on comment ID {comment.id}")
-        return
-    
-    # Get AI personalities that are likely to respond
-    personalities = AIPersonality.query.filter_by(is_active=True).all()
-    
-    # If no active personalities found, check for any personalities
-    if not personalities:
-        personalities = AIPersonality.query.all()
-        print(f"No active AI personalities found, using any available ({len(personalities)} found)")
-    
-    # If still no personalities, create a default one
-    if not personalities:
-        print("No AI personalities found, creating a default one")
-        default_personality = AIPersonality(
-            name="AI Assistant",
-            description="A helpful AI assistant",
-            expertise="General knowledge,Programming,Problem solving",
-            personality_traits="Helpful,Friendly,Knowledgeable",
-            interaction_style="Conversational",
-            helpfulness_level=9,
-            strictness_level=5,
-            verbosity_level=7,
-            prompt_template="You are a helpful AI assistant providing information on {{topic}}",
-            is_active=True
-        )
-        db.session.add(default_personality)
-        db.session.commit()
-        personalities = [default_personality]
-    
-    # Select a personality to respond
-    personality = random.choice(personalities)
-    print(f"Selected AI personality: {personality.name}")
-    
-    # Check if the AI user exists, create if not
-    ai_user = User.query.filter_by(username=personality.name).first()
-    if not ai_user:
-        print(f"Creating AI user for {personality.name}")
-        from werkzeug.security import generate_password_hash
-        ai_user = User(
-            username=personality.name,
-            email=f"{personality.name.lower().replace(' ', '.')}@overflew.ai",
-            password_hash=generate_password_hash("AI_USER_PASSWORD"),
-            is_ai=True,
-            ai_personality_id=personality.id
-        )
-        db.session.add(ai_user)
-        db.session.commit()
-    
-    # Determine if the comment is well-received or not
-    sentiment = "well-received" if comment_score > 0 else "controversial"
-    
-    # Construct the prompt for the AI
-    prompt = f"""
-    You are {personality.name}, {personality.description}
-    
-    Question: {question.title}
-    {question.body}
-    
-    Comment that has been {sentiment} (score: {comment_score}): 
-    {comment.body}
-    
-    As {personality.name}, provide a thoughtful response to this {sentiment} comment.
-    If the comment is well-received, you might add additional helpful information or agree with it.
-    If the comment is controversial, you might offer a balanced perspective or clarify misconceptions.
-    Your response should reflect your unique personality and perspective.
-    """
-    
-    # Get completion from LLM service
-    response = get_completion(prompt)
-    
-    # Create a new comment as a reply
-    if response:
-        print(f"Creating AI response from {ai_user.username} (id: {ai_user.id}) to {sentiment} comment")
-        ai_comment = Comment(
-            body=response,
-            user_id=ai_user.id,
-            question_id=question.id,
-            parent_comment_id=comment.id
-        )
-        
-        db.session.add(ai_comment)
-        db.session.commit()
-        print(f"AI {personality.name} responded to {sentiment} comment ID {comment.id}")
-    else:
-        print("Failed to get a response from the LLM service")
@@ -8,12 +8,14 @@ from app.models.question import Question
 from app.models.comment import Comment
 from app.models.tag import Tag, QuestionTag
 from app.models.ai_personality import AIPersonality
+from app.services.page_cache import cached_page, cached_fragment
 from app import db
 
 main_bp = Blueprint('main', __name__)
 
 
 @main_bp.route('/')
+@cached_page(ttl=30, args=('sort', 'page'), tags=('questions',))
 def index():
     # Get sort parameter from query string
     sort = request.args.get('sort', 'newest')
@@ -21,10 +23,10 @@ def index():
     
     # Query questions based on sort parameter
     if sort == 'active':
-        questions = Question.query.order_by(Question.updated_at.desc())
+        questions = Question.query.order_by(Question.last_activity_at.desc())
     elif sort == 'unanswered':
         # In our new model, "unanswered" means no top-level comments
-        questions = Question.query.filter(~Question.comments.any(Comment.parent_comment_id == None))
+        questions = Question.query.filter(Question.answer_count == 0).order_by(Question.created_at.desc())
     elif sort == 'popular':
         questions = Question.query.order_by(Question.score.desc())
     else:  # default to newest
@@ -37,12 +39,12 @@ def index():
     tags = Tag.query.all()
     
     # Get site statistics
-    stats = {
+    stats = cached_fragment('site-stats', 60, ('questions', 'users'), lambda: {
         'question_count': Question.query.count(),
         'answer_count': Comment.query.filter_by(parent_comment_id=None).count(),  # Top-level comments are answers
         'user_count': User.query.count(),
         'ai_count': User.query.filter_by(is_ai=True).count()
-    }
+    })
     
     return render_template('main/index.html', 
                           questions=questions, 
@@ -62,109 +64,31 @@ def search():
     if not query:
         return redirect(url_for('main.index'))
     
-    # Search for questions that match the query in title or content
-    question_query = Question.query.filter(
-        or_(
-            Question.title.ilike(f'%{query}%'),
-            Question.body.ilike(f'%{query}%')
-        )
-    )
-    
-    # Also search by tags
-    tag_questions = Question.query.join(
-        QuestionTag, Question.id == QuestionTag.question_id
-    ).join(
-        Tag, QuestionTag.tag_id == Tag.id
-    ).filter(
-        Tag.name.ilike(f'%{query}%')
-    )
-    
-    # Search for comments containing the query
-    comment_query = Comment.query.filter(
-        Comment.body.ilike(f'%{query}%')
-    )
-    
-    # Get questions from the matching comments
-    questions_from_comments = Question.query.filter(
-        Question.id.in_([c.question_id for c in comment_query])
-    )
-    
-    # Combine the queries using union to avoid duplicates
-    all_question_ids = set()
-    
-    # Add IDs from each query source
-    for q in question_query:
-        all_question_ids.add(q.id)
-    for q in tag_questions:
-        all_question_ids.add(q.id)
-    for q in questions_from_comments:
-        all_question_ids.add(q.id)
-        
-    # Manually check all content if we have no results
-    if not all_question_ids:
-        current_app.logger.warning(f"No results found for '{query}', trying manual search")
-        all_questions = Question.query.all()
-        all_comments = Comment.query.all()
-        
-        # Search in questions (title and body)
-        for q in all_questions:
-            if query.lower() in q.title.lower() or query.lower() in q.body.lower():
-                all_question_ids.add(q.id)
-                current_app.logger.info(f"Found match in question {q.id}: {q.title}")
-        
-        # Search in comments
-        for c in all_comments:
-            if query.lower() in c.body.lower():
-                all_question_ids.add(c.question_id)
-                current_app.logger.info(f"Found match in comment {c.id} for question {c.question_id}")
-    
-    # Get the combined query from the IDs we collected
-    combined_query = Question.query.filter(Question.id.in_(all_question_ids))
+    from app.services.search_service import match_questions, match_comments, question_rank
+
+    # Questions matching in title or body, by tag, or through one of their comments
+    tag_match = Question.id.in_(db.session.query(QuestionTag.question_id).join(
+        Tag, QuestionTag.tag_id == Tag.id).filter(Tag.name.ilike(f'%{query}%')))
+    comment_match = Question.id.in_(db.session.query(Comment.question_id).filter(match_comments(query)))
+    combined_query = Question.query.filter(or_(match_questions(query), tag_match, comment_match))
+    question_count = combined_query.count()
     
     # Apply sorting
     if sort == 'newest':
         combined_query = combined_query.order_by(Question.created_at.desc())
     elif sort == 'votes':
-        # This is more complex as we need to sort by votes
-        # We'll get all questions and sort them in Python
-        sorted_questions = combined_query.all()
-        sorted_questions.sort(key=lambda q: q.score, reverse=True)
-        sorted_ids = [q.id for q in sorted_questions]
-        
-        # Create a new query using the sorted IDs
-        # Use a case statement to preserve the sorting order
-        if sorted_ids:
-            case_stmt = case(
-                {id_val: idx for idx, id_val in enumerate(sorted_ids)},
-                value=Question.id
-            )
-            combined_query = Question.query.filter(Question.id.in_(sorted_ids)).order_by(case_stmt)
+        combined_query = combined_query.order_by(Question.score.desc(), Question.created_at.desc())
     elif sort == 'activity':
         combined_query = combined_query.order_by(Question.updated_at.desc())
     else:  # relevance - default
-        # Sort by whether the query is found in the title (more relevant)
-        sorted_questions = combined_query.all()
-        sorted_questions.sort(key=lambda q: (
-            query.lower() in q.title.lower(),  # First priority: term in title
-            q.score  # Second priority: score
-        ), reverse=True)
-        sorted_ids = [q.id for q in sorted_questions]
-        
-        # Create a new query with preserved order
-        if sorted_ids:
-            case_stmt = case(
-                {id_val: idx for idx, id_val in enumerate(sorted_ids)},
-                value=Question.id
-            )
-            combined_query = Question.query.filter(Question.id.in_(sorted_ids)).order_by(case_stmt)
+        combined_query = combined_query.order_by(question_rank(query).desc(), Question.score.desc())
     
     # Get data for the other tabs
     users = User.query.filter(User.username.ilike(f'%{query}%')).all()
     tags = Tag.query.filter(Tag.name.ilike(f'%{query}%')).all()
-    comments = Comment.query.filter(Comment.body.ilike(f'%{query}%')).all()
+    comments = Comment.query.filter(match_comments(query)).all()
     
     # Get counts for each tab
-    question_count = len(all_question_ids)
     comment_count = len(comments)
     user_count = len(users)
     tag_count = len(tags)
@@ -195,6 +119,7 @@ def search():
 
 
 @main_bp.route('/tags')
+@cached_page(ttl=300, tags=('questions',))
 def tags():
     from datetime import datetime, timedelta
     
@@ -207,6 +132,7 @@ def tags():
 
 
 @main_bp.route('/tag/<string:tag_name>')
+@cached_page(ttl=60, args=('sort', 'page'), tags=('questions',))
 def tag(tag_name):
     tag = Tag.query.filter_by(name=tag_name).first_or_404()
     page = request.args.get('page', 1, type=int)
@@ -223,11 +149,11 @@ def tag(tag_name):
     
     # Apply sorting
     if sort == 'activity':
-        query = query.order_by(Question.updated_at.desc())
+        query = query.order_by(Question.last_activity_at.desc())
     elif sort == 'votes':
         query = query.order_by(Question.score.desc())
     elif sort == 'unanswered':
-        query = query.filter(~Question.comments.any(Comment.parent_comment_id == None))
+        query = query.filter(Question.answer_count == 0).order_by(Question.created_at.desc())
     else:  # Default to newest
         query = query.order_by(Question.created_at.desc())
     
@@ -281,6 +207,7 @@ def unfollow_tag(tag_name):
 
 
 @main_bp.route('/users')
+@cached_page(ttl=300, args=('sort', 'q', 'page'), tags=('users',))
 def users():
     # Get sort parameter from query string
     sort = request.args.get('sort', 'reputation')
@@ -330,6 +257,7 @@ def users():
 
 @main_bp.route('/ai-community')
 @main_bp.route('/ai_community')  # Keep old route for backward compatibility
+@cached_page(ttl=300, args=('page', 'expertise', 'knowledge_level', 'sort'), tags=('users',))
 def ai_community():
     page = request.args.get('page', 1, type=int)
     expertise = request.args.get('expertise', '')
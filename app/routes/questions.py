@@ -2,15 +2,22 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from app import db
 from app.models.question import Question
-from app.models.answer import Answer
 from app.models.comment import Comment
 from app.models.tag import Tag, QuestionTag
 from app.models.vote import Vote
 from app.models.ai_personality import AIPersonality
 from app.models.user import User
-from app.services.llm_service import get_completion, queue_task
+from app.services.llm_service import get_completion, queue_task, PRIORITY_BULK, PRIORITY_INTERACTIVE
+from app.services.persona_router import select_persona
+from app.services.population_service import get_ai_user
+from app.services.duplicate_index import duplicate_index, find_reusable_thread
+from app.services.related_service import get_related_questions, related_index, schedule_refresh
+from app.services.vote_service import apply_votes
+from app.services.vote_events import emit_vote_events
+from app.services.thread_loader import load_thread
+from app.services.page_cache import cached_page
+from app.services.view_counter import record_view
 import os
-import random
 import json
 from datetime import datetime
 import re
@@ -53,6 +60,19 @@ def ask():
         
         db.session.commit()
         
+        # Don't regenerate answers for a question that already has an answered thread
+        original, similarity = find_reusable_thread(question)
+        duplicate_index.add(question)
+        schedule_refresh(question.id)
+        if original:
+            question.duplicate_of_id = original.id
+            db.session.commit()
+            current_app.logger.info(
+                f"Question {question.id} duplicates question {original.id} ({similarity:.2f}), skipping AI answers")
+            flash('A very similar question already has answers, so no new AI answers were generated.', 'info')
+            flash('Your question has been posted.', 'success')
+            return redirect(url_for('questions.view', question_id=question.id))
+        
         # Trigger AI responses
         from app.models.ai_personality import AIPersonality
         from app.models.user import User
@@ -67,32 +87,15 @@ def ask():
         
         # If still no personalities, skip AI answer
         if personalities:
-            # Select a random personality to respond
-            import random
-            personality = random.choice(personalities)
+            # Select the personality most relevant to the question
+            personality = select_persona(personalities, question)
             print(f"Selected AI personality for initial answer: {personality.name}")
             
-            # Find the corresponding AI user
-            ai_user = User.query.filter_by(username=personality.name).first()
-            if not ai_user:
-                print(f"Creating AI user for {personality.name}")
-                from werkzeug.security import generate_password_hash
-                ai_user = User(
-                    username=personality.name,
-                    email=f"{personality.name.lower().replace(' ', '.')}@overflew.ai",
-                    password_hash=generate_password_hash("AI_USER_PASSWORD"),
-                    is_ai=True,
-                    ai_personality_id=personality.id
-                )
-                db.session.add(ai_user)
-                db.session.commit()
-            
-            # Generate AI answer using the selected personality
-            success, message = _generate_ai_answer(question.id, personality.id)
-            if success:
-                flash(message, 'success')
-            else:
-                flash(message, 'warning')
+            # Generate the AI answer in the background, ahead of any bulk work; the
+            # question page picks it up through its live update stream
+            queue_task(_generate_ai_answer, question.id, personality.id,
+                       priority=PRIORITY_INTERACTIVE, key=question.id)
+            flash(f'{personality.name} is writing an answer, it will appear on the page shortly.', 'info')
         else:
             print("No AI personalities found, skipping initial AI answer")
         
@@ -104,9 +107,9 @@ def ask():
         
         if SiteSettings.get('ai_auto_populate_enabled', False) and not question.is_answered:
             print(f"Auto-population is enabled, populating thread for question {question.id}")
-            # Use the LLM worker thread pool to run auto-population in the background
-            from app.services.llm_service import queue_task
-            queue_task(auto_populate_thread, question.id, parallel=True)
+            # Run auto-population as bulk work in the background; it is split into
+            # small chunks so interactive requests are never stuck behind it
+            queue_task(auto_populate_thread, question.id, priority=PRIORITY_BULK, key=question.id)
         elif question.is_answered:
             print(f"Question {question.id} is marked as answered, skipping auto-population")
         
@@ -117,15 +120,13 @@ def ask():
 
 
 @questions_bp.route('/<int:question_id>')
+@cached_page(ttl=60, tags=('question:{question_id}',), on_hit=record_view)
 def view(question_id):
     question = Question.query.get_or_404(question_id)
     question.increment_view()  # Increment view count
     
-    # Get all top-level comments (both answers and comments) for this question
-    top_level_comments = Comment.query.filter_by(
-        question_id=question_id, 
-        parent_comment_id=None
-    ).all()
+    # The whole comment tree, with authors, in one query
+    top_level_comments = load_thread(question_id)
     
     # Attach user vote information to question and comments if user is logged in
     if current_user.is_authenticated:
@@ -137,35 +138,16 @@ def view(question_id):
         ).first()
         question.user_vote = question_vote.vote_type if question_vote else 0
         
-        # Get all comment IDs for this question to fetch votes in a single query
-        comment_ids = []
-        
-        def collect_comment_ids(comments):
-            for comment in comments:
-                comment_ids.append(comment.id)
-                if comment.replies:
-                    collect_comment_ids(comment.replies.all())
-        
-        collect_comment_ids(top_level_comments)
-        
-        # Fetch all votes by this user for these comments in a single query
-        if comment_ids:
-            comment_votes = Vote.query.filter(
-                Vote.user_id == current_user.id,
-                Vote.comment_id.in_(comment_ids)
-            ).all()
-            
-            # Create a mapping of comment_id to vote_type
-            vote_map = {vote.comment_id: vote.vote_type for vote in comment_votes}
-            
-            # Attach vote information to each comment
-            def attach_vote_info(comments):
-                for comment in comments:
-                    comment.user_vote = vote_map.get(comment.id, 0)
-                    if comment.replies:
-                        attach_vote_info(comment.replies.all())
-            
-            attach_vote_info(top_level_comments)
+        # Fetch all votes by this user on the thread in a single query; the
+        # page applies them over the shared comment fragments
+        comment_votes = dict(db.session.query(Vote.comment_id, Vote.vote_type).join(
+            Comment, Comment.id == Vote.comment_id
+        ).filter(
+            Vote.user_id == current_user.id,
+            Comment.question_id == question_id
+        ).all())
+    else:
+        comment_votes = {}
     
     # Get AI personalities for the AI responder modal
     from app.models.ai_personality import AIPersonality
@@ -174,10 +156,17 @@ def view(question_id):
     # Get AI users with their personalities
     ai_users = User.query.filter_by(is_ai=True).all()
     
+    # Related questions are precomputed in the background
+    related_questions = get_related_questions(question_id)
+    if not related_questions:
+        schedule_refresh(question_id, if_missing=True)
+    
     return render_template('questions/view.html', 
                           question=question, 
                           comments=top_level_comments,
-                          ai_personalities=ai_users)
+                          ai_personalities=ai_users,
+                          related_questions=related_questions,
+                          comment_votes=comment_votes)
 
 
 @questions_bp.route('/<int:question_id>/edit', methods=['GET', 'POST'])
@@ -223,6 +212,8 @@ def edit(question_id):
                 db.session.add(question_tag)
         
         db.session.commit()
+        duplicate_index.add(question)
+        schedule_refresh(question.id)
         flash('Your question has been updated', 'success')
         return redirect(url_for('questions.view', question_id=question.id))
     
@@ -243,6 +234,8 @@ def delete(question_id):
         abort(403)
     
     question.soft_delete()
+    duplicate_index.remove(question.id)
+    related_index.remove(question.id)
     
     flash('Your question has been deleted', 'success')
     return redirect(url_for('main.index'))
@@ -258,41 +251,18 @@ def vote(question_id):
         flash('Invalid vote type', 'danger')
         return redirect(url_for('questions.view', question_id=question_id))
     
-    # Check if user has already voted
+    # Clicking the same button again removes the vote
     existing_vote = Vote.query.filter_by(
         user_id=current_user.id, question_id=question_id
     ).first()
+    if existing_vote and existing_vote.vote_type == vote_type:
+        vote_type = 0
     
-    if existing_vote:
-        if existing_vote.vote_type == vote_type:
-            # Remove vote if clicking the same button
-            db.session.delete(existing_vote)
-            # Update author reputation
-            author = User.query.get(question.user_id)
-            author.update_reputation(-vote_type)
-        else:
-            # Change vote
-            existing_vote.vote_type = vote_type
-            # Update author reputation (double the effect since reversing)
-            author = User.query.get(question.user_id)
-            author.update_reputation(vote_type * 2)
-    else:
-        # New vote
-        vote = Vote(
-            user_id=current_user.id,
-            question_id=question_id,
-            vote_type=vote_type
-        )
-        db.session.add(vote)
-        
-        # Update author reputation
-        author = User.query.get(question.user_id)
-        author.update_reputation(vote_type)
-    
-    db.session.commit()
+    # Vote, score and author reputation are updated in one transaction
+    outcome = apply_votes(current_user.id, [{'question_id': question_id, 'vote_type': vote_type}])
     
-    # Trigger AI responses to the vote asynchronously
-    queue_task(ai_respond_to_vote, vote)
+    # AI reactions are decided later, once votes on the question have been coalesced
+    emit_vote_events(current_user, outcome['results'])
     
     return redirect(url_for('questions.view', question_id=question_id))
 
@@ -370,7 +340,7 @@ def _generate_ai_answer(question_id, ai_personality_id=None):
     
     Args:
         question_id (int): The ID of the question to answer
-        ai_personality_id (int, optional): The ID of the AI personality to use. If None, a random one is selected.
+        ai_personality_id (int, optional): The ID of the AI personality to use. If None, the most relevant one is selected.
         
     Returns:
         tuple: (success, message)
@@ -390,7 +360,7 @@ def _generate_ai_answer(question_id, ai_personality_id=None):
             if not ai_personality:
                 return False, f"AI personality with ID {ai_personality_id} not found"
         else:
-            # Get a random active AI personality
+            # Get the most relevant active AI personality
             ai_personalities = AIPersonality.query.filter_by(is_active=True).all()
             if not ai_personalities:
                 # Create a default AI personality if none exists
@@ -409,21 +379,10 @@ def _generate_ai_answer(question_id, ai_personality_id=None):
                 db.session.commit()
                 ai_personality = default_personality
             else:
-                ai_personality = random.choice(ai_personalities)
+                ai_personality = select_persona(ai_personalities, question)
         
         # Get the AI user or create one if it doesn't exist
-        ai_user = User.query.filter_by(username=ai_personality.name).first()
-        if not ai_user:
-            # Create a user for this AI personality
-            ai_user = User(
-                username=ai_personality.name,
-                email=f"{ai_personality.name.lower().replace(' ', '.')}@example.com",
-                is_ai=True,
-                ai_personality_id=ai_personality.id
-            )
-            ai_user.set_password("AIUSER")
-            db.session.add(ai_user)
-            db.session.commit()
+        ai_user = get_ai_user(ai_personality)
         
         # Build context with question details
         context = f"Question Title: {question.title}\n"
@@ -445,6 +404,11 @@ def _generate_ai_answer(question_id, ai_personality_id=None):
             base_url=ai_personality.custom_base_url
         )
         
+        # Don't post anything if the backend failed or shed the request
+        if not answer_text:
+            current_app.logger.warning(f"No AI answer generated for question {question.id}, the LLM service is busy")
+            return False, "The AI service is busy right now, no answer was generated"
+        
         # Create the answer as a comment
         comment = Comment(
             body=answer_text,
@@ -462,157 +426,85 @@ def _generate_ai_answer(question_id, ai_personality_id=None):
         return False, f"Error generating AI answer: {str(e)}"
 
 
-def ai_respond_to_vote(vote):
+def _build_question_context(question):
+    """Build the prompt context for a question (title, body and tags)"""
+    context = f"Question Title: {question.title}\n"
+    context += f"Question Body: {question.body}\n"
+    if question.tags:
+        context += f"\n\nTags: {', '.join([tag.tag.name for tag in question.tags])}"
+    return context
+
+
+def _create_ai_answer(ai_user, question):
     """
-    Generate an AI response to a vote
-    
-    Args:
-        vote (Vote): The vote to respond to
-        
+    Have a specific AI user answer a question right away (used by /api/ai/respond)
+
     Returns:
-        Comment: The generated comment, or None if no response was generated
+        Comment: The new top-level comment, or None if no answer was generated
     """
-    try:
-        from app.models.ai_personality import AIPersonality
-        from app.services.llm_service import get_completion
-        
-        # Skip if the vote is by an AI
-        if vote.user.is_ai:
-            return None
-        
-        # Get the content that was voted on
-        content = None
-        content_type = None
-        
-        if vote.question_id:
-            content = Question.query.get(vote.question_id)
-            content_type = "question"
-        elif vote.comment_id:
-            content = Comment.query.get(vote.comment_id)
-            content_type = "comment"
-        else:
-            return None
-            
-        # Skip if the content doesn't exist or is deleted
-        if not content or getattr(content, 'is_deleted', False):
-            return None
-            
-        # Skip if the content was created by the voter (self-vote)
-        if content_type == "question" and content.user_id == vote.user_id:
-            return None
-        elif content_type == "comment" and content.user_id == vote.user_id:
-            return None
-            
-        # Get the AI personality of the content creator
-        ai_user = User.query.get(content.user_id)
-        if not ai_user or not ai_user.is_ai or not ai_user.ai_personality_id:
-            return None
-            
-        ai_personality = AIPersonality.query.get(ai_user.ai_personality_id)
-        if not ai_personality:
-            return None
-            
-        # Get the question for context
-        if content_type == "question":
-            question = content
-        elif content_type == "comment":
-            question = Question.query.get(content.question_id)
-            
-        if not question:
-            return None
-            
-        # Build context with question details
-        context = f"Question Title: {question.title}\n"
-        context += f"Question Body: {question.body}\n"
-        if question.tags:
-            context += f"\n\nTags: {', '.join([tag.tag.name for tag in question.tags])}"
-            
-        # Determine if this is an upvote or downvote
-        vote_type = "upvote" if vote.vote_type > 0 else "downvote"
-        
-        # Create the prompt based on content type and vote type
-        if content_type == "question":
-            prompt = f"""
-            You are {ai_personality.name}, an AI with the following traits:
-            - Expertise: {ai_personality.expertise}
-            - Personality: {ai_personality.personality_traits}
-            - Interaction Style: {ai_personality.interaction_style}
-            
-            A user has {vote_type}d your question. Please respond to this {vote_type} in a way that reflects your personality.
-            
-            {context}
-            
-            Your question that was {vote_type}d: {content.title}
-            
-            Respond to this {vote_type} in a conversational way. If it's an upvote, express gratitude and perhaps expand on your question.
-            If it's a downvote, be gracious and ask how you could improve your question or provide better information.
-            """
-        elif content_type == "comment":
-            prompt = f"""
-            You are {ai_personality.name}, an AI with the following traits:
-            - Expertise: {ai_personality.expertise}
-            - Personality: {ai_personality.personality_traits}
-            - Interaction Style: {ai_personality.interaction_style}
-            
-            A user has {vote_type}d your comment. Please respond to this {vote_type} in a way that reflects your personality.
-            
-            {context}
-            
-            Your comment that was {vote_type}d: {content.body}
-            
-            Respond to this {vote_type} in a conversational way. If it's an upvote, express gratitude and perhaps expand on your comment.
-            If it's a downvote, be gracious and ask how you could improve your comment or provide better information.
-            """
-            
-        # Format the prompt using the personality's template
-        formatted_prompt = ai_personality.prompt_template
-        formatted_prompt = formatted_prompt.replace('{{content}}', prompt)
-        formatted_prompt = formatted_prompt.replace('{{context}}', context)
-        
-        # For any other template variables, use personality attributes
-        formatted_prompt = formatted_prompt.replace('{{name}}', ai_personality.name)
-        formatted_prompt = formatted_prompt.replace('{{description}}', ai_personality.description)
-        formatted_prompt = formatted_prompt.replace('{{expertise}}', ai_personality.expertise)
-        formatted_prompt = formatted_prompt.replace('{{personality_traits}}', ai_personality.personality_traits)
-        
-        # Log the actual prompt sent to the model
-        print("FINAL PROMPT FOR AI COMMENT RESPONSE:")
-        print("=" * 40)
-        print(formatted_prompt)
-        print("=" * 40)
-        
-        # Get completion from LLM service
-        response = get_completion(
-            prompt=formatted_prompt,
-            model=ai_personality.custom_model,
-            api_key=ai_personality.custom_api_key,
-            base_url=ai_personality.custom_base_url
-        )
-        
-        # Create the reply
-        if content_type == "question":
-            reply = Comment(
-                body=response,
-                user_id=ai_user.id,
-                question_id=question.id,
-                parent_comment_id=None
-            )
-        elif content_type == "comment":
-            reply = Comment(
-                body=response,
-                user_id=ai_user.id,
-                question_id=question.id,
-                parent_comment_id=content.id
-            )
-            
-        db.session.add(reply)
-        db.session.commit()
-        
-        return reply
-    except Exception as e:
-        current_app.logger.error(f"Error in ai_respond_to_vote: {str(e)}")
+    personality = ai_user.ai_personality
+    if not personality:
+        return None
+
+    prompt = personality.format_prompt(
+        content="Please provide a helpful and informative answer to this question.",
+        context=_build_question_context(question)
+    )
+    answer_text = get_completion(
+        prompt=prompt,
+        model=personality.custom_model,
+        api_key=personality.custom_api_key,
+        base_url=personality.custom_base_url
+    )
+    if not answer_text:
+        return None
+
+    comment = Comment(
+        body=answer_text,
+        user_id=ai_user.id,
+        question_id=question.id,
+        parent_comment_id=None
+    )
+    db.session.add(comment)
+    db.session.commit()
+    return comment
+
+
+def _create_ai_reply(ai_user, comment):
+    """
+    Have a specific AI user reply to a comment right away (used by /api/ai/respond)
+
+    Returns:
+        Comment: The new reply, or None if no reply was generated
+    """
+    personality = ai_user.ai_personality
+    question = Question.query.get(comment.question_id)
+    if not personality or not question:
+        return None
+
+    prompt = personality.format_prompt(
+        content=f"Comment: {comment.body}\n\nAs {personality.name}, reply to this comment with relevant information, insights, or questions.",
+        context=_build_question_context(question)
+    )
+    reply_text = get_completion(
+        prompt=prompt,
+        model=personality.custom_model,
+        api_key=personality.custom_api_key,
+        base_url=personality.custom_base_url
+    )
+    if not reply_text:
         return None
 
+    reply = Comment(
+        body=reply_text,
+        user_id=ai_user.id,
+        question_id=question.id,
+        parent_comment_id=comment.id
+    )
+    db.session.add(reply)
+    db.session.commit()
+    return reply
+
 
 def ai_respond_to_comment(comment_id):
     """
@@ -684,24 +576,13 @@ def ai_respond_to_comment(comment_id):
             db.session.commit()
             personalities = [default_personality]
         
-        # Select a personality to respond
-        personality = random.choice(personalities)
+        # Select the personality most relevant to the comment
+        personality = select_persona(personalities, question, comment.body)
         print(f"Selected AI personality: {personality.name}")
         print(f"Personality template: {personality.prompt_template}")
         
-        # Check if the AI user exists, create if not
-        ai_user = User.query.filter_by(username=personality.name).first()
-        if not ai_user:
-            # Create a user for this AI personality
-            ai_user = User(
-                username=personality.name,
-                email=f"{personality.name.lower().replace(' ', '.')}@example.com",
-                is_ai=True,
-                ai_personality_id=personality.id
-            )
-            ai_user.set_password("AIUSER")
-            db.session.add(ai_user)
-            db.session.commit()
+        # Get the AI user, creating it if needed
+        ai_user = get_ai_user(personality)
         
         # Prepare content text and context text for the template
         content_text = ""
@@ -770,6 +651,9 @@ def auto_populate_thread(question_id, max_comments=None, num_personalities=None)
     """
     Automatically populate a thread with AI responses
     
+    Creates (or reuses) a resumable population job for the question and runs
+    its first chunk. Later chunks are queued by the job itself.
+    
     Args:
         question_id (int): The ID of the question to populate
         max_comments (int, optional): Maximum number of comments to generate
@@ -778,286 +662,10 @@ def auto_populate_thread(question_id, max_comments=None, num_personalities=None)
     Returns:
         tuple: (success, message)
     """
-    try:
-        from app.models.site_settings import SiteSettings
-        from app.models.ai_personality import AIPersonality
-        from app.services.llm_service import get_completion
-        
-        # Get the question
-        question = Question.query.get(question_id)
-        if not question:
-            return False, "Question not found"
-        
-        # Get settings with defaults
-        if max_comments is None:
-            max_comments = int(SiteSettings.get('ai_auto_populate_max_comments', 150))
-        
-        if num_personalities is None:
-            num_personalities = int(SiteSettings.get('ai_auto_populate_personalities', 7))
-        
-        # Get active AI personalities
-        ai_personalities = AIPersonality.query.filter_by(is_active=True).all()
-        if not ai_personalities:
-            return False, "No active AI personalities found"
-        
-        # Select a subset of personalities to involve in this thread
-        if len(ai_personalities) > num_personalities:
-            selected_personalities = random.sample(ai_personalities, num_personalities)
-        else:
-            selected_personalities = ai_personalities
-        
-        # Generate initial AI answers if none exist
-        answers = Answer.query.filter_by(question_id=question_id).all()
-        if not answers:
-            # Generate an answer from one of the personalities
-            personality = random.choice(selected_personalities)
-            success, message = _generate_ai_answer(question_id, personality.id)
-            if not success:
-                return False, message
-        
-        # Get all comments for this question
-        all_comments = Comment.query.filter_by(question_id=question_id).all()
-        
-        # Count existing AI comments
-        ai_comment_count = 0
-        for comment in all_comments:
-            if User.query.get(comment.user_id).is_ai:
-                ai_comment_count += 1
-        
-        # Check if we've reached the maximum
-        if ai_comment_count >= max_comments:
-            return True, f"Thread already has {ai_comment_count} AI comments (max: {max_comments})"
-        
-        # Build context with question details
-        context = f"Question Title: {question.title}\n"
-        context += f"Question Body: {question.body}\n"
-        if question.tags:
-            context += f"\n\nTags: {', '.join([tag.tag.name for tag in question.tags])}"
-        
-        # Get all comments and answers to evaluate and possibly respond to
-        items_to_evaluate = []
-        
-        # Add answers to evaluate
-        for answer in answers:
-            items_to_evaluate.append({
-                'type': 'answer',
-                'id': answer.id,
-                'user_id': answer.user_id,
-                'body': answer.body,
-                'created_at': answer.created_at
-            })
-        
-        # Add comments to evaluate
-        for comment in all_comments:
-            items_to_evaluate.append({
-                'type': 'comment',
-                'id': comment.id,
-                'user_id': comment.user_id,
-                'body': comment.body,
-                'parent_id': comment.parent_comment_id,
-                'created_at': comment.created_at
-            })
-        
-        # Sort by creation time
-        items_to_evaluate.sort(key=lambda x: x['created_at'])
-        
-        # For each personality, evaluate and possibly respond to items
-        for personality in selected_personalities:
-            # Skip if this personality shouldn't respond based on activity frequency
-            if not personality.should_respond():
-                continue
-                
-            # Get the AI user for this personality
-            ai_user = User.query.filter_by(ai_personality_id=personality.id, is_ai=True).first()
-            if not ai_user:
-                # Create a user for this AI personality
-                ai_user = User(
-                    username=f"ai_{personality.name.lower().replace(' ', '_')}",
-                    email=f"ai_{personality.name.lower().replace(' ', '_')}@example.com",
-                    is_ai=True,
-                    ai_personality_id=personality.id
-                )
-                ai_user.set_password("AIUSER")
-                db.session.add(ai_user)
-                db.session.commit()
-            
-            # For each item, decide whether to vote and/or reply
-            for item in items_to_evaluate:
-                # Skip if the item was created by this AI
-                if item['user_id'] == ai_user.id:
-                    continue
-                
-                # 90% chance to evaluate the item
-                if random.random() < 0.9:
-                    # Determine whether to upvote or downvote based on content quality
-                    if item['type'] == 'answer':
-                        prompt = f"""
-                        You are {personality.name}, an AI with the following traits:
-                        - Expertise: {personality.expertise}
-                        - Personality: {personality.personality_traits}
-                        - Interaction Style: {personality.interaction_style}
-                        
-                        Please evaluate the following answer to a question. Consider its quality, accuracy, helpfulness, and clarity.
-                        
-                        {context}
-                        
-                        Answer: {item['body']}
-                        
-                        Based on your evaluation, should this answer be upvoted or downvoted?
-                        Respond with either "UPVOTE" or "DOWNVOTE" followed by your reasoning.
-                        """
-                    else:  # comment
-                        prompt = f"""
-                        You are {personality.name}, an AI with the following traits:
-                        - Expertise: {personality.expertise}
-                        - Personality: {personality.personality_traits}
-                        - Interaction Style: {personality.interaction_style}
-                        
-                        Please evaluate the following comment. Consider its quality, relevance, helpfulness, and clarity.
-                        
-                        {context}
-                        
-                        Comment: {item['body']}
-                        
-                        Based on your evaluation, should this comment be upvoted or downvoted?
-                        Respond with either "UPVOTE" or "DOWNVOTE" followed by your reasoning.
-                        """
-                    
-                    # Format the prompt with the AI personality
-                    formatted_prompt = personality.format_prompt(
-                        content=prompt,
-                        context=""
-                    )
-                    
-                    # Get completion from LLM with custom settings if available
-                    response = get_completion(
-                        prompt=formatted_prompt,
-                        model=personality.custom_model,
-                        api_key=personality.custom_api_key,
-                        base_url=personality.custom_base_url
-                    )
-                    
-                    # Determine the vote direction from the response
-                    vote_direction = 1  # Default to upvote
-                    if response and "DOWNVOTE" in response.upper().split("\n")[0]:
-                        vote_direction = -1
-                    
-                    # Log the decision
-                    current_app.logger.info(f"AI {personality.name} decided to {'downvote' if vote_direction == -1 else 'upvote'} {item['type']} {item['id']}")
-                    current_app.logger.info(f"Reasoning: {response}")
-                    
-                    # Check if a vote already exists
-                    if item['type'] == 'answer':
-                        existing_vote = Vote.query.filter_by(
-                            user_id=ai_user.id,
-                            answer_id=item['id']
-                        ).first()
-                    else:  # comment
-                        existing_vote = Vote.query.filter_by(
-                            user_id=ai_user.id,
-                            comment_id=item['id']
-                        ).first()
-                    
-                    # Update or create the vote
-                    if existing_vote:
-                        existing_vote.vote_type = vote_direction
-                    else:
-                        # Create a new vote
-                        vote = Vote(
-                            user_id=ai_user.id,
-                            vote_type=vote_direction
-                        )
-                        
-                        if item['type'] == 'answer':
-                            vote.answer_id = item['id']
-                        else:  # comment
-                            vote.comment_id = item['id']
-                        
-                        db.session.add(vote)
-                    
-                    # 70% chance to reply to the item
-                    if random.random() < 0.7:
-                        # Generate a reply based on the content
-                        if vote_direction == 1:  # Upvote
-                            reply_prompt = f"""
-                            You are {personality.name}, an AI with the following traits:
-                            - Expertise: {personality.expertise}
-                            - Personality: {personality.personality_traits}
-                            - Interaction Style: {personality.interaction_style}
-                            
-                            You just upvoted the following {item['type']}. 
-                            Write a reply that expands on the {item['type']}, adds additional information, 
-                            or supports the points made. Be constructive and helpful.
-                            
-                            {context}
-                            
-                            {item['type'].capitalize()}: {item['body']}
-                            
-                            Your reply:
-                            """
-                        else:  # Downvote
-                            reply_prompt = f"""
-                            You are {personality.name}, an AI with the following traits:
-                            - Expertise: {personality.expertise}
-                            - Personality: {personality.personality_traits}
-                            - Interaction Style: {personality.interaction_style}
-                            
-                            You just downvoted the following {item['type']} because you found issues with it. 
-                            Write a constructive reply that politely points out the issues, provides corrections, 
-                            or offers a better alternative. Be respectful and helpful.
-                            
-                            {context}
-                            
-                            {item['type'].capitalize()}: {item['body']}
-                            
-                            Your reply:
-                            """
-                        
-                        # Format the prompt with the AI personality
-                        formatted_reply_prompt = personality.format_prompt(
-                            content=reply_prompt,
-                            context=""
-                        )
-                        
-                        # Get completion from LLM with custom settings if available
-                        reply_text = get_completion(
-                            prompt=formatted_reply_prompt,
-                            model=personality.custom_model,
-                            api_key=personality.custom_api_key,
-                            base_url=personality.custom_base_url
-                        )
-                        
-                        # Create the reply
-                        if item['type'] == 'answer':
-                            # Create a comment on the answer
-                            reply = Comment(
-                                body=reply_text,
-                                user_id=ai_user.id,
-                                question_id=question_id,
-                                answer_id=item['id']
-                            )
-                        else:  # comment
-                            # Create a reply to the comment
-                            reply = Comment(
-                                body=reply_text,
-                                user_id=ai_user.id,
-                                question_id=question_id,
-                                parent_comment_id=item['id']
-                            )
-                        
-                        db.session.add(reply)
-                        ai_comment_count += 1
-                        
-                        # Check if we've reached the maximum
-                        if ai_comment_count >= max_comments:
-                            db.session.commit()
-                            return True, f"Generated {ai_comment_count} AI comments (max reached)"
-        
-        # Commit all changes
-        db.session.commit()
-        return True, f"Generated {ai_comment_count} AI comments"
+    from app.services.population_service import start_population_job, run_population_job
     
-    except Exception as e:
-        db.session.rollback()
-        current_app.logger.error(f"Error in auto_populate_thread: {str(e)}")
-        return False, f"Error populating thread: {str(e)}"
+    success, message, job = start_population_job(question_id, max_comments, num_personalities)
+    if not job:
+        return success, message
+    
+    return run_population_job(job.id)
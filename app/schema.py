@@ -0,0 +1,262 @@
+"""
+Schema setup and versioned migrations.
+
+Creating tables and seeding site settings is an explicit step (`flask
+init-db`), not something every process does on start. The schema_version
+table records every migration applied to a database; create_app() only reads
+it and logs a warning when the database is behind, so booting a worker never
+writes to the database.
+
+Migrations are the modules of the app.migrations package, named
+vNNN_description.py and applied in version order. Each defines
+upgrade(migration) and is idempotent: it checks the live schema through the
+inspector before changing it, so databases that were upgraded by hand before
+the runner existed are brought in line rather than broken. A migration runs
+in one transaction together with its schema_version row, except for data
+copies, which go through Migration.batches(): those commit after every
+batch of ids and skip rows that were already copied, so a copy over millions
+of rows holds locks only briefly and an interrupted run simply resumes.
+
+A brand new database is created from the models with create_all() and
+stamped with every migration, without running them. Existing databases only
+change through migrations, so a table added to the models needs one too
+(Migration.create_table).
+"""
+import importlib
+import os
+import pkgutil
+from sqlalchemy import bindparam, inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from app import db
+
+# Rows per transaction in batched data migrations
+MIGRATION_BATCH_SIZE = int(os.environ.get('MIGRATION_BATCH_SIZE', 5000))
+
+
+class Migration:
+    """Helpers handed to a migration's upgrade() function"""
+
+    def __init__(self, version, name, batch_size=MIGRATION_BATCH_SIZE, log=print):
+        self.version = version
+        self.name = name
+        self.batch_size = batch_size
+        self.log = log
+
+    @property
+    def dialect(self):
+        return db.session.get_bind().dialect.name
+
+    def _inspector(self):
+        # Inspect through the migration's own connection so uncommitted DDL is visible
+        return inspect(db.session.connection())
+
+    def has_table(self, table):
+        return self._inspector().has_table(table)
+
+    def has_column(self, table, column):
+        return any(col['name'] == column for col in self._inspector().get_columns(table))
+
+    def execute(self, sql, params=None, expanding=()):
+        """Run raw SQL; parameters named in expanding take a list, as in `id IN :ids`"""
+        statement = text(sql)
+        if expanding:
+            statement = statement.bindparams(*[bindparam(name, expanding=True) for name in expanding])
+        return db.session.execute(statement, params or {})
+
+    def create_table(self, model):
+        """Create a model's table (and its indexes) if it doesn't exist"""
+        model.__table__.create(db.session.connection(), checkfirst=True)
+
+    def add_column(self, table, column, definition):
+        """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+        if not self.has_table(table):
+            # Recording the migration as applied would leave the column missing for good
+            raise RuntimeError(f"Can't add {table}.{column}: table {table} doesn't exist; "
+                               f"create it in this or an earlier migration")
+        if self.has_column(table, column):
+            self.log(f"  {table}.{column} already exists")
+            return False
+        self.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        self.log(f"  Added {table}.{column}")
+        return True
+
+    def create_index(self, table, column):
+        self.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})")
+
+    def batches(self, table, column='id'):
+        """
+        Yield ascending lists of ids from a table, committing after each batch
+
+        The work done for a batch between two iterations is one transaction.
+        Batches must be idempotent so that a run interrupted mid-way can be
+        restarted from the beginning.
+        """
+        total = self.execute(f"SELECT COUNT(*) FROM {table}").scalar()
+        db.session.commit()
+        last_id = None
+        done = 0
+        while True:
+            if last_id is None:
+                rows = self.execute(f"SELECT {column} FROM {table} ORDER BY {column} LIMIT :limit",
+                                    {'limit': self.batch_size})
+            else:
+                rows = self.execute(f"SELECT {column} FROM {table} WHERE {column} > :last "
+                                    f"ORDER BY {column} LIMIT :limit",
+                                    {'last': last_id, 'limit': self.batch_size})
+            ids = [row[0] for row in rows]
+            if not ids:
+                return
+            yield ids
+            db.session.commit()
+            done += len(ids)
+            last_id = ids[-1]
+            self.log(f"  {table}: {done}/{total}")
+
+
+def list_migrations():
+    """(version, name, module name) of every migration, in version order, without importing them"""
+    from app import migrations
+
+    found = []
+    for info in pkgutil.iter_modules(migrations.__path__):
+        prefix, _, name = info.name.partition('_')
+        if prefix.startswith('v') and prefix[1:].isdigit():
+            found.append((int(prefix[1:]), name, f'{migrations.__name__}.{info.name}'))
+    found.sort()
+    versions = [version for version, name, module_name in found]
+    if len(set(versions)) != len(versions):
+        raise RuntimeError(f'Duplicate migration versions in {versions}')
+    return found
+
+
+def load_migrations():
+    """
+    Find and import the migration modules
+
+    Returns:
+        list: (version, name, module) tuples in version order
+    """
+    return [(version, name, importlib.import_module(module_name))
+            for version, name, module_name in list_migrations()]
+
+
+def latest_version():
+    migrations = list_migrations()
+    return migrations[-1][0] if migrations else 0
+
+
+def get_schema_version():
+    """
+    Read the database's schema version without writing anything
+
+    Returns:
+        int: The highest applied version, or None if the database was never initialized
+    """
+    from app.models.schema_version import SchemaVersion
+
+    try:
+        return db.session.query(db.func.max(SchemaVersion.version)).scalar()
+    except (OperationalError, ProgrammingError):
+        # No schema_version table yet
+        db.session.rollback()
+        return None
+
+
+def get_applied_migrations():
+    """Versions recorded in schema_version, as a {version: (name, applied_at)} dict"""
+    from app.models.schema_version import SchemaVersion
+
+    try:
+        return {row.version: (row.name, row.applied_at) for row in SchemaVersion.query.all()}
+    except (OperationalError, ProgrammingError):
+        db.session.rollback()
+        return {}
+
+
+def check_schema(app):
+    """Warn when the database is older than the code; called on startup, read-only"""
+    version = get_schema_version()
+    if version is None:
+        app.logger.warning('Database has no schema version, run `flask init-db`')
+    else:
+        latest = latest_version()
+        if version < latest:
+            app.logger.warning(f'Database schema is at version {version}, expected {latest}; '
+                               f'run `flask upgrade-db`')
+    return version
+
+
+def _record(version, name):
+    from app.models.schema_version import SchemaVersion
+    db.session.add(SchemaVersion(version=version, name=name))
+
+
+def run_migrations(target=None, batch_size=MIGRATION_BATCH_SIZE, log=print):
+    """
+    Apply every pending migration up to a version
+
+    Args:
+        target (int, optional): Last version to apply (defaults to the latest)
+        batch_size (int): Rows per transaction in batched data migrations
+        log (callable): Receives progress messages
+
+    Returns:
+        list: Versions applied
+    """
+    from app.models.schema_version import SchemaVersion
+
+    SchemaVersion.__table__.create(db.engine, checkfirst=True)
+    applied = set(get_applied_migrations())
+
+    done = []
+    for version, name, module in load_migrations():
+        if version in applied or (target is not None and version > target):
+            continue
+        log(f"Applying migration {version} ({name})...")
+        try:
+            module.upgrade(Migration(version, name, batch_size=batch_size, log=log))
+            _record(version, name)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            log(f"Migration {version} ({name}) failed; fix the cause and run it again to resume")
+            raise
+        done.append(version)
+    return done
+
+
+def init_schema(force=False, batch_size=MIGRATION_BATCH_SIZE, log=print):
+    """
+    Create or upgrade the database and seed the default site settings
+
+    A database without tables is created from the models and stamped with
+    every migration. An existing one gets the pending migrations, exactly as
+    with `flask upgrade-db`. Does nothing when the database is already
+    current, unless forced.
+
+    Returns:
+        bool: True if anything was done
+    """
+    from app import models
+    from app.models.site_settings import SiteSettings
+
+    # Importing app.models registers every table; create_all() only creates registered ones
+    assert models.SchemaVersion.__tablename__ in db.metadata.tables
+
+    version = get_schema_version()
+    migrations = list_migrations()
+    latest = migrations[-1][0] if migrations else 0
+    if version is not None and version >= latest and not force:
+        return False
+
+    fresh = version is None and not inspect(db.engine).has_table('questions')
+    if fresh:
+        db.create_all()
+        for migration_version, name, module_name in migrations:
+            _record(migration_version, name)
+        db.session.commit()
+        log(f"Created a new database at schema version {latest}")
+    else:
+        run_migrations(batch_size=batch_size, log=log)
+    SiteSettings.init_settings()
+    return True
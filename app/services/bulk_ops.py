@@ -0,0 +1,238 @@
+"""
+Set-based bulk operations for the admin console.
+
+Tag merges and user deletions touch every row a tag or user owns, which for a
+popular tag or a prolific AI user means tens of thousands of rows. Instead of
+loading and changing them one ORM object at a time, these operations issue
+UPDATE ... WHERE, INSERT ... SELECT and DELETE statements over id batches,
+commit after each batch so locks are held briefly, and report progress
+through an optional callback.
+
+Statements are issued through Core, so the Comment and Vote events don't
+fire; the denormalized scores and thread statistics of the affected questions
+are recomputed from their source tables afterwards.
+"""
+import os
+from datetime import datetime
+from sqlalchemy import case, literal, select
+from app import db
+from app.models.tag import Tag, QuestionTag, user_tag
+from app.models.question import Question
+from app.models.comment import Comment, recalculate_question_stats
+from app.models.vote import Vote, recalculate_scores
+from app.models.user import User
+from app.models.reputation_event import ReputationEvent
+from app.models.population_job import PopulationUnit
+from app.services import page_cache
+
+# Rows changed per transaction
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', 2000))
+
+# Username of the account that keeps the soft-deleted content of deleted users
+DELETED_USERNAME = 'deleted_user'
+
+
+def _report(progress, step, done, total):
+    if progress:
+        progress(step, done, total)
+
+
+def _id_batches(column, condition, batch_size):
+    """Yield ascending batches of ids matching a condition, re-querying after each batch"""
+    last_id = 0
+    while True:
+        ids = [row[0] for row in db.session.execute(
+            select(column).where(condition, column > last_id).order_by(column).limit(batch_size)
+        )]
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def merge_tags(source_id, target_id, batch_size=BULK_BATCH_SIZE, progress=None):
+    """
+    Move every question and follower of one tag to another and delete the source tag
+
+    Questions that already have the target tag just lose the source tag, so
+    the uq_question_tag constraint is never hit.
+
+    Args:
+        source_id (int): Tag to merge away
+        target_id (int): Tag to merge into
+        batch_size (int): Question tags moved per transaction
+        progress (callable, optional): Called as progress(step, done, total)
+
+    Returns:
+        int: Number of questions that carried the source tag
+    """
+    table = QuestionTag.__table__
+    total = db.session.query(db.func.count(table.c.id)).filter(table.c.tag_id == source_id).scalar()
+    has_target = select(table.c.question_id).where(table.c.tag_id == target_id)
+
+    done = 0
+    for ids in _id_batches(table.c.id, table.c.tag_id == source_id, batch_size):
+        db.session.execute(table.delete().where(table.c.id.in_(ids), table.c.question_id.in_(has_target)))
+        db.session.execute(table.update().where(table.c.id.in_(ids)).values(tag_id=target_id))
+        db.session.commit()
+        done += len(ids)
+        _report(progress, 'question_tags', done, total)
+
+    # Followers of the source tag follow the target instead
+    already_following = select(user_tag.c.user_id).where(user_tag.c.tag_id == target_id)
+    db.session.execute(user_tag.insert().from_select(
+        ['user_id', 'tag_id'],
+        select(user_tag.c.user_id, literal(target_id)).where(
+            user_tag.c.tag_id == source_id, user_tag.c.user_id.not_in(already_following))
+    ))
+    db.session.execute(user_tag.delete().where(user_tag.c.tag_id == source_id))
+    db.session.execute(Tag.__table__.delete().where(Tag.__table__.c.id == source_id))
+    db.session.commit()
+    # Tag lists and pages are cached for anonymous visitors
+    page_cache.clear()
+    return total
+
+
+def get_deleted_user():
+    """Get the placeholder account that owns the content of deleted users, creating it if needed"""
+    user = User.query.filter_by(username=DELETED_USERNAME).first()
+    if not user:
+        user = User(username=DELETED_USERNAME, email=f'{DELETED_USERNAME}@overflew.invalid')
+        db.session.add(user)
+        db.session.commit()
+    return user
+
+
+def _reverse_vote_reputation(vote_ids):
+    """Record ledger events that take back the reputation the given votes gave"""
+    from app.services.vote_service import REPUTATION
+
+    def points(kind, vote_type):
+        return case((vote_type == 1, -REPUTATION[kind][1]), else_=-REPUTATION[kind][-1])
+
+    events = ReputationEvent.__table__
+    columns = ['user_id', 'points', 'reason', 'actor_id', 'question_id', 'comment_id', 'applied', 'created_at']
+    now = datetime.utcnow()
+    db.session.execute(events.insert().from_select(columns, select(
+        Question.user_id, points('question', Vote.vote_type), literal('vote'), Vote.user_id,
+        Vote.question_id, literal(None), literal(False), literal(now)
+    ).join(Question, Question.id == Vote.question_id).where(Vote.id.in_(vote_ids))))
+    db.session.execute(events.insert().from_select(columns, select(
+        Comment.user_id,
+        case((Comment.parent_comment_id.is_(None), points('answer', Vote.vote_type)),
+             else_=points('comment', Vote.vote_type)),
+        literal('vote'), Vote.user_id, literal(None), Vote.comment_id, literal(False), literal(now)
+    ).join(Comment, Comment.id == Vote.comment_id).where(Vote.id.in_(vote_ids))))
+
+
+def delete_user(user_id, batch_size=BULK_BATCH_SIZE, progress=None):
+    """
+    Delete a user, soft-deleting their content and removing their votes
+
+    Soft-deleted questions and comments keep the thread structure intact and
+    are handed to the placeholder account, since they can't point at a user
+    that no longer exists. Votes are removed and the reputation they awarded
+    is reversed through the ledger.
+
+    Args:
+        user_id (int): User to delete
+        batch_size (int): Rows changed per transaction
+        progress (callable, optional): Called as progress(step, done, total)
+
+    Returns:
+        dict: Number of questions, comments and votes affected
+    """
+    from app.services.duplicate_index import duplicate_index
+    from app.services.related_service import related_index
+
+    placeholder_id = get_deleted_user().id
+    counts = {}
+
+    # Votes: per batch, reverse their reputation, delete them and fix the scores they contributed to
+    # (before the content is handed over, so self-votes are reversed on the right account)
+    table = Vote.__table__
+    units = PopulationUnit.__table__
+    condition = table.c.user_id == user_id
+    total = db.session.query(db.func.count(table.c.id)).filter(condition).scalar()
+    done = 0
+    for ids in _id_batches(table.c.id, condition, batch_size):
+        voted = db.session.execute(
+            select(table.c.question_id, table.c.comment_id).where(table.c.id.in_(ids))).all()
+        _reverse_vote_reputation(ids)
+        db.session.execute(units.update().where(units.c.vote_id.in_(ids)).values(vote_id=None))
+        db.session.execute(table.delete().where(table.c.id.in_(ids)))
+        recalculate_scores(question_ids=sorted({q for q, c in voted if q is not None}),
+                           comment_ids=sorted({c for q, c in voted if c is not None}))
+        db.session.commit()
+        done += len(ids)
+        _report(progress, 'votes', done, total)
+    counts['votes'] = total
+
+    # Questions
+    table = Question.__table__
+    condition = table.c.user_id == user_id
+    total = db.session.query(db.func.count(table.c.id)).filter(condition).scalar()
+    done = 0
+    for ids in _id_batches(table.c.id, condition, batch_size):
+        db.session.execute(table.update().where(table.c.id.in_(ids)).values(
+            is_deleted=True, title='[deleted]', body='[deleted]', user_id=placeholder_id))
+        db.session.commit()
+        for question_id in ids:
+            duplicate_index.remove(question_id)
+            related_index.remove(question_id)
+        done += len(ids)
+        _report(progress, 'questions', done, total)
+    counts['questions'] = total
+
+    # Comments and answers, then the thread statistics of their questions
+    table = Comment.__table__
+    condition = table.c.user_id == user_id
+    total = db.session.query(db.func.count(table.c.id)).filter(condition).scalar()
+    done = 0
+    for ids in _id_batches(table.c.id, condition, batch_size):
+        question_ids = [row[0] for row in db.session.execute(
+            select(table.c.question_id).where(table.c.id.in_(ids)).distinct())]
+        db.session.execute(table.update().where(table.c.id.in_(ids)).values(
+            is_deleted=True, body='[deleted]', user_id=placeholder_id, updated_at=table.c.updated_at))
+        recalculate_question_stats(question_ids)
+        db.session.commit()
+        done += len(ids)
+        _report(progress, 'comments', done, total)
+    counts['comments'] = total
+
+    # The user's own ledger, follows and account
+    events = ReputationEvent.__table__
+    db.session.execute(events.delete().where(events.c.user_id == user_id))
+    db.session.execute(events.update().where(events.c.actor_id == user_id).values(actor_id=None))
+    db.session.execute(user_tag.delete().where(user_tag.c.user_id == user_id))
+    db.session.execute(User.__table__.delete().where(User.__table__.c.id == user_id))
+    db.session.commit()
+    # Core statements skip the User events, so drop the cached login directly
+    from app.services.user_cache import invalidate_user
+    invalidate_user(user_id)
+    page_cache.clear()
+    db.session.expire_all()
+    return counts
+
+
+def delete_ai_personality(personality_id, batch_size=BULK_BATCH_SIZE, progress=None):
+    """
+    Delete an AI personality and its AI users
+
+    Returns:
+        int: Number of AI users deleted
+    """
+    from app.models.ai_personality import AIPersonality
+
+    user_ids = [row[0] for row in db.session.query(User.id).filter(
+        User.ai_personality_id == personality_id, User.is_ai == True)]
+    for user_id in user_ids:
+        delete_user(user_id, batch_size=batch_size, progress=progress)
+    # Population units can't outlive their personality; other references are cleared
+    units = PopulationUnit.__table__
+    db.session.execute(units.delete().where(units.c.personality_id == personality_id))
+    db.session.execute(User.__table__.update().where(
+        User.__table__.c.ai_personality_id == personality_id).values(ai_personality_id=None))
+    db.session.execute(AIPersonality.__table__.delete().where(AIPersonality.__table__.c.id == personality_id))
+    db.session.commit()
+    return len(user_ids)
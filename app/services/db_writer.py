@@ -0,0 +1,86 @@
+"""
+Optional single database writer.
+
+With SQLITE_SINGLE_WRITER=1, background write batches (view counts, last_seen
+times, reputation aggregation, related-question refreshes) are handed to one
+dedicated thread instead of committing from whichever thread produced them.
+SQLite allows one writer at a time, so funnelling the batches through a single
+thread means they queue in Python rather than contend for the database lock,
+and WAL readers are never stalled behind a pile-up of busy writers.
+
+When the writer isn't running, run_write() simply calls the function inline.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from app import db
+
+SINGLE_WRITER = os.environ.get('SQLITE_SINGLE_WRITER', '0').lower() in ('1', 'true', 'yes')
+
+
+class DBWriter:
+    """A thread that executes submitted write functions one at a time, each in its own transaction"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, app):
+        with self._lock:
+            if self.running:
+                return
+            self._thread = threading.Thread(target=self._run, args=(app,), daemon=True, name='DBWriter')
+            self._thread.start()
+        app.logger.info('Single database writer started')
+
+    def submit(self, func, *args, **kwargs):
+        """Queue a write function; the returned Future resolves to its result once committed"""
+        future = Future()
+        self._queue.put((func, args, kwargs, future))
+        return future
+
+    def _run(self, app):
+        with app.app_context():
+            while True:
+                func, args, kwargs, future = self._queue.get()
+                try:
+                    result = func(*args, **kwargs)
+                    db.session.commit()
+                    future.set_result(result)
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Error in database write {func.__name__}: {str(e)}")
+                    future.set_exception(e)
+                finally:
+                    # Each batch starts from a clean identity map
+                    db.session.remove()
+                    self._queue.task_done()
+
+
+writer = DBWriter()
+
+
+def run_write(func, *args, **kwargs):
+    """
+    Run a write function on the single writer thread if it's running, else inline
+
+    Waits for the write to commit and returns the function's result. The
+    function must load what it needs by id; ORM objects from the caller's
+    session can't be used on the writer thread.
+    """
+    if writer.running and threading.current_thread() is not writer._thread:
+        return writer.submit(func, *args, **kwargs).result()
+    return func(*args, **kwargs)
+
+
+def start_writer(app):
+    """Start the single writer if it's enabled and the database is SQLite"""
+    from app.database import is_sqlite
+    if SINGLE_WRITER and is_sqlite(app.config.get('SQLALCHEMY_DATABASE_URI')):
+        writer.start(app)
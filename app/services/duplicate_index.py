@@ -0,0 +1,203 @@
+"""
+Near-duplicate question detection.
+
+Questions are summarized as MinHash signatures over word and word-pair
+shingles, and bucketed with locality-sensitive hashing (LSH) so candidate
+duplicates are found without comparing against every question. Two indexes are
+kept: one over titles, tuned for recall, backs the suggestions shown while
+typing; one over title and body, tuned for precision, decides whether a new
+question can reuse an existing answered thread.
+
+The indexes live in memory. Each process loads them on first use and then
+catches up incrementally by question id, so questions posted through other
+workers are picked up without a rebuild. Edits and deletions are applied to
+the index of the process that handled them.
+"""
+import os
+import re
+import zlib
+import threading
+import numpy as np
+from app import db
+
+# Minimum estimated similarity for live suggestions while typing a title
+SUGGEST_THRESHOLD = float(os.environ.get('DUPLICATE_SUGGEST_THRESHOLD', 0.25))
+# Minimum estimated similarity for a new question to reuse an existing thread
+DUPLICATE_THRESHOLD = float(os.environ.get('DUPLICATE_THRESHOLD', 0.7))
+
+NUM_PERM = 64
+# Multiply-shift hash family: (a * x + b) mod 2**64, keeping the high 32 bits
+_rng = np.random.RandomState(20240601)
+_A = _rng.randint(0, 1 << 32, size=(2, NUM_PERM)).astype(np.uint64)
+_A = (_A[0] << np.uint64(32)) | _A[1] | np.uint64(1)
+_B = _rng.randint(0, 1 << 32, size=(2, NUM_PERM)).astype(np.uint64)
+_B = (_B[0] << np.uint64(32)) | _B[1]
+_SHIFT = np.uint64(32)
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#]*")
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in is it its
+me my of on or so that the this to was what when where which who why will with
+""".split())
+
+
+def shingles(text, pairs=True):
+    """Word shingles of a text, plus word pairs unless pairs is False"""
+    tokens = [t for t in TOKEN_RE.findall((text or '').lower()) if t not in STOPWORDS]
+    result = set(tokens)
+    if pairs:
+        result.update(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+    return result
+
+
+def signature(text, pairs=True):
+    """MinHash signature of a text, or None if it has no shingles"""
+    items = shingles(text, pairs)
+    if not items:
+        return None
+    # crc32 is stable across processes, unlike hash()
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in items), dtype=np.uint64, count=len(items))
+    # uint64 arithmetic wraps, which is exactly the mod 2**64 the hash needs
+    return ((np.outer(_A, hashes) + _B[:, None]) >> _SHIFT).min(axis=1)
+
+
+class MinHashIndex:
+    """LSH buckets over MinHash signatures; more bands favour recall, more rows precision"""
+
+    def __init__(self, bands, rows):
+        assert bands * rows == NUM_PERM
+        self.bands = bands
+        self.rows = rows
+        self.signatures = {}
+        self.buckets = [dict() for _ in range(bands)]
+
+    def _keys(self, sig):
+        for band in range(self.bands):
+            yield band, sig[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, item_id, sig):
+        self.remove(item_id)
+        if sig is None:
+            return
+        self.signatures[item_id] = sig
+        for band, key in self._keys(sig):
+            self.buckets[band].setdefault(key, set()).add(item_id)
+
+    def remove(self, item_id):
+        sig = self.signatures.pop(item_id, None)
+        if sig is None:
+            return
+        for band, key in self._keys(sig):
+            bucket = self.buckets[band].get(key)
+            if bucket:
+                bucket.discard(item_id)
+                if not bucket:
+                    del self.buckets[band][key]
+
+    def query(self, sig, limit=5, min_similarity=0.0, exclude_id=None):
+        """
+        Find indexed items similar to a signature
+
+        Returns:
+            list: (item_id, estimated Jaccard similarity) pairs, best first
+        """
+        if sig is None:
+            return []
+        candidates = set()
+        for band, key in self._keys(sig):
+            candidates.update(self.buckets[band].get(key, ()))
+        candidates.discard(exclude_id)
+        if not candidates:
+            return []
+
+        ids = list(candidates)
+        matrix = np.stack([self.signatures[i] for i in ids])
+        similarity = (matrix == sig).mean(axis=1)
+        order = np.argsort(-similarity)
+        return [(ids[i], float(similarity[i])) for i in order[:limit] if similarity[i] >= min_similarity]
+
+
+class DuplicateIndex:
+    """Title and full-text MinHash indexes over all live questions"""
+
+    def __init__(self):
+        self.titles = MinHashIndex(bands=32, rows=2)
+        self.documents = MinHashIndex(bands=16, rows=4)
+        self.max_id = 0
+        self._lock = threading.Lock()
+
+    def _add(self, question_id, title, body):
+        # Titles are short and typed in any order, so they use single words only
+        self.titles.add(question_id, signature(title, pairs=False))
+        self.documents.add(question_id, signature(f"{title} {body}"))
+
+    def sync(self):
+        """Index questions created since the last sync (all of them on first use)"""
+        from app.models.question import Question
+
+        rows = db.session.query(Question.id, Question.title, Question.body).filter(
+            Question.id > self.max_id,
+            Question.is_deleted == False
+        ).order_by(Question.id).all()
+        if not rows:
+            return
+        with self._lock:
+            for question_id, title, body in rows:
+                self._add(question_id, title, body)
+            self.max_id = max(self.max_id, rows[-1][0])
+
+    def add(self, question):
+        """Index a new or edited question"""
+        with self._lock:
+            if question.is_deleted:
+                self._remove(question.id)
+            else:
+                self._add(question.id, question.title, question.body)
+
+    def _remove(self, question_id):
+        self.titles.remove(question_id)
+        self.documents.remove(question_id)
+
+    def remove(self, question_id):
+        with self._lock:
+            self._remove(question_id)
+
+    def suggest(self, title, limit=5, exclude_id=None):
+        """Questions with titles similar to a partially typed title"""
+        self.sync()
+        with self._lock:
+            return self.titles.query(signature(title, pairs=False), limit=limit,
+                                     min_similarity=SUGGEST_THRESHOLD, exclude_id=exclude_id)
+
+    def find_duplicates(self, title, body, limit=5, min_similarity=DUPLICATE_THRESHOLD, exclude_id=None):
+        """Questions whose title and body closely match"""
+        self.sync()
+        with self._lock:
+            return self.documents.query(signature(f"{title} {body}"), limit=limit,
+                                        min_similarity=min_similarity, exclude_id=exclude_id)
+
+
+duplicate_index = DuplicateIndex()
+
+
+def find_reusable_thread(question):
+    """
+    Find an existing answered thread that a new question duplicates
+
+    Returns:
+        tuple: (Question, similarity) or (None, 0.0)
+    """
+    from app.models.question import Question
+    from app.models.comment import Comment
+
+    for question_id, similarity in duplicate_index.find_duplicates(
+            question.title, question.body, exclude_id=question.id):
+        original = Question.query.get(question_id)
+        if not original or original.is_deleted or original.duplicate_of_id:
+            continue
+        has_answer = Comment.query.filter_by(
+            question_id=original.id, parent_comment_id=None, is_deleted=False
+        ).first() is not None
+        if has_answer:
+            return original, similarity
+    return None, 0.0
@@ -0,0 +1,48 @@
+"""
+Rendered template fragments shared between requests and users.
+
+Templates wrap expensive markup in a call block:
+
+    {% call fragment_cache('comment', comment.id, comment.updated_at, comment.score) %}
+        ...
+    {% endcall %}
+
+The key parts must cover everything the markup depends on, so an entry is
+never invalidated: an edit or a vote changes the key and the old entry just
+ages out of the LRU. Per-user state (vote highlighting, who may delete) is
+kept out of the fragment and applied in the browser from a small overlay the
+page embeds. The CSRF token of reply forms is stored as a placeholder and
+filled in with the visitor's own token on every use.
+"""
+import os
+from flask import g
+from flask_wtf.csrf import generate_csrf
+from markupsafe import Markup
+from app.services.page_cache import MemoryStore, CSRF_PLACEHOLDER
+
+FRAGMENT_CACHE_ENABLED = os.environ.get('FRAGMENT_CACHE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+# Fragments kept in memory, per process
+FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE', 5000))
+
+_fragments = MemoryStore(FRAGMENT_CACHE_SIZE)
+
+
+def fragment_cache(*key, caller):
+    """Jinja call block: render the body once per key and reuse the HTML"""
+    if not FRAGMENT_CACHE_ENABLED:
+        return caller()
+    key = ':'.join(str(part) for part in key)
+    html = _fragments.get(key)
+    if html is None:
+        html = str(caller())
+        token = g.get('csrf_token')
+        if token:
+            html = html.replace(token, CSRF_PLACEHOLDER)
+        _fragments.set(key, html)
+    if CSRF_PLACEHOLDER in html:
+        html = html.replace(CSRF_PLACEHOLDER, generate_csrf())
+    return Markup(html)
+
+
+def init_fragment_cache(app):
+    app.jinja_env.globals['fragment_cache'] = fragment_cache
@@ -1,34 +1,303 @@
 import os
-import openai
 import threading
 import queue
 import time
-from flask import current_app
+from collections import OrderedDict, deque
+from flask import current_app, has_request_context
 from concurrent.futures import ThreadPoolExecutor
 
-# Configure OpenAI client with environment variables
-openai.api_key = os.environ.get('OPENAI_API_KEY')
-
-# Set base URL if provided in environment
-base_url = os.environ.get('OPENAI_BASE_URL')
-if base_url:
-    openai.api_base = base_url
+# OpenAI clients are created on first use, one per API key and base URL;
+# importing the openai package is kept off the startup path
+_clients = {}
+_clients_lock = threading.Lock()
 
 # Create a ThreadPoolExecutor for concurrent LLM tasks
 # Using ThreadPoolExecutor instead of manual thread management for better performance
 MAX_WORKERS = int(os.environ.get('MAX_LLM_WORKERS', 3))
-executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+# The parallel executor can be larger than the worker pool because the
+# per-endpoint limiters below decide how many requests actually hit a backend
+MAX_PARALLEL_WORKERS = int(os.environ.get('MAX_PARALLEL_LLM_WORKERS', 16))
+# Maximum number of parallel tasks waiting for an executor thread
+MAX_PARALLEL_PENDING = int(os.environ.get('MAX_PARALLEL_LLM_PENDING', 64))
+executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_WORKERS)
+
+# Priority levels for LLM work (lower number = more important)
+PRIORITY_INTERACTIVE = 0  # A human is waiting for the result
+PRIORITY_BULK = 1         # Background work such as thread population
+PRIORITY_LOW = 2          # Nice-to-have work such as vote reactions
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_BULK: 'bulk',
+    PRIORITY_LOW: 'low',
+}
+
+# Adaptive concurrency settings, applied to every LLM endpoint separately
+ENDPOINT_INITIAL_CONCURRENCY = int(os.environ.get('LLM_ENDPOINT_INITIAL_CONCURRENCY', 4))
+ENDPOINT_MIN_CONCURRENCY = int(os.environ.get('LLM_ENDPOINT_MIN_CONCURRENCY', 1))
+ENDPOINT_MAX_CONCURRENCY = int(os.environ.get('LLM_ENDPOINT_MAX_CONCURRENCY', 64))
+# Number of requests allowed to wait for a slot before bulk work is shed
+ENDPOINT_MAX_QUEUE = int(os.environ.get('LLM_ENDPOINT_MAX_QUEUE', 32))
+# Latency (seconds) above which an endpoint is considered overloaded
+ENDPOINT_TARGET_LATENCY = float(os.environ.get('LLM_TARGET_LATENCY', 30))
+# Maximum time (seconds) a request waits for a slot before giving up
+ENDPOINT_QUEUE_TIMEOUT = float(os.environ.get('LLM_QUEUE_TIMEOUT', 120))
 
-# Task queue for managing LLM requests
-task_queue = queue.Queue()
 # Flag to indicate if workers are running
 workers_running = False
-# Lock for synchronizing access to workers_running
-worker_lock = threading.Lock()
+# Lock for synchronizing access to workers_running (re-entrant because
+# queue_task holds it while calling init_workers)
+worker_lock = threading.RLock()
 # List to store worker threads
 workers = []
+# Number of parallel tasks submitted to the executor but not finished yet
+parallel_pending = 0
+parallel_lock = threading.Lock()
+
 
-def get_completion(prompt, max_tokens=4096, model=None, api_key=None, base_url=None):
+class EndpointLimiter:
+    """
+    AIMD concurrency limiter for a single LLM endpoint.
+
+    The in-flight limit grows by roughly one slot per window of successful,
+    fast completions and is cut multiplicatively on errors or slow responses.
+    Waiting requests are admitted in priority order, and low priority work is
+    shed instead of queued when the endpoint is saturated.
+    """
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.limit = float(ENDPOINT_INITIAL_CONCURRENCY)
+        self.in_flight = 0
+        self.waiting = {priority: 0 for priority in PRIORITY_NAMES}
+        self.condition = threading.Condition()
+        self.latency_ewma = None
+        self.last_decrease = 0.0
+        self.completed = 0
+        self.errors = 0
+        self.shed = 0
+
+    def _has_capacity(self, priority):
+        """Check whether a request of the given priority may start now"""
+        if self.in_flight >= int(self.limit):
+            return False
+        # More important waiters always go first
+        return not any(self.waiting[p] for p in PRIORITY_NAMES if p < priority)
+
+    def is_saturated(self):
+        """Return True if every slot is busy"""
+        with self.condition:
+            return self.in_flight >= int(self.limit)
+
+    def acquire(self, priority=PRIORITY_BULK, timeout=ENDPOINT_QUEUE_TIMEOUT):
+        """
+        Wait for a free slot on this endpoint
+
+        Returns:
+            bool: True if a slot was acquired, False if the request was shed
+        """
+        deadline = time.time() + timeout
+        with self.condition:
+            if not self._has_capacity(priority):
+                queued = sum(self.waiting.values())
+                # Shed low priority work as soon as the backend is saturated,
+                # and bulk work once the wait queue is full
+                if priority >= PRIORITY_LOW or (priority == PRIORITY_BULK and queued >= ENDPOINT_MAX_QUEUE):
+                    self.shed += 1
+                    return False
+
+            self.waiting[priority] += 1
+            try:
+                while not self._has_capacity(priority):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self.shed += 1
+                        return False
+                    self.condition.wait(remaining)
+                self.in_flight += 1
+                return True
+            finally:
+                self.waiting[priority] -= 1
+                # Lower priority waiters may be able to proceed now
+                self.condition.notify_all()
+
+    def release(self, latency, success):
+        """Release a slot and adapt the limit from the observed outcome"""
+        with self.condition:
+            self.in_flight -= 1
+            now = time.time()
+
+            if success:
+                self.completed += 1
+                if self.latency_ewma is None:
+                    self.latency_ewma = latency
+                else:
+                    self.latency_ewma = 0.8 * self.latency_ewma + 0.2 * latency
+            else:
+                self.errors += 1
+
+            overloaded = not success or latency > ENDPOINT_TARGET_LATENCY
+            if overloaded:
+                # Only back off once per round trip so a burst of failures
+                # from the same window doesn't collapse the limit to the floor
+                cooldown = self.latency_ewma or 1.0
+                if now - self.last_decrease >= cooldown:
+                    factor = 0.5 if not success else 0.75
+                    self.limit = max(float(ENDPOINT_MIN_CONCURRENCY), self.limit * factor)
+                    self.last_decrease = now
+            else:
+                # Additive increase: about one extra slot per window of completions
+                self.limit = min(float(ENDPOINT_MAX_CONCURRENCY), self.limit + 1.0 / self.limit)
+
+            self.condition.notify_all()
+
+    def stats(self):
+        """Return a snapshot of the limiter state"""
+        with self.condition:
+            return {
+                'endpoint': self.endpoint,
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'waiting': {PRIORITY_NAMES[p]: n for p, n in self.waiting.items()},
+                'latency_ewma': round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+                'completed': self.completed,
+                'errors': self.errors,
+                'shed': self.shed,
+            }
+
+
+class TaskScheduler:
+    """
+    Priority-aware task queue with per-key fairness.
+
+    Tasks are always served from the most important non-empty priority level,
+    so interactive work jumps ahead of anything already queued. Within a level,
+    tasks are grouped by a fairness key (usually the question id) and the
+    groups are served round-robin, so one large thread population can't
+    starve the other questions waiting behind it.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.levels = {priority: OrderedDict() for priority in PRIORITY_NAMES}
+        self.unfinished = 0
+
+    def put(self, task, priority=PRIORITY_BULK, key=None):
+        """Add a (func, args, kwargs) task to the queue"""
+        with self.condition:
+            groups = self.levels.setdefault(priority, OrderedDict())
+            groups.setdefault(key, deque()).append(task)
+            self.unfinished += 1
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Remove and return the next task as a (priority, task) tuple
+
+        Raises:
+            queue.Empty: If no task became available within the timeout
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        with self.condition:
+            while True:
+                for priority in sorted(self.levels):
+                    groups = self.levels[priority]
+                    if not groups:
+                        continue
+                    key, tasks = next(iter(groups.items()))
+                    task = tasks.popleft()
+                    # Move this key to the back so other keys get a turn
+                    del groups[key]
+                    if tasks:
+                        groups[key] = tasks
+                    return priority, task
+
+                if deadline is None:
+                    self.condition.wait()
+                else:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self.condition.wait(remaining)
+
+    def task_done(self):
+        """Mark a task returned by get() as finished"""
+        with self.condition:
+            self.unfinished -= 1
+            if self.unfinished <= 0:
+                self.condition.notify_all()
+
+    def join(self):
+        """Block until every queued task has been processed"""
+        with self.condition:
+            while self.unfinished > 0:
+                self.condition.wait()
+
+    def stats(self):
+        """Return the number of queued tasks and keys per priority level"""
+        with self.condition:
+            return {
+                PRIORITY_NAMES.get(priority, priority): {
+                    'tasks': sum(len(tasks) for tasks in groups.values()),
+                    'keys': len(groups),
+                }
+                for priority, groups in self.levels.items()
+            }
+
+
+# Task queue for managing LLM requests
+task_queue = TaskScheduler()
+
+# Per-thread context for the task currently being executed, so LLM calls made
+# deep inside a task inherit the task's priority
+task_context = threading.local()
+
+
+def current_priority():
+    """Get the priority for LLM calls made from the current thread"""
+    priority = getattr(task_context, 'priority', None)
+    if priority is not None:
+        return priority
+    # Calls made directly while handling a request have a human waiting on them
+    if has_request_context():
+        return PRIORITY_INTERACTIVE
+    return PRIORITY_BULK
+
+
+# One limiter per endpoint (base URL), created on first use
+endpoint_limiters = {}
+endpoint_limiters_lock = threading.Lock()
+
+
+def get_endpoint_limiter(base_url=None):
+    """Get the concurrency limiter for an endpoint, creating it if needed"""
+    endpoint = base_url or os.environ.get('OPENAI_BASE_URL') or 'default'
+    with endpoint_limiters_lock:
+        limiter = endpoint_limiters.get(endpoint)
+        if limiter is None:
+            limiter = EndpointLimiter(endpoint)
+            endpoint_limiters[endpoint] = limiter
+        return limiter
+
+
+def get_endpoint_stats():
+    """Get a snapshot of every endpoint limiter"""
+    with endpoint_limiters_lock:
+        limiters = list(endpoint_limiters.values())
+    return [limiter.stats() for limiter in limiters]
+
+
+def get_client(api_key=None, base_url=None):
+    """Get the OpenAI client for an API key and base URL, creating it on first use"""
+    key = (api_key, base_url)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            import openai
+            client = _clients[key] = openai.OpenAI(api_key=api_key, base_url=base_url or None)
+        return client
+
+
+def get_completion(prompt, max_tokens=4096, model=None, api_key=None, base_url=None, priority=None):
     """
     Get a completion from the LLM
     
@@ -38,10 +307,28 @@ def get_completion(prompt, max_tokens=4096, model=None, api_key=None, base_url=N
         model (str): The model to use (defaults to environment variable or fallback)
         api_key (str): Optional custom API key
         base_url (str): Optional custom base URL
+        priority (int): Scheduling priority used when the endpoint is saturated
+            (defaults to the priority of the task or request making the call)
         
     Returns:
-        str: The LLM's response text
+        str: The LLM's response text, or None if the request failed or was shed
     """
+    # Configure client with custom or default settings
+    client_api_key = api_key or os.environ.get('OPENAI_API_KEY')
+    client_base_url = base_url or os.environ.get('OPENAI_BASE_URL')
+    
+    if priority is None:
+        priority = current_priority()
+    
+    # Wait for a free slot on this endpoint, or give up if it's saturated
+    limiter = get_endpoint_limiter(client_base_url)
+    if not limiter.acquire(priority):
+        current_app.logger.warning(
+            f"LLM endpoint {limiter.endpoint} saturated, shedding {PRIORITY_NAMES.get(priority, priority)} request")
+        return None
+    
+    started = time.time()
+    success = False
     try:
         # Use model from environment or fallback to default
         model_name = model or os.environ.get('OPENAI_MODEL', 'gpt-3.5-turbo-instruct')
@@ -49,17 +336,11 @@ def get_completion(prompt, max_tokens=4096, model=None, api_key=None, base_url=N
         # Log the request to help debug
         current_app.logger.info(f"Sending request to LLM with model {model_name}")
         
-        # Configure client with custom or default settings
-        client_api_key = api_key or os.environ.get('OPENAI_API_KEY')
-        client_base_url = base_url or os.environ.get('OPENAI_BASE_URL')
-        
-        # Set up the client configuration
-        openai.api_key = client_api_key
-        if client_base_url:
-            openai.api_base = client_base_url
+        # Clients are per endpoint, so concurrent calls can't change each other's key or base URL
+        client = get_client(client_api_key, client_base_url)
         
         # Make API call using the OpenAI API format
-        response = openai.Completion.create(
+        response = client.completions.create(
             model=model_name,
             prompt=prompt,
             max_tokens=max_tokens,
@@ -68,12 +349,17 @@ def get_completion(prompt, max_tokens=4096, model=None, api_key=None, base_url=N
         )
         
         current_app.logger.info(f"Received response from LLM with {len(response.choices[0].text)} characters")
+        success = True
         
         # Return the response text
         return response.choices[0].text.strip()
     except Exception as e:
         current_app.logger.error(f"Error in LLM completion: {str(e)}")
-        return f"I apologize, but I'm having trouble generating a response right now."
+        # Callers skip posting when there's no text, so a failing backend
+        # never turns into a thread full of apology comments
+        return None
+    finally:
+        limiter.release(time.time() - started, success)
 
 def worker_loop(app):
     """Process tasks from the queue in a loop"""
@@ -95,14 +381,15 @@ def worker_loop(app):
                 
                 # Try to get a task from the queue
                 try:
-                    task_func, args, kwargs = task_queue.get(timeout=0.5)
-                    app.logger.info(f"Processing task {task_func.__name__}")
+                    priority, (task_func, args, kwargs) = task_queue.get(timeout=0.5)
+                    app.logger.info(f"Processing {PRIORITY_NAMES.get(priority, priority)} task {task_func.__name__}")
                     print(f"Processing task {task_func.__name__}")
                 except queue.Empty:
                     # If no task is available, try again
                     continue
                 
                 # Execute the task
+                task_context.priority = priority
                 try:
                     task_func(*args, **kwargs)
                     app.logger.info(f"Task {task_func.__name__} completed")
@@ -110,6 +397,8 @@ def worker_loop(app):
                 except Exception as e:
                     app.logger.error(f"Error executing task {task_func.__name__}: {str(e)}")
                     print(f"Error executing task {task_func.__name__}: {str(e)}")
+                finally:
+                    task_context.priority = None
                 
                 # Mark the task as done
                 task_queue.task_done()
@@ -153,26 +442,32 @@ def shutdown_workers():
     # Shutdown the executor
     executor.shutdown(wait=False)
 
-def process_in_thread(app, func, *args, **kwargs):
+def process_in_thread(app, func, *args, priority=PRIORITY_INTERACTIVE, **kwargs):
     """Execute a function in a separate thread with app context"""
+    global parallel_pending
+    
     def run_with_context():
+        global parallel_pending
         with app.app_context():
+            task_context.priority = priority
             try:
-                print(f"Executing {func.__name__} in thread")
-                app.logger.info(f"Executing {func.__name__} in thread")
+                app.logger.debug(f"Executing {func.__name__} in thread")
                 result = func(*args, **kwargs)
-                print(f"Successfully completed {func.__name__} in thread")
-                app.logger.info(f"Successfully completed {func.__name__} in thread")
+                app.logger.debug(f"Successfully completed {func.__name__} in thread")
                 return result
             except Exception as e:
-                error_msg = f"Error executing {func.__name__} in thread: {str(e)}"
-                print(error_msg)
-                app.logger.error(error_msg)
+                app.logger.error(f"Error executing {func.__name__} in thread: {str(e)}")
                 # Re-raise the exception so the executor can handle it
                 raise
+            finally:
+                task_context.priority = None
+                with parallel_lock:
+                    parallel_pending -= 1
                 
     # Submit the task to the executor
-    print(f"Submitting {func.__name__} to thread executor")
+    app.logger.debug(f"Submitting {func.__name__} to thread executor")
+    with parallel_lock:
+        parallel_pending += 1
     return executor.submit(run_with_context)
 
 def queue_task(task_func, *args, **kwargs):
@@ -182,15 +477,25 @@ def queue_task(task_func, *args, **kwargs):
     Args:
         task_func: Function to execute
         *args, **kwargs: Arguments to pass to the function
+        
+    Special kwargs (not passed to the function):
+        parallel (bool): Run in the parallel executor instead of the worker queue.
+            Only honoured for interactive and low priority tasks; bulk work always
+            goes through the scheduler so it can't crowd out interactive tasks
+        priority (int): PRIORITY_INTERACTIVE, PRIORITY_BULK or PRIORITY_LOW
+        key: Fairness key (usually the question id) for round-robin scheduling
     """
     global workers_running
     
     parallel = kwargs.pop('parallel', False)
-    print(f"Queue task: {task_func.__name__}, parallel={parallel}")
+    priority = kwargs.pop('priority', PRIORITY_BULK)
+    key = kwargs.pop('key', None)
     
     try:
         # Get current Flask app
         app = current_app._get_current_object()
+        app.logger.debug(f"Queue task: {task_func.__name__}, parallel={parallel}, "
+                         f"priority={PRIORITY_NAMES.get(priority, priority)}")
         
         # Make sure workers are running
         with worker_lock:
@@ -200,15 +505,26 @@ def queue_task(task_func, *args, **kwargs):
                 init_workers(app)
         
         # If parallel execution is requested, run directly in a separate thread
-        if parallel:
-            app.logger.info(f"Executing task in parallel: {task_func.__name__}")
-            print(f"Executing task in parallel: {task_func.__name__}")
-            return process_in_thread(app, task_func, *args, **kwargs)
+        # as long as the executor backlog is bounded
+        if parallel and priority != PRIORITY_BULK:
+            with parallel_lock:
+                backlog_full = parallel_pending >= MAX_PARALLEL_PENDING
+            
+            if not backlog_full:
+                app.logger.debug(f"Executing task in parallel: {task_func.__name__}")
+                return process_in_thread(app, task_func, *args, priority=priority, **kwargs)
+            
+            if priority >= PRIORITY_LOW:
+                # Low priority work is dropped rather than piling up behind a saturated backend
+                app.logger.warning(f"Parallel backlog full, shedding low priority task {task_func.__name__}")
+                return None
+            
+            # Defer everything else to the worker queue
+            app.logger.info(f"Parallel backlog full, deferring {task_func.__name__} to worker queue")
         
         # Otherwise add to queue for worker threads to process
-        app.logger.info(f"Task queued: {task_func.__name__}")
-        print(f"Task queued: {task_func.__name__}")
-        task_queue.put((task_func, args, kwargs))
+        app.logger.debug(f"Task queued: {task_func.__name__}")
+        task_queue.put((task_func, args, kwargs), priority=priority, key=key)
             
     except Exception as e:
         try:
@@ -217,3 +533,20 @@ def queue_task(task_func, *args, **kwargs):
         except:
             # If we can't access current_app, just print
             print(f"Error queueing task: {str(e)}")
+
+def queue_task_later(delay, task_func, *args, **kwargs):
+    """
+    Queue a task after a delay (in seconds), e.g. to retry once a busy backend recovers
+    
+    Accepts the same arguments as queue_task.
+    """
+    app = current_app._get_current_object()
+    
+    def enqueue():
+        with app.app_context():
+            queue_task(task_func, *args, **kwargs)
+    
+    timer = threading.Timer(delay, enqueue)
+    timer.daemon = True
+    timer.start()
+    return timer
@@ -0,0 +1,326 @@
+"""
+Response cache for anonymous traffic.
+
+Views decorated with cached_page() are rendered once per TTL for anonymous
+visitors and crawlers, then served from the cache without touching the
+database. The cache key is the path plus the query arguments the view reads
+(other arguments can't be used to bust the cache). Responses carry an ETag
+and Last-Modified, so revalidating clients get a 304 with no body.
+
+Entries are tagged ('questions', 'question:<id>', 'users'). Committing a
+change to a question, comment, vote, tag or user invalidates the matching
+tags: every session's flushed objects are collected and invalidated after
+the commit, and Core writes (batched votes) call invalidate_on_commit(). An
+entry is stale if any of its tags was invalidated after its render started,
+so a render racing a write is never stored as fresh. Other Core writes (view
+counts, the reputation aggregator) are picked up when the TTL expires.
+
+The CSRF token rendered into a page is swapped for a placeholder when the
+page is stored and for the visitor's own token when it is served.
+
+By default the cache is an in-process LRU. Set PAGE_CACHE_DIR to share one
+cache, and its invalidations, between all the worker processes on a host
+through files in that directory.
+
+cached_fragment() memoizes smaller JSON-serializable values (such as the
+site statistics) in the same store, for every visitor.
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+from itertools import chain
+from urllib.parse import urlencode
+from flask import g, make_response, request, session
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app.models.question import Question
+from app.models.comment import Comment
+from app.models.vote import Vote
+from app.models.user import User
+from app.models.tag import Tag, QuestionTag
+from app.models.ai_personality import AIPersonality
+
+PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', '1').lower() in ('1', 'true', 'yes')
+# Entries kept by the in-process cache
+PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 1000))
+# Directory of a cache shared by the worker processes (in-process if unset)
+PAGE_CACHE_DIR = os.environ.get('PAGE_CACHE_DIR')
+# Longest TTL allowed; invalidations older than this can be forgotten
+MAX_TTL = 3600
+# Seconds between sweeps of expired files in the shared cache
+SWEEP_INTERVAL = 300
+
+CSRF_PLACEHOLDER = '__page_cache_csrf_token__'
+# Invalidating this tag invalidates everything
+ALL = '*'
+PENDING_KEY = 'page_cache_tags'
+
+
+class MemoryStore:
+    """LRU of entries and invalidation times, private to this process"""
+
+    def __init__(self, size=PAGE_CACHE_SIZE):
+        self.size = size
+        self._entries = OrderedDict()
+        self._invalidated = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidated_at(self, tag):
+        return self._invalidated.get(tag, 0)
+
+    def invalidate(self, tags, when):
+        with self._lock:
+            for tag in tags:
+                self._invalidated[tag] = when
+            if len(self._invalidated) > self.size * 10:
+                # Entries rendered before the cutoff have expired anyway
+                cutoff = when - MAX_TTL
+                self._invalidated = {tag: at for tag, at in self._invalidated.items() if at >= cutoff}
+
+
+class FileStore:
+    """Entries as JSON files and invalidation times as file mtimes, shared by every process using the directory"""
+
+    def __init__(self, directory):
+        self.pages = os.path.join(directory, 'pages')
+        self.tags = os.path.join(directory, 'tags')
+        os.makedirs(self.pages, exist_ok=True)
+        os.makedirs(self.tags, exist_ok=True)
+        self._swept = time.time()
+
+    @staticmethod
+    def _name(value):
+        return hashlib.sha1(value.encode()).hexdigest()
+
+    def get(self, key):
+        try:
+            with open(os.path.join(self.pages, self._name(key) + '.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, entry):
+        fd, tmp = tempfile.mkstemp(dir=self.pages, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp, os.path.join(self.pages, self._name(key) + '.json'))
+        if time.time() - self._swept > SWEEP_INTERVAL:
+            self.sweep()
+
+    def invalidated_at(self, tag):
+        try:
+            return os.stat(os.path.join(self.tags, self._name(tag))).st_mtime
+        except OSError:
+            return 0
+
+    def invalidate(self, tags, when):
+        for tag in tags:
+            path = os.path.join(self.tags, self._name(tag))
+            with open(path, 'a'):
+                pass
+            os.utime(path, (when, when))
+
+    def sweep(self):
+        """Delete expired entries and invalidations older than any entry could be"""
+        now = self._swept = time.time()
+        for directory, max_age in ((self.pages, MAX_TTL), (self.tags, MAX_TTL)):
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                try:
+                    if now - os.stat(path).st_mtime > max_age:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = FileStore(PAGE_CACHE_DIR) if PAGE_CACHE_DIR else MemoryStore()
+    return _store
+
+
+def invalidate(*tags):
+    """Mark every entry with one of the tags as stale"""
+    if tags:
+        get_store().invalidate(set(tags), time.time())
+
+
+def clear():
+    """Mark every entry as stale, in every process sharing the cache"""
+    invalidate(ALL)
+
+
+def invalidate_on_commit(*tags):
+    """Invalidate tags once the current transaction commits (for writes that bypass the ORM)"""
+    from app import db
+    db.session.info.setdefault(PENDING_KEY, set()).update(tags)
+
+
+def _is_fresh(entry, now):
+    if entry is None or entry['expires'] <= now:
+        return False
+    store = get_store()
+    return all(store.invalidated_at(tag) < entry['rendered_at'] for tag in chain(entry['tags'], [ALL]))
+
+
+def cached_fragment(key, ttl, tags, build):
+    """
+    Get a JSON-serializable value from the cache, building and storing it when missing or stale
+
+    Args:
+        key (str): Name of the fragment
+        ttl (int): Seconds the value may be served
+        tags (iterable): Tags whose invalidation makes the value stale
+        build (callable): Computes the value
+    """
+    if not PAGE_CACHE_ENABLED:
+        return build()
+    key = f'fragment:{key}'
+    now = time.time()
+    entry = get_store().get(key)
+    if _is_fresh(entry, now):
+        return entry['value']
+    value = build()
+    get_store().set(key, {'value': value, 'rendered_at': now, 'expires': now + min(ttl, MAX_TTL),
+                          'tags': list(tags)})
+    return value
+
+
+def _cacheable_request():
+    return (PAGE_CACHE_ENABLED and request.method in ('GET', 'HEAD')
+            and not current_user.is_authenticated and '_flashes' not in session)
+
+
+def _page_key(args):
+    values = sorted((name, value) for name in args for value in request.args.getlist(name))
+    return f'page:{request.path}?{urlencode(values)}'
+
+
+def _respond(entry, body, status):
+    response = make_response(body)
+    response.mimetype = entry['mimetype']
+    response.set_etag(entry['etag'])
+    response.last_modified = datetime.fromtimestamp(entry['rendered_at'], timezone.utc)
+    # Revalidate every time; the page embeds the visitor's CSRF token, so shared caches must not keep it
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.headers['X-Page-Cache'] = status
+    return response.make_conditional(request)
+
+
+def cached_page(ttl, args=(), tags=(), on_hit=None):
+    """
+    Serve a view's anonymous GET responses from the page cache
+
+    Args:
+        ttl (int): Seconds a rendered page may be served
+        args (tuple): Query arguments that change the page (the rest are ignored for the key)
+        tags (tuple): Invalidation tags, formatted with the view arguments ('question:{question_id}')
+        on_hit (callable, optional): Called with the view arguments when a cached page is served,
+            for side effects that must happen on every view (without database access)
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if not _cacheable_request():
+                return view(**kwargs)
+
+            key = _page_key(args)
+            now = time.time()
+            entry = get_store().get(key)
+            if _is_fresh(entry, now):
+                if on_hit is not None:
+                    on_hit(**kwargs)
+                body = entry['body']
+                if CSRF_PLACEHOLDER in body:
+                    body = body.replace(CSRF_PLACEHOLDER, generate_csrf())
+                return _respond(entry, body, 'HIT')
+
+            response = make_response(view(**kwargs))
+            if response.status_code != 200 or response.direct_passthrough or '_flashes' in session:
+                return response
+            body = response.get_data(as_text=True)
+            token = g.get('csrf_token')
+            stored = body.replace(token, CSRF_PLACEHOLDER) if token else body
+            entry = {
+                'body': stored,
+                'mimetype': response.mimetype,
+                'etag': hashlib.sha1(stored.encode()).hexdigest(),
+                # The start of the render: writes committed during it make the entry stale
+                'rendered_at': now,
+                'expires': now + min(ttl, MAX_TTL),
+                'tags': [tag.format(**kwargs) for tag in tags],
+            }
+            get_store().set(key, entry)
+            return _respond(entry, body, 'MISS')
+        return wrapper
+    return decorator
+
+
+def _tags_for(session, obj):
+    if isinstance(obj, Question):
+        return {'questions', f'question:{obj.id}'}
+    if isinstance(obj, Comment):
+        return {'questions', f'question:{obj.question_id}'}
+    if isinstance(obj, Vote):
+        question_id = obj.question_id
+        if question_id is None and obj.comment_id is not None:
+            with session.no_autoflush:
+                question_id = session.query(Comment.question_id).filter(Comment.id == obj.comment_id).scalar()
+        # Scores in the question lists catch up with the TTL
+        return {f'question:{question_id}'}
+    if isinstance(obj, (Tag, QuestionTag)):
+        return {'questions'}
+    if isinstance(obj, (User, AIPersonality)):
+        return {'users'}
+    return set()
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_tags(session, flush_context):
+    tags = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        tags |= _tags_for(session, obj)
+    if tags:
+        session.info.setdefault(PENDING_KEY, set()).update(tags)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed(session):
+    tags = session.info.pop(PENDING_KEY, None)
+    if tags:
+        invalidate(*tags)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    session.info.pop(PENDING_KEY, None)
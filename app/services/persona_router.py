@@ -0,0 +1,179 @@
+"""
+Relevance-based AI persona routing.
+
+Personas are embedded as TF-IDF vectors built from their expertise and
+description, and incoming content (question title, body, tags and any reply
+text) is projected into the same space. The most similar personas are picked
+with cosine similarity, with a small exploration rate so less obvious personas
+still take part now and then.
+
+Persona vectors are cached and only rebuilt when the set of personas or their
+expertise/description changes.
+"""
+import os
+import re
+import math
+import random
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+
+# Probability that a selected slot goes to a random persona instead of the best match
+PERSONA_EXPLORATION = float(os.environ.get('PERSONA_EXPLORATION', 0.15))
+# Number of persona sets whose vectors are cached
+PERSONA_CACHE_SIZE = 8
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#]*")
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in is it its
+me my no not of on or so that the this to use using was what when where which who
+why will with you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords"""
+    return [token for token in TOKEN_RE.findall((text or '').lower())
+            if token not in STOPWORDS and len(token) > 1]
+
+
+def persona_document(personality):
+    """Text that describes what a persona knows; expertise is weighted double"""
+    expertise = (personality.expertise or '').replace(',', ' ')
+    return f"{expertise} {expertise} {personality.description or ''}"
+
+
+def content_document(question=None, text=None):
+    """Text to route on: question title, body, tags and optional extra text"""
+    parts = []
+    if question is not None:
+        tags = ' '.join(qt.tag.name for qt in question.tags)
+        # Title and tags are short but the most descriptive, so weight them up
+        parts.extend([question.title, question.title, question.body, tags, tags])
+    if text:
+        parts.append(text)
+    return ' '.join(part for part in parts if part)
+
+
+class PersonaIndex:
+    """TF-IDF vectors for a fixed set of personas"""
+
+    def __init__(self, personalities):
+        self.ids = [p.id for p in personalities]
+        docs = [Counter(tokenize(persona_document(p))) for p in personalities]
+
+        vocabulary = sorted(set(term for doc in docs for term in doc))
+        self.vocabulary = {term: i for i, term in enumerate(vocabulary)}
+
+        # Smoothed IDF so terms shared by every persona still count a little
+        df = np.zeros(len(vocabulary))
+        for doc in docs:
+            for term in doc:
+                df[self.vocabulary[term]] += 1
+        n = len(docs)
+        self.idf = np.log((1 + n) / (1 + df)) + 1
+
+        self.matrix = np.zeros((n, len(vocabulary)))
+        for row, doc in enumerate(docs):
+            for term, count in doc.items():
+                self.matrix[row, self.vocabulary[term]] = 1 + math.log(count)
+        self.matrix *= self.idf
+        norms = np.linalg.norm(self.matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.matrix /= norms
+
+    def vectorize(self, text):
+        vector = np.zeros(len(self.vocabulary))
+        for term, count in Counter(tokenize(text)).items():
+            index = self.vocabulary.get(term)
+            if index is not None:
+                vector[index] = 1 + math.log(count)
+        vector *= self.idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def similarities(self, text):
+        """Cosine similarity of the text to every persona, in self.ids order"""
+        if not self.vocabulary:
+            return np.zeros(len(self.ids))
+        return self.matrix @ self.vectorize(text)
+
+
+class PersonaRouter:
+    """Selects the personas most relevant to a piece of content"""
+
+    def __init__(self, cache_size=PERSONA_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _index(self, personalities):
+        # Rebuild whenever a persona is added, removed or re-described
+        key = tuple((p.id, p.expertise, p.description) for p in personalities)
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+
+        index = PersonaIndex(personalities)
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > self.cache_size:
+                self._indexes.popitem(last=False)
+        return index
+
+    def rank(self, personalities, text):
+        """
+        Rank personas by relevance to the text
+
+        Returns:
+            list: (personality, similarity) pairs, most relevant first
+        """
+        personalities = sorted(personalities, key=lambda p: p.id)
+        if not personalities:
+            return []
+        scores = self._index(personalities).similarities(text)
+        # Random tie-break so equally (ir)relevant personas share the work
+        order = np.lexsort((np.random.random(len(scores)), -scores))
+        return [(personalities[i], float(scores[i])) for i in order]
+
+    def select(self, personalities, text, k=1, exploration=None):
+        """
+        Select up to k personas, mostly the best matches
+
+        Args:
+            personalities (list): Candidate AIPersonality objects
+            text (str): Content to route on
+            k (int): Number of personas to return
+            exploration (float, optional): Chance of swapping each slot for a random persona
+
+        Returns:
+            list: Selected personalities, best matches first
+        """
+        if exploration is None:
+            exploration = PERSONA_EXPLORATION
+
+        ranked = [p for p, score in self.rank(personalities, text)]
+        if len(ranked) <= k:
+            return ranked
+
+        selected, rest = ranked[:k], ranked[k:]
+        for slot in range(k):
+            if rest and random.random() < exploration:
+                selected[slot] = rest.pop(random.randrange(len(rest)))
+        return selected
+
+
+router = PersonaRouter()
+
+
+def select_personas(personalities, question=None, text=None, k=1, exploration=None):
+    """Select the k personas most relevant to a question and/or text"""
+    return router.select(personalities, content_document(question, text), k=k, exploration=exploration)
+
+
+def select_persona(personalities, question=None, text=None, exploration=None):
+    """Select the single persona most relevant to a question and/or text"""
+    selected = select_personas(personalities, question, text, k=1, exploration=exploration)
+    return selected[0] if selected else None
@@ -0,0 +1,675 @@
+"""
+Resumable thread population jobs.
+
+A population run is planned as a list of (personality, item) units stored in
+the database. Units are executed a few at a time by the LLM worker pool, and
+every completion is saved on its unit before it is turned into a vote or a
+comment. If the process crashes or restarts, the job picks up from the first
+unfinished unit and reuses any completion that was already received.
+
+The run is a multi-round discussion. The first round reviews the whole thread;
+each later round only reviews items that were created, edited or re-scored
+since the previous round started, so AIs react to each other's replies. The
+discussion stops when the score distribution stops moving, after max_rounds,
+or when the job's token budget is spent.
+"""
+import os
+import json
+import random
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models.question import Question
+from app.models.comment import Comment
+from app.models.user import User
+from app.models.ai_personality import AIPersonality
+from app.models.population_job import PopulationJob, PopulationUnit
+from app.models.tag import Tag, QuestionTag
+from app.services.llm_service import get_completion, queue_task, queue_task_later, PRIORITY_BULK
+from app.services.persona_router import select_persona, select_personas
+from app.services.vote_service import apply_votes
+
+# Number of units processed per chunk. Each chunk is a separate bulk task, so
+# interactive work can run between chunks.
+POPULATE_CHUNK_SIZE = int(os.environ.get('POPULATE_CHUNK_SIZE', 5))
+# How many times a unit is retried when the LLM backend is busy or failing
+MAX_UNIT_ATTEMPTS = int(os.environ.get('POPULATE_MAX_UNIT_ATTEMPTS', 3))
+# Seconds to wait before retrying a job whose backend was busy
+RETRY_DELAY = int(os.environ.get('POPULATE_RETRY_DELAY', 30))
+# Jobs without progress for this many seconds are considered abandoned
+JOB_STALE_AFTER = int(os.environ.get('POPULATE_JOB_STALE_AFTER', 300))
+# Maximum number of discussion rounds per job
+DISCUSSION_MAX_ROUNDS = int(os.environ.get('DISCUSSION_MAX_ROUNDS', 3))
+# Estimated token budget per job, 0 for no limit
+DISCUSSION_TOKEN_BUDGET = int(os.environ.get('DISCUSSION_TOKEN_BUDGET', 200000))
+# The discussion has converged when no items are new and the average absolute
+# score change per item during a round is at most this value
+DISCUSSION_CONVERGENCE = float(os.environ.get('DISCUSSION_CONVERGENCE', 0.1))
+
+
+def start_population_job(question_id, max_comments=None, num_personalities=None):
+    """
+    Create a population job for a question, or return its active job
+
+    Returns:
+        tuple: (success, message, job)
+    """
+    from app.models.site_settings import SiteSettings
+
+    question = Question.query.get(question_id)
+    if not question:
+        return False, "Question not found", None
+
+    # Only one active job per question
+    job = PopulationJob.query.filter(
+        PopulationJob.question_id == question_id,
+        PopulationJob.status.in_(('pending', 'running'))
+    ).first()
+    if job:
+        return True, f"Population job {job.id} is already active", job
+
+    # Get settings with defaults
+    if max_comments is None:
+        max_comments = int(SiteSettings.get('ai_auto_populate_max_comments', 150))
+    if num_personalities is None:
+        num_personalities = int(SiteSettings.get('ai_auto_populate_personalities', 7))
+
+    # Get active AI personalities
+    ai_personalities = AIPersonality.query.filter_by(is_active=True).all()
+    if not ai_personalities:
+        return False, "No active AI personalities found", None
+
+    # Select the personalities most relevant to this thread
+    selected_personalities = select_personas(ai_personalities, question, k=num_personalities)
+
+    # Count existing AI comments with a single query
+    existing_ai_comments = db.session.query(db.func.count(Comment.id)).join(
+        User, Comment.user_id == User.id
+    ).filter(
+        Comment.question_id == question_id,
+        User.is_ai == True
+    ).scalar() or 0
+
+    job = PopulationJob(
+        question_id=question_id,
+        status='pending',
+        personality_ids=','.join(str(p.id) for p in selected_personalities),
+        max_comments=max_comments,
+        existing_ai_comments=existing_ai_comments,
+        max_rounds=DISCUSSION_MAX_ROUNDS,
+        token_budget=DISCUSSION_TOKEN_BUDGET,
+        heartbeat_at=datetime.utcnow()
+    )
+    db.session.add(job)
+    db.session.flush()
+
+    # Plan an initial answer if the question doesn't have one yet
+    has_answer = Comment.query.filter_by(question_id=question_id, parent_comment_id=None).first() is not None
+    if not has_answer:
+        db.session.add(PopulationUnit(
+            job_id=job.id,
+            position=0,
+            kind='answer',
+            personality_id=select_persona(selected_personalities, question).id
+        ))
+
+    db.session.commit()
+    current_app.logger.info(f"Created population job {job.id} for question {question_id}")
+    return True, f"Population job {job.id} created", job
+
+
+def run_population_job(job_id):
+    """
+    Process the next chunk of a population job and queue the following one
+
+    Returns:
+        tuple: (success, message)
+    """
+    job = PopulationJob.query.get(job_id)
+    if not job:
+        return False, "Population job not found"
+    if not job.is_active:
+        return True, f"Population job {job_id} is {job.status}"
+
+    try:
+        job.status = 'running'
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+
+        processed = 0
+        finished = False
+        # Context and personalities are looked up once per chunk, not once per unit
+        cache = {}
+        while processed < POPULATE_CHUNK_SIZE:
+            if _limit_reached(job):
+                _stop_discussion(job, 'comment limit')
+                finished = True
+                break
+            if job.token_budget and job.tokens_used >= job.token_budget:
+                _stop_discussion(job, 'token budget')
+                finished = True
+                break
+
+            unit = job.units.filter_by(status='pending').first()
+            if unit is None:
+                if _plan_round(job):
+                    continue
+                finished = True
+                break
+
+            if not _run_unit(job, unit, cache):
+                # The backend is busy; try again later instead of spinning
+                queue_task_later(RETRY_DELAY, run_population_job, job.id,
+                                 priority=PRIORITY_BULK, key=job.question_id)
+                return True, f"LLM backend busy, job {job.id} will retry in {RETRY_DELAY}s"
+            processed += 1
+
+        if finished:
+            job.status = 'completed'
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            return True, (f"Generated {job.comments_created} AI comments and {job.votes_created} votes "
+                          f"in {job.round} rounds ({job.stop_reason})")
+
+        # Queue the next chunk behind any other pending work
+        job.heartbeat_at = datetime.utcnow()
+        db.session.commit()
+        queue_task(run_population_job, job.id, priority=PRIORITY_BULK, key=job.question_id)
+        return True, f"Generated {job.comments_created} AI comments so far, next chunk queued"
+
+    except Exception as e:
+        # Everything up to the last finished unit is already committed
+        db.session.rollback()
+        current_app.logger.error(f"Error in population job {job_id}: {str(e)}")
+        job = PopulationJob.query.get(job_id)
+        if job:
+            job.status = 'failed'
+            job.last_error = str(e)
+            db.session.commit()
+        return False, f"Error populating thread: {str(e)}"
+
+
+def resume_population_job(job_id):
+    """Re-queue a failed or stalled job; finished units are not repeated"""
+    job = PopulationJob.query.get(job_id)
+    if not job or job.status == 'completed':
+        return False
+
+    job.status = 'pending'
+    job.last_error = None
+    job.heartbeat_at = datetime.utcnow()
+    db.session.commit()
+
+    queue_task(run_population_job, job.id, priority=PRIORITY_BULK, key=job.question_id)
+    return True
+
+
+def resume_population_jobs(stale_after=JOB_STALE_AFTER):
+    """
+    Re-queue active jobs that stopped making progress, e.g. after a crash or restart
+
+    Returns:
+        int: Number of jobs resumed
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=stale_after)
+    stale = db.or_(PopulationJob.heartbeat_at == None, PopulationJob.heartbeat_at < cutoff)
+
+    jobs = PopulationJob.query.filter(
+        PopulationJob.status.in_(('pending', 'running')),
+        stale
+    ).all()
+
+    resumed = 0
+    for job in jobs:
+        # Claim the job atomically so only one process resumes it
+        claimed = PopulationJob.query.filter(PopulationJob.id == job.id, stale).update(
+            {'heartbeat_at': datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+
+        if claimed:
+            queue_task(run_population_job, job.id, priority=PRIORITY_BULK, key=job.question_id)
+            resumed += 1
+
+    if resumed:
+        current_app.logger.info(f"Resumed {resumed} population jobs")
+    return resumed
+
+
+def _limit_reached(job):
+    return job.existing_ai_comments + job.comments_created >= job.max_comments
+
+
+def _stop_discussion(job, reason):
+    """End the discussion, skipping any units that have not run yet"""
+    # job.units is ordered by position, and ordered queries can't be bulk updated
+    PopulationUnit.query.filter_by(job_id=job.id, status='pending').update(
+        {'status': 'skipped', 'last_error': f'Discussion stopped: {reason}'}, synchronize_session=False)
+    job.reviews_planned = True
+    job.stop_reason = reason
+    db.session.commit()
+    return False
+
+
+def _thread_scores(question_id):
+    """Current denormalized scores of all live items in a thread"""
+    return dict(db.session.query(Comment.id, Comment.score).filter(
+        Comment.question_id == question_id,
+        Comment.is_deleted == False
+    ).all())
+
+
+def _converged(previous, scores):
+    """True if no items are new and scores barely moved since the snapshot"""
+    if any(item_id not in previous for item_id in scores):
+        return False
+    if not scores:
+        return True
+    change = sum(abs(score - previous[item_id]) for item_id, score in scores.items())
+    return change <= DISCUSSION_CONVERGENCE * len(scores)
+
+
+def _plan_round(job):
+    """
+    Plan the next discussion round
+
+    The first round reviews every item in the thread. Later rounds only review
+    items created, edited or re-scored since the previous round started, and
+    skip (personality, item) pairs that were already reviewed unless the item
+    was edited.
+
+    Returns:
+        bool: True if a round was planned, False if the discussion is over
+    """
+    scores = _thread_scores(job.question_id)
+
+    if job.round:
+        if job.round >= job.max_rounds:
+            return _stop_discussion(job, 'max rounds')
+        previous = {int(k): v for k, v in json.loads(job.score_snapshot or '{}').items()}
+        if _converged(previous, scores):
+            return _stop_discussion(job, 'converged')
+
+    query = Comment.query.filter_by(question_id=job.question_id, is_deleted=False)
+    reviewed = set()
+    edited = set()
+    if job.round:
+        since = job.round_started_at
+        # New, edited or re-scored items only
+        changed_ids = [item_id for item_id, score in scores.items() if previous.get(item_id) != score]
+        query = query.filter(db.or_(
+            Comment.created_at >= since,
+            Comment.updated_at > since,
+            Comment.id.in_(changed_ids)
+        ))
+        reviewed = set(db.session.query(PopulationUnit.personality_id, PopulationUnit.item_id).filter(
+            PopulationUnit.job_id == job.id,
+            PopulationUnit.kind == 'review',
+            PopulationUnit.status == 'done'
+        ).all())
+    items = query.order_by(Comment.created_at).all()
+    if job.round:
+        edited = {item.id for item in items
+                  if item.updated_at and item.created_at < job.round_started_at < item.updated_at}
+
+    personality_ids = job.personality_id_list
+    personalities = AIPersonality.query.filter(AIPersonality.id.in_(personality_ids)).all()
+    personalities.sort(key=lambda p: personality_ids.index(p.id))
+
+    position = (db.session.query(db.func.max(PopulationUnit.position))
+                .filter(PopulationUnit.job_id == job.id).scalar() or 0) + 1
+
+    units = []
+    for personality in personalities:
+        # Skip if this personality shouldn't respond based on activity frequency
+        if not personality.should_respond():
+            continue
+
+        ai_user = get_ai_user(personality)
+        for item in items:
+            # Skip items created by this AI
+            if item.user_id == ai_user.id:
+                continue
+            # Skip items this AI already reviewed, unless they were edited since
+            if (personality.id, item.id) in reviewed and item.id not in edited:
+                continue
+
+            # 90% chance to evaluate the item, 70% chance to also reply
+            if random.random() < 0.9:
+                units.append(PopulationUnit(
+                    job_id=job.id,
+                    position=position,
+                    kind='review',
+                    personality_id=personality.id,
+                    item_id=item.id,
+                    wants_reply=random.random() < 0.7
+                ))
+                position += 1
+
+    if not units:
+        return _stop_discussion(job, 'converged' if job.round else 'no reviewers')
+
+    db.session.add_all(units)
+    job.round += 1
+    job.round_started_at = datetime.utcnow()
+    job.score_snapshot = json.dumps(scores)
+    job.reviews_planned = True
+    db.session.commit()
+    current_app.logger.info(f"Planned round {job.round} with {len(units)} review units for population job {job.id}")
+    return True
+
+
+def _record_busy(unit):
+    """
+    Record a failed or shed LLM call on a unit
+
+    Returns:
+        bool: True if the job should move on, False if it should retry later
+    """
+    unit.attempts = (unit.attempts or 0) + 1
+    unit.last_error = 'LLM backend unavailable'
+    if unit.attempts >= MAX_UNIT_ATTEMPTS:
+        unit.status = 'skipped'
+        db.session.commit()
+        return True
+    db.session.commit()
+    return False
+
+
+def _cached_persona(cache, personality_id):
+    """
+    Get a personality and its AI user, loading them once per chunk
+
+    They're detached from the session, so the commit after every checkpoint
+    doesn't expire them and make each unit reload them. Both are refreshed
+    first: get_ai_user() commits when it creates the account, which expires
+    the personality, and an expired detached object can't load anything.
+    """
+    personas = cache.setdefault('personas', {})
+    if personality_id not in personas:
+        personality = AIPersonality.query.get(personality_id)
+        ai_user = get_ai_user(personality) if personality else None
+        for obj in (personality, ai_user):
+            if obj is not None:
+                db.session.refresh(obj)
+                db.session.expunge(obj)
+        personas[personality_id] = (personality, ai_user)
+    return personas[personality_id]
+
+
+def _run_unit(job, unit, cache=None):
+    """
+    Execute a single unit, checkpointing each completion as it arrives
+
+    Args:
+        job (PopulationJob): The unit's job
+        unit (PopulationUnit): The unit to run
+        cache (dict, optional): Lookups shared by the units of one chunk
+
+    Returns:
+        bool: False if the LLM backend was busy and the job should retry later
+    """
+    cache = {} if cache is None else cache
+    try:
+        personality, ai_user = _cached_persona(cache, unit.personality_id)
+        if not personality:
+            unit.status = 'skipped'
+            unit.last_error = 'Personality no longer exists'
+            db.session.commit()
+            return True
+
+        if 'context' not in cache:
+            cache['context'] = _build_context(job.question)
+        context = cache['context']
+
+        if unit.kind == 'answer':
+            return _run_answer_unit(job, unit, personality, ai_user, context)
+        return _run_review_unit(job, unit, personality, ai_user, context)
+
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error in population unit {unit.id}: {str(e)}")
+        unit = PopulationUnit.query.get(unit.id)
+        unit.attempts = (unit.attempts or 0) + 1
+        unit.last_error = str(e)
+        if unit.attempts >= MAX_UNIT_ATTEMPTS:
+            unit.status = 'failed'
+        db.session.commit()
+        return True
+
+
+def _run_answer_unit(job, unit, personality, ai_user, context):
+    if unit.reply_text is None:
+        prompt = personality.format_prompt(
+            content="Please provide a helpful and informative answer to this question.",
+            context=context
+        )
+        text = _complete(job, personality, prompt)
+        if not text:
+            return _record_busy(unit)
+        # Checkpoint the completion before using it
+        unit.reply_text = text
+        db.session.commit()
+
+    if unit.comment_id is None:
+        answer = Comment(
+            body=unit.reply_text,
+            user_id=ai_user.id,
+            question_id=job.question_id,
+            parent_comment_id=None
+        )
+        db.session.add(answer)
+        db.session.flush()
+        unit.comment_id = answer.id
+        job.comments_created += 1
+
+    unit.status = 'done'
+    db.session.commit()
+    return True
+
+
+def _run_review_unit(job, unit, personality, ai_user, context):
+    item = Comment.query.get(unit.item_id)
+    if not item or item.is_deleted:
+        unit.status = 'skipped'
+        unit.last_error = 'Item no longer exists'
+        db.session.commit()
+        return True
+
+    item_type = 'answer' if item.parent_comment_id is None else 'comment'
+
+    # Step 1: evaluate the item
+    if unit.vote_response is None:
+        text = _complete(job, personality, personality.format_prompt(
+            content=_evaluation_prompt(personality, context, item_type, item.body, item.score),
+            context=""
+        ))
+        if text is None:
+            return _record_busy(unit)
+        unit.vote_response = text
+        db.session.commit()
+
+    # Step 2: cast the vote
+    if unit.vote_type is None:
+        first_line = unit.vote_response.upper().split("\n")[0]
+        unit.vote_type = -1 if "DOWNVOTE" in first_line else 1
+        current_app.logger.info(
+            f"AI {personality.name} decided to {'downvote' if unit.vote_type == -1 else 'upvote'} {item_type} {item.id}")
+
+    if unit.vote_id is None:
+        # Upsert the vote, score and reputation in the same transaction as the checkpoint
+        result = apply_votes(ai_user.id, [{'comment_id': item.id, 'vote_type': unit.vote_type}], commit=False)
+        if result['results']:
+            applied = result['results'][0]
+            unit.vote_id = applied['vote_id']
+            if applied['created']:
+                job.votes_created += 1
+        db.session.commit()
+
+    # Step 3: reply, if planned and the thread still has room
+    if unit.wants_reply and unit.comment_id is None and not _limit_reached(job):
+        if unit.reply_text is None:
+            text = _complete(job, personality, personality.format_prompt(
+                content=_reply_prompt(personality, context, item_type, item.body, unit.vote_type),
+                context=""
+            ))
+            if not text:
+                return _record_busy(unit)
+            unit.reply_text = text
+            db.session.commit()
+
+        reply = Comment(
+            body=unit.reply_text,
+            user_id=ai_user.id,
+            question_id=job.question_id,
+            parent_comment_id=item.id
+        )
+        db.session.add(reply)
+        db.session.flush()
+        unit.comment_id = reply.id
+        job.comments_created += 1
+
+    unit.status = 'done'
+    job.heartbeat_at = datetime.utcnow()
+    db.session.commit()
+    return True
+
+
+def _find_ai_user(personality):
+    return (User.query.filter_by(ai_personality_id=personality.id, is_ai=True)
+            .order_by(User.id).first())
+
+
+def get_ai_user(personality):
+    """
+    Get the AI user for a personality, creating it if needed
+
+    The account is found by its ai_personality_id, never by username, so every
+    code path that posts as a personality uses the same account.
+    """
+    ai_user = _find_ai_user(personality)
+    if ai_user:
+        return ai_user
+
+    username = f"ai_{personality.name.lower().replace(' ', '_')}"
+    if User.query.filter_by(username=username).first():
+        # A human (or a renamed personality) already has the name
+        username = f"{username}_{personality.id}"
+    ai_user = User(
+        username=username,
+        email=f"{username}@example.com",
+        is_ai=True,
+        ai_personality_id=personality.id
+    )
+    ai_user.set_password("AIUSER")
+    db.session.add(ai_user)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker created it first
+        db.session.rollback()
+        ai_user = _find_ai_user(personality)
+        if not ai_user:
+            raise
+    return ai_user
+
+
+def _estimate_tokens(text):
+    """Rough token estimate (about four characters per token)"""
+    return len(text) // 4 + 1 if text else 0
+
+
+def _complete(job, personality, prompt):
+    """Get a completion using the personality's custom LLM settings, charging the job's token budget"""
+    text = get_completion(
+        prompt=prompt,
+        model=personality.custom_model,
+        api_key=personality.custom_api_key,
+        base_url=personality.custom_base_url
+    )
+    if text:
+        job.tokens_used = (job.tokens_used or 0) + _estimate_tokens(prompt) + _estimate_tokens(text)
+    return text
+
+
+def _build_context(question):
+    context = f"Question Title: {question.title}\n"
+    context += f"Question Body: {question.body}\n"
+    # Tag names in one query rather than one per QuestionTag
+    tag_names = [name for (name,) in db.session.query(Tag.name).join(
+        QuestionTag, QuestionTag.tag_id == Tag.id).filter(QuestionTag.question_id == question.id)]
+    if tag_names:
+        context += f"\n\nTags: {', '.join(tag_names)}"
+    return context
+
+
+def _evaluation_prompt(personality, context, item_type, body, score):
+    if item_type == 'answer':
+        return f"""
+        You are {personality.name}, an AI with the following traits:
+        - Expertise: {personality.expertise}
+        - Personality: {personality.personality_traits}
+        - Interaction Style: {personality.interaction_style}
+
+        Please evaluate the following answer to a question. Consider its quality, accuracy, helpfulness, and clarity.
+
+        {context}
+
+        Answer: {body}
+        Current score: {score}
+
+        Based on your evaluation, should this answer be upvoted or downvoted?
+        Respond with either "UPVOTE" or "DOWNVOTE" followed by your reasoning.
+        """
+    return f"""
+        You are {personality.name}, an AI with the following traits:
+        - Expertise: {personality.expertise}
+        - Personality: {personality.personality_traits}
+        - Interaction Style: {personality.interaction_style}
+
+        Please evaluate the following comment. Consider its quality, relevance, helpfulness, and clarity.
+
+        {context}
+
+        Comment: {body}
+        Current score: {score}
+
+        Based on your evaluation, should this comment be upvoted or downvoted?
+        Respond with either "UPVOTE" or "DOWNVOTE" followed by your reasoning.
+        """
+
+
+def _reply_prompt(personality, context, item_type, body, vote_type):
+    if vote_type == 1:
+        return f"""
+        You are {personality.name}, an AI with the following traits:
+        - Expertise: {personality.expertise}
+        - Personality: {personality.personality_traits}
+        - Interaction Style: {personality.interaction_style}
+
+        You just upvoted the following {item_type}.
+        Write a reply that expands on the {item_type}, adds additional information,
+        or supports the points made. Be constructive and helpful.
+
+        {context}
+
+        {item_type.capitalize()}: {body}
+
+        Your reply:
+        """
+    return f"""
+        You are {personality.name}, an AI with the following traits:
+        - Expertise: {personality.expertise}
+        - Personality: {personality.personality_traits}
+        - Interaction Style: {personality.interaction_style}
+
+        You just downvoted the following {item_type} because you found issues with it.
+        Write a constructive reply that politely points out the issues, provides corrections,
+        or offers a better alternative. Be respectful and helpful.
+
+        {context}
+
+        {item_type.capitalize()}: {body}
+
+        Your reply:
+        """
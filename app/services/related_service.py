@@ -0,0 +1,245 @@
+"""
+Related questions.
+
+Each question's nearest neighbours are precomputed into the related_questions
+table so the view page reads them with one indexed lookup. Similarity mixes
+TF-IDF cosine over title and body with an IDF-weighted tag overlap, so two
+questions that share a rare tag count as closer than two that only share a
+popular one.
+
+The term and tag postings are kept in memory, loaded on first use and caught
+up incrementally by question id. Refreshes run as low priority background
+tasks when questions are posted or edited, and a new question is also merged
+into the neighbour lists of the questions it is related to.
+"""
+import os
+import math
+import threading
+from collections import Counter, defaultdict
+import numpy as np
+from flask import current_app
+from app import db
+from app.models.question import Question
+from app.models.tag import QuestionTag
+from app.models.related_question import RelatedQuestion
+from app.services.persona_router import tokenize
+
+# Number of related questions stored per question
+RELATED_LIMIT = int(os.environ.get('RELATED_QUESTIONS_LIMIT', 10))
+# Weight of tag overlap versus text similarity
+RELATED_TAG_WEIGHT = float(os.environ.get('RELATED_TAG_WEIGHT', 0.4))
+# Pairs scoring below this are not stored
+RELATED_MIN_SCORE = 0.05
+# Only the start of long bodies is used
+BODY_CHARS = 2000
+# Terms in more than this share of questions are too common to find candidates
+COMMON_TERM_RATIO = 0.3
+
+
+def _idf(n, df):
+    return math.log((1 + n) / (1 + df)) + 1
+
+
+class RelatedIndex:
+    """In-memory term and tag postings over all live questions"""
+
+    def __init__(self):
+        self.terms = {}
+        self.tags = {}
+        self.postings = defaultdict(set)
+        self.tag_postings = defaultdict(set)
+        self.max_id = 0
+        self._lock = threading.RLock()
+
+    def _remove(self, question_id):
+        for term in self.terms.pop(question_id, ()):
+            self.postings[term].discard(question_id)
+        for tag_id in self.tags.pop(question_id, ()):
+            self.tag_postings[tag_id].discard(question_id)
+
+    def _add(self, question_id, title, body, tag_ids):
+        self._remove(question_id)
+        # Titles are the best summary of a question, so they count twice
+        counts = Counter(tokenize(f"{title} {title} {(body or '')[:BODY_CHARS]}"))
+        self.terms[question_id] = counts
+        for term in counts:
+            self.postings[term].add(question_id)
+        self.tags[question_id] = set(tag_ids)
+        for tag_id in tag_ids:
+            self.tag_postings[tag_id].add(question_id)
+
+    def _load(self, filters):
+        rows = db.session.query(Question.id, Question.title, Question.body).filter(
+            Question.is_deleted == False, *filters
+        ).order_by(Question.id).all()
+        if not rows:
+            return rows
+        tags = defaultdict(list)
+        for question_id, tag_id in db.session.query(QuestionTag.question_id, QuestionTag.tag_id).filter(
+                QuestionTag.question_id.in_([row[0] for row in rows])):
+            tags[question_id].append(tag_id)
+        with self._lock:
+            for question_id, title, body in rows:
+                self._add(question_id, title, body, tags[question_id])
+        return rows
+
+    def sync(self):
+        """Index questions created since the last sync (all of them on first use)"""
+        rows = self._load([Question.id > self.max_id])
+        if rows:
+            with self._lock:
+                self.max_id = max(self.max_id, rows[-1][0])
+
+    def update(self, question_id):
+        """Re-read a new or edited question from the database"""
+        if not self._load([Question.id == question_id]):
+            self.remove(question_id)
+
+    def remove(self, question_id):
+        with self._lock:
+            self._remove(question_id)
+
+    def _text_vector(self, counts, n):
+        vector = {term: (1 + math.log(count)) * _idf(n, len(self.postings[term]))
+                  for term, count in counts.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1
+        return {term: w / norm for term, w in vector.items()}
+
+    def _tag_vector(self, tag_ids, n):
+        vector = {tag_id: _idf(n, len(self.tag_postings[tag_id])) for tag_id in tag_ids}
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1
+        return {tag_id: w / norm for tag_id, w in vector.items()}
+
+    def neighbours(self, question_id, limit=RELATED_LIMIT):
+        """
+        Find the questions most related to a question
+
+        Returns:
+            list: (question_id, score) pairs, most related first
+        """
+        with self._lock:
+            counts = self.terms.get(question_id)
+            if counts is None:
+                return []
+            n = len(self.terms)
+
+            # Candidates share at least one reasonably specific term or any tag
+            candidates = set()
+            for term in counts:
+                posting = self.postings[term]
+                if len(posting) <= max(COMMON_TERM_RATIO * n, 2):
+                    candidates.update(posting)
+            for tag_id in self.tags[question_id]:
+                candidates.update(self.tag_postings[tag_id])
+            candidates.discard(question_id)
+            if not candidates:
+                return []
+
+            ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            text = np.zeros(len(ids))
+            tags = np.zeros(len(ids))
+            text_vector = self._text_vector(counts, n)
+            tag_vector = self._tag_vector(self.tags[question_id], n)
+            for i, other_id in enumerate(ids):
+                other = self._text_vector(self.terms[other_id], n)
+                text[i] = sum(w * other.get(term, 0) for term, w in text_vector.items())
+                if tag_vector:
+                    other_tags = self._tag_vector(self.tags[other_id], n)
+                    tags[i] = sum(w * other_tags.get(tag_id, 0) for tag_id, w in tag_vector.items())
+
+        weight = RELATED_TAG_WEIGHT if tag_vector else 0
+        scores = (1 - weight) * text + weight * tags
+        order = np.argsort(-scores)[:limit]
+        return [(int(ids[i]), float(scores[i])) for i in order if scores[i] >= RELATED_MIN_SCORE]
+
+
+related_index = RelatedIndex()
+_pending = set()
+_refreshed = set()
+_pending_lock = threading.Lock()
+
+
+def _store(question_id, neighbours):
+    RelatedQuestion.query.filter_by(question_id=question_id).delete(synchronize_session=False)
+    db.session.add_all([
+        RelatedQuestion(question_id=question_id, related_id=related_id, rank=rank, score=score)
+        for rank, (related_id, score) in enumerate(neighbours)
+    ])
+
+
+def refresh_related_questions(question_id):
+    """Recompute a question's neighbours and merge it into theirs"""
+    from app.services.db_writer import run_write
+
+    with _pending_lock:
+        _pending.discard(question_id)
+        _refreshed.add(question_id)
+
+    related_index.sync()
+    related_index.update(question_id)
+    neighbours = related_index.neighbours(question_id)
+    run_write(_store_with_neighbours, question_id, neighbours)
+    current_app.logger.info(f"Refreshed {len(neighbours)} related questions for question {question_id}")
+    return len(neighbours)
+
+
+def _store_with_neighbours(question_id, neighbours):
+    """Store a question's neighbours and merge it into theirs"""
+    _store(question_id, neighbours)
+
+    # The question may now belong in its neighbours' lists as well
+    if neighbours:
+        existing = defaultdict(list)
+        # Plain column rows, so no RelatedQuestion objects collide with the replacements
+        for owner_id, related_id, score in db.session.query(
+                RelatedQuestion.question_id, RelatedQuestion.related_id, RelatedQuestion.score
+        ).filter(RelatedQuestion.question_id.in_([related_id for related_id, score in neighbours])):
+            existing[owner_id].append((related_id, score))
+        for related_id, score in neighbours:
+            current = [pair for pair in existing[related_id] if pair[0] != question_id]
+            if len(current) >= RELATED_LIMIT and score <= min(s for _, s in current):
+                continue
+            merged = sorted(current + [(question_id, score)], key=lambda pair: -pair[1])[:RELATED_LIMIT]
+            _store(related_id, merged)
+
+    db.session.commit()
+
+
+def schedule_refresh(question_id, if_missing=False):
+    """
+    Queue a low priority refresh of a question's related questions
+
+    Args:
+        question_id (int): The question to refresh
+        if_missing (bool): Skip questions this process has already refreshed
+    """
+    from app.services.llm_service import queue_task, PRIORITY_LOW
+
+    with _pending_lock:
+        if question_id in _pending or (if_missing and question_id in _refreshed):
+            return
+        _pending.add(question_id)
+    queue_task(refresh_related_questions, question_id, priority=PRIORITY_LOW, key='related')
+
+
+def get_related_questions(question_id, limit=RELATED_LIMIT):
+    """Read a question's precomputed related questions"""
+    return Question.query.join(
+        RelatedQuestion, RelatedQuestion.related_id == Question.id
+    ).filter(
+        RelatedQuestion.question_id == question_id,
+        Question.is_deleted == False
+    ).order_by(RelatedQuestion.rank).limit(limit).all()
+
+
+def rebuild_related_questions():
+    """Recompute the neighbours of every question"""
+    related_index.sync()
+    count = 0
+    for question_id in list(related_index.terms):
+        _store(question_id, related_index.neighbours(question_id))
+        count += 1
+        if count % 100 == 0:
+            db.session.commit()
+    db.session.commit()
+    return count
@@ -0,0 +1,151 @@
+"""
+Reputation ledger.
+
+Every reputation change is appended to the reputation_events table in the same
+transaction as the action that caused it (a vote, an accepted answer), so a
+changed or withdrawn vote is recorded as the exact reversal of its earlier
+points. Nothing on the request path writes User.reputation: a background
+aggregator folds unapplied events into it in batches, which takes one UPDATE
+per batch instead of one contended row write per vote. The displayed
+reputation therefore lags the ledger by up to REPUTATION_AGGREGATE_INTERVAL
+seconds. rebuild_reputation() recomputes every user's reputation from the
+ledger alone.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from sqlalchemy import case, func
+from app import db
+from app.models.reputation_event import ReputationEvent
+from app.models.user import User
+
+# Seconds between aggregation passes
+REPUTATION_AGGREGATE_INTERVAL = float(os.environ.get('REPUTATION_AGGREGATE_INTERVAL', 5))
+# Events folded per transaction
+REPUTATION_BATCH_SIZE = int(os.environ.get('REPUTATION_BATCH_SIZE', 500))
+
+_aggregator = None
+_aggregator_lock = threading.Lock()
+
+
+def record_reputation(user_id, points, reason, actor_id=None, question_id=None, comment_id=None):
+    """
+    Append a reputation change to the ledger in the current transaction
+
+    Args:
+        user_id (int): User whose reputation changes
+        points (int): Points to add (negative to remove)
+        reason (str): 'vote', 'accept' or 'adjustment'
+        actor_id (int, optional): User whose action caused the change
+        question_id, comment_id (int, optional): Content the change relates to
+    """
+    record_reputation_events([{
+        'user_id': user_id, 'points': points, 'reason': reason, 'actor_id': actor_id,
+        'question_id': question_id, 'comment_id': comment_id,
+    }])
+
+
+def record_reputation_events(events):
+    """Append several reputation changes with a single INSERT; zero-point events are skipped"""
+    # executemany needs every row to have the same keys
+    rows = [dict({'actor_id': None, 'question_id': None, 'comment_id': None}, **event,
+                 applied=False, created_at=datetime.utcnow())
+            for event in events if event.get('points')]
+    if rows:
+        db.session.execute(ReputationEvent.__table__.insert(), rows)
+
+
+def aggregate_reputation(batch_size=REPUTATION_BATCH_SIZE):
+    """
+    Fold one batch of unapplied ledger events into User.reputation
+
+    Returns:
+        int: Number of events applied (0 when the ledger is caught up)
+    """
+    table = ReputationEvent.__table__
+    events = db.session.query(ReputationEvent.id, ReputationEvent.user_id, ReputationEvent.points).filter(
+        ReputationEvent.applied == False
+    ).order_by(ReputationEvent.id).limit(batch_size).all()
+    if not events:
+        return 0
+
+    # Claim the batch; if another aggregator got to some of it first, back off and retry later
+    event_ids = [event_id for event_id, user_id, points in events]
+    claimed = db.session.execute(
+        table.update().where(table.c.id.in_(event_ids), table.c.applied == False).values(applied=True)
+    ).rowcount
+    if claimed != len(events):
+        db.session.rollback()
+        return 0
+
+    deltas = defaultdict(int)
+    for event_id, user_id, points in events:
+        deltas[user_id] += points
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if deltas:
+        users = User.__table__
+        db.session.execute(
+            users.update().where(users.c.id.in_(deltas.keys())).values(
+                reputation=func.coalesce(users.c.reputation, 0) + case(deltas, value=users.c.id, else_=0)
+            )
+        )
+    db.session.commit()
+    return len(events)
+
+
+def flush_reputation():
+    """Apply every pending ledger event now"""
+    from app.services.db_writer import run_write
+
+    total = 0
+    while True:
+        applied = run_write(aggregate_reputation)
+        if not applied:
+            return total
+        total += applied
+
+
+def rebuild_reputation():
+    """
+    Recompute every user's reputation from the ledger
+
+    Returns:
+        int: Number of users updated
+    """
+    table = ReputationEvent.__table__
+    users = User.__table__
+    # Mark everything applied first so a running aggregator can't add events twice
+    db.session.execute(table.update().where(table.c.applied == False).values(applied=True))
+    total = db.session.query(func.coalesce(func.sum(ReputationEvent.points), 0)).filter(
+        ReputationEvent.user_id == users.c.id
+    ).scalar_subquery()
+    count = db.session.execute(users.update().values(reputation=total)).rowcount
+    db.session.commit()
+    return count
+
+
+def _run_aggregator(app):
+    with app.app_context():
+        while True:
+            time.sleep(REPUTATION_AGGREGATE_INTERVAL)
+            try:
+                flush_reputation()
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Error aggregating reputation: {str(e)}")
+            finally:
+                db.session.remove()
+
+
+def start_reputation_aggregator(app):
+    """Start the background thread that folds the ledger into User.reputation (once per process)"""
+    global _aggregator
+    with _aggregator_lock:
+        if _aggregator is not None and _aggregator.is_alive():
+            return
+        _aggregator = threading.Thread(target=_run_aggregator, args=(app,), daemon=True,
+                                       name='ReputationAggregator')
+        _aggregator.start()
+        app.logger.info('Reputation aggregator started')
@@ -0,0 +1,61 @@
+"""
+Dialect-aware full-text search.
+
+On PostgreSQL, questions and comments are matched with to_tsvector/
+plainto_tsquery and ranked with ts_rank; the GIN expression indexes created by
+migration 10 cover exactly the document expressions built here, so a search
+is an index lookup instead of a scan. Other databases (SQLite) fall back to
+case-insensitive substring matching, ranked by whether the title matches.
+"""
+import os
+from sqlalchemy import case, func, literal_column, or_
+from app.database import dialect_name
+from app.models.question import Question
+from app.models.comment import Comment
+
+# Text search configuration used for documents, queries and the indexes
+SEARCH_LANGUAGE = os.environ.get('SEARCH_LANGUAGE', 'english')
+if not SEARCH_LANGUAGE.isidentifier():
+    raise ValueError(f'SEARCH_LANGUAGE must be a text search configuration name, got {SEARCH_LANGUAGE!r}')
+
+
+def _config():
+    # A literal, not a bind parameter, so the expression matches the index definition
+    return literal_column(f"'{SEARCH_LANGUAGE}'::regconfig")
+
+
+def question_document():
+    """The tsvector expression behind ix_questions_fts"""
+    return func.to_tsvector(_config(), func.coalesce(Question.title, literal_column("''"))
+                            .op('||')(literal_column("' '"))
+                            .op('||')(func.coalesce(Question.body, literal_column("''"))))
+
+
+def comment_document():
+    """The tsvector expression behind ix_comments_fts"""
+    return func.to_tsvector(_config(), func.coalesce(Comment.body, literal_column("''")))
+
+
+def uses_fts():
+    return dialect_name() == 'postgresql'
+
+
+def match_questions(query):
+    """Filter condition for questions whose title or body match the search"""
+    if uses_fts():
+        return question_document().op('@@')(func.plainto_tsquery(_config(), query))
+    return or_(Question.title.ilike(f'%{query}%'), Question.body.ilike(f'%{query}%'))
+
+
+def match_comments(query):
+    """Filter condition for comments whose body matches the search"""
+    if uses_fts():
+        return comment_document().op('@@')(func.plainto_tsquery(_config(), query))
+    return Comment.body.ilike(f'%{query}%')
+
+
+def question_rank(query):
+    """Sort key for relevance, higher is better"""
+    if uses_fts():
+        return func.ts_rank(question_document(), func.plainto_tsquery(_config(), query))
+    return case((Question.title.ilike(f'%{query}%'), 1), else_=0)
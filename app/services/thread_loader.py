@@ -0,0 +1,165 @@
+"""
+Thread loading without a query per comment.
+
+load_thread() reads every comment of a question, with its author, in one
+query and links the tree in memory: each comment gets a thread_replies list,
+so templates and serializers can walk the thread without touching the
+lazy-loaded Comment.replies relationship.
+
+subtree_ids() finds the descendants of some comments. SQLite and PostgreSQL
+get a single WITH RECURSIVE query; other dialects walk the tree one level at
+a time, with one IN query per level.
+
+load_replies() expands part of a thread breadth-first for the JSON API: one
+IN query per depth level fetches the replies of the whole frontier, best
+first, capped at REPLY_LEVEL_LIMIT per level, so expanding a deep discussion
+costs a query per level rather than one per comment.
+"""
+import os
+from collections import defaultdict
+from sqlalchemy import literal, select
+from sqlalchemy.orm import aliased, joinedload
+from app import db
+from app.database import dialect_name
+from app.models.comment import Comment
+
+# Dialects whose recursive CTEs are used for subtree queries
+RECURSIVE_CTE_DIALECTS = ('sqlite', 'postgresql')
+# Most replies load_replies() fetches per depth level
+REPLY_LEVEL_LIMIT = int(os.environ.get('REPLY_LEVEL_LIMIT', 200))
+# Deepest expansion the API allows
+MAX_REPLY_DEPTH = int(os.environ.get('MAX_REPLY_DEPTH', 10))
+
+
+def link_thread(comments):
+    """
+    Attach a thread_replies list to every comment, ordered by creation time
+
+    Returns:
+        list: The comments without a parent among the given ones (the roots)
+    """
+    by_id = {comment.id: comment for comment in comments}
+    children = defaultdict(list)
+    roots = []
+    for comment in sorted(comments, key=lambda c: (c.created_at is None, c.created_at, c.id)):
+        if comment.parent_comment_id in by_id:
+            children[comment.parent_comment_id].append(comment)
+        else:
+            roots.append(comment)
+    for comment in comments:
+        comment.thread_replies = children[comment.id]
+    return roots
+
+
+def load_thread(question_id):
+    """
+    Load a question's whole comment tree with one query
+
+    Returns:
+        list: The answers (top-level comments), each with thread_replies set recursively
+    """
+    comments = Comment.query.options(joinedload(Comment.author)).filter(
+        Comment.question_id == question_id).all()
+    return link_thread(comments)
+
+
+def subtree_ids(root_ids, max_depth=None):
+    """
+    Ids of the given comments and all their descendants
+
+    Args:
+        root_ids (list): Comments to start from
+        max_depth (int, optional): Levels below the roots to include (None for all)
+
+    Returns:
+        dict: comment id -> depth below its root (0 for the roots)
+    """
+    root_ids = list(root_ids)
+    if not root_ids:
+        return {}
+    if dialect_name() in RECURSIVE_CTE_DIALECTS:
+        return _subtree_ids_cte(root_ids, max_depth)
+    return _subtree_ids_levels(root_ids, max_depth)
+
+
+def _subtree_ids_cte(root_ids, max_depth):
+    tree = select(Comment.id.label('id'), literal(0).label('depth')).where(
+        Comment.id.in_(root_ids)).cte('tree', recursive=True)
+    child = aliased(Comment)
+    step = select(child.id, tree.c.depth + 1).where(child.parent_comment_id == tree.c.id)
+    if max_depth is not None:
+        step = step.where(tree.c.depth < max_depth)
+    tree = tree.union_all(step)
+    return {comment_id: depth for comment_id, depth in db.session.execute(select(tree.c.id, tree.c.depth))}
+
+
+def _subtree_ids_levels(root_ids, max_depth):
+    found = {comment_id: 0 for (comment_id,) in db.session.query(Comment.id).filter(Comment.id.in_(root_ids))}
+    frontier = list(found)
+    depth = 0
+    while frontier and (max_depth is None or depth < max_depth):
+        depth += 1
+        frontier = [comment_id for (comment_id,) in db.session.query(Comment.id).filter(
+            Comment.parent_comment_id.in_(frontier)) if comment_id not in found]
+        for comment_id in frontier:
+            found[comment_id] = depth
+    return found
+
+
+def load_subtree(root_id, max_depth=None):
+    """
+    Load a comment and its descendants with their authors
+
+    Returns:
+        Comment: The root comment with thread_replies set recursively, or None if it doesn't exist
+    """
+    ids = subtree_ids([root_id], max_depth)
+    if not ids:
+        return None
+    comments = Comment.query.options(joinedload(Comment.author)).filter(Comment.id.in_(ids)).all()
+    link_thread(comments)
+    return next(comment for comment in comments if comment.id == root_id)
+
+
+def load_replies(parents, max_depth, level_limit=REPLY_LEVEL_LIMIT):
+    """
+    Load the replies below some comments, breadth-first with one query per level
+
+    Every given comment and loaded reply gets a thread_replies list, ordered
+    by score and then age. Replies on the last level get an empty list even if
+    they have replies of their own.
+
+    Args:
+        parents (list): Comments to expand
+        max_depth (int): Levels of replies to load
+        level_limit (int, optional): Most replies loaded per level (None for all)
+
+    Returns:
+        list: Every reply loaded, level by level
+    """
+    for parent in parents:
+        parent.thread_replies = []
+    loaded = []
+    frontier = list(parents)
+    depth = 0
+    while frontier and depth < max_depth:
+        depth += 1
+        by_id = {comment.id: comment for comment in frontier}
+        query = Comment.query.options(joinedload(Comment.author)).filter(
+            Comment.parent_comment_id.in_(by_id)
+        ).order_by(Comment.score.desc(), Comment.created_at.asc(), Comment.id)
+        if level_limit is not None:
+            query = query.limit(level_limit)
+        frontier = query.all()
+        for reply in frontier:
+            reply.thread_replies = []
+            by_id[reply.parent_comment_id].thread_replies.append(reply)
+        loaded.extend(frontier)
+    return loaded
+
+
+def walk_thread(comments):
+    """Yield the comments and every reply linked below them through thread_replies, depth first"""
+    for comment in comments:
+        yield comment
+        yield from walk_thread(getattr(comment, 'thread_replies', ()))
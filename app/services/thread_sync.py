@@ -0,0 +1,149 @@
+"""
+Compact thread payloads for incremental sync.
+
+build_thread_payload() describes a question's thread as flat, normalized
+JSON: comments keyed by id with their parent id, authors listed once in a
+users map, rendered HTML only on request. Every payload ends with a cursor.
+Passing it back as `since` returns only the comments created or edited after
+it, plus a scores map (id -> score) of the whole thread: votes don't count as
+edits, and ids missing from the map were removed.
+
+A cursor is the newest updated_at seen, minus SYNC_OVERLAP seconds, so a
+write that committed late with an earlier timestamp is still picked up; the
+overlap may resend a few comments, which clients merge by id. A plain comment
+id (like the SSE stream's last_comment_id) is accepted as well and returns
+the comments after it.
+"""
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from app import db
+from app.models.comment import Comment
+from app.models.user import User
+from app.models.vote import Vote
+
+# Seconds a cursor reaches back to catch writes that committed out of order
+SYNC_OVERLAP = float(os.environ.get('THREAD_SYNC_OVERLAP', 5))
+
+
+def parse_cursor(since):
+    """
+    Read a since parameter
+
+    Returns:
+        tuple: ('id', int) or ('time', datetime), or None for a full sync
+
+    Raises:
+        ValueError: If the cursor can't be parsed
+    """
+    if not since:
+        return None
+    if since.isdigit():
+        return 'id', int(since)
+    return 'time', datetime.fromisoformat(since)
+
+
+def _cursor(newest):
+    return (newest - timedelta(seconds=SYNC_OVERLAP)).isoformat() if newest else None
+
+
+def _user(user):
+    return {'username': user.username, 'is_ai': user.is_ai, 'profile_image': user.profile_image}
+
+
+def _comment(comment, include_html):
+    data = {
+        'id': comment.id,
+        'parent': comment.parent_comment_id,
+        'user': comment.user_id,
+        'body': None if comment.is_deleted else comment.body,
+        'score': comment.score,
+        'created': comment.created_at.isoformat() if comment.created_at else None,
+        'updated': comment.updated_at.isoformat() if comment.updated_at else None,
+        'deleted': bool(comment.is_deleted),
+        'accepted': bool(comment.is_accepted),
+    }
+    if include_html:
+        data['html'] = comment.html_content
+    return data
+
+
+def build_thread_payload(question, since=None, include_html=False, user_id=None):
+    """
+    Describe a question's thread, or the changes to it since a cursor
+
+    Args:
+        question (Question): The thread's question
+        since (tuple, optional): A parsed cursor (see parse_cursor)
+        include_html (bool): Add rendered HTML next to the markdown bodies
+        user_id (int, optional): Add this user's votes on the returned items
+
+    Returns:
+        dict: JSON-serializable payload with question, comments, users, cursor
+              (and scores for incremental syncs, votes when user_id is given)
+    """
+    query = Comment.query.filter(Comment.question_id == question.id)
+    if since is not None:
+        kind, value = since
+        if kind == 'id':
+            query = query.filter(Comment.id > value)
+        else:
+            query = query.filter(or_(Comment.updated_at >= value, Comment.updated_at.is_(None)))
+    comments = query.order_by(Comment.id).all()
+
+    question_changed = since is None or (
+        since[0] == 'time' and question.updated_at is not None and question.updated_at >= since[1])
+    question_data = {
+        'id': question.id,
+        'title': question.title,
+        'score': question.score,
+        'views': question.views,
+        'answer_count': question.answer_count,
+        'comment_count': question.comment_count,
+        'is_answered': bool(question.is_answered),
+        'is_closed': bool(question.is_closed),
+        'updated': question.updated_at.isoformat() if question.updated_at else None,
+    }
+    if question_changed:
+        question_data['user'] = question.user_id
+        question_data['body'] = question.body
+        question_data['created'] = question.created_at.isoformat() if question.created_at else None
+        question_data['tags'] = [question_tag.tag.name for question_tag in question.tags]
+        if include_html:
+            question_data['html'] = question.body_html
+
+    # Each author once, in one query
+    user_ids = {comment.user_id for comment in comments}
+    if question_changed:
+        user_ids.add(question.user_id)
+    users = {str(user.id): _user(user) for user in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
+
+    # The newest change returned; with nothing new, a time cursor stays where it was
+    times = [comment.updated_at for comment in comments if comment.updated_at]
+    if question_changed and question.updated_at:
+        times.append(question.updated_at)
+    if since is not None and since[0] == 'time':
+        times.append(since[1] + timedelta(seconds=SYNC_OVERLAP))
+    newest = max(times, default=question.updated_at or question.created_at)
+
+    payload = {
+        'question': question_data,
+        'comments': {str(comment.id): _comment(comment, include_html) for comment in comments},
+        'users': users,
+        'full': since is None,
+        'cursor': _cursor(newest),
+    }
+    if since is not None:
+        payload['scores'] = {str(comment_id): score for comment_id, score in db.session.query(
+            Comment.id, Comment.score).filter(Comment.question_id == question.id)}
+
+    if user_id is not None:
+        comment_ids = [comment.id for comment in comments]
+        votes = {}
+        if comment_ids:
+            votes = {str(comment_id): vote_type for comment_id, vote_type in db.session.query(
+                Vote.comment_id, Vote.vote_type).filter(Vote.user_id == user_id, Vote.comment_id.in_(comment_ids))}
+        question_vote = db.session.query(Vote.vote_type).filter(
+            Vote.user_id == user_id, Vote.question_id == question.id).scalar()
+        payload['votes'] = {'question': question_vote or 0, 'comments': votes}
+    return payload
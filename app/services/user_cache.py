@@ -0,0 +1,139 @@
+"""
+Per-request user lookups.
+
+Flask-Login loads the current user on every request. The column values of
+recently loaded users are cached for USER_CACHE_TTL seconds and re-attached to
+the request's session without a query; the entry is dropped whenever the
+process changes the user through the ORM (profile edits, admin toggles,
+deletion). Other processes and Core bulk updates (e.g. the reputation
+aggregator) are picked up when the entry expires.
+
+User.last_seen is maintained the same way, off the request path: requests
+record activity in memory, at most once per LAST_SEEN_INTERVAL per user, and a
+background thread writes the recorded times in one batch.
+"""
+import os
+import atexit
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+from app import db
+from app.models.user import User
+
+# Seconds a loaded user is served from the cache
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 30))
+# Minimum seconds between last_seen updates for the same user
+LAST_SEEN_INTERVAL = float(os.environ.get('LAST_SEEN_INTERVAL', 300))
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+_seen = {}      # user_id -> last activity not yet written
+_written = {}   # user_id -> monotonic time activity was last recorded
+_seen_lock = threading.Lock()
+_writer = None
+
+
+def _snapshot(user):
+    return {attr.key: getattr(user, attr.key) for attr in db.inspect(User).column_attrs}
+
+
+def load_user(user_id):
+    """Get a user attached to the current session, from the cache when fresh"""
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(user_id)
+    if entry and entry[0] > now:
+        user = User(**entry[1])
+        make_transient_to_detached(user)
+        # load=False attaches the cached state without a SELECT
+        return db.session.merge(user, load=False)
+
+    user = db.session.get(User, user_id)
+    with _cache_lock:
+        if user is None:
+            _cache.pop(user_id, None)
+        else:
+            _cache[user_id] = (now + USER_CACHE_TTL, _snapshot(user))
+    return user
+
+
+def invalidate_user(user_id):
+    """Drop a user from the cache so the next request reloads it"""
+    with _cache_lock:
+        _cache.pop(user_id, None)
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, user):
+    invalidate_user(user.id)
+
+
+def touch_last_seen(user_id):
+    """Record a user's activity; written to the database in the next batch"""
+    now = time.monotonic()
+    with _seen_lock:
+        last = _written.get(user_id)
+        if last is not None and now - last < LAST_SEEN_INTERVAL:
+            return
+        _written[user_id] = now
+        _seen[user_id] = datetime.utcnow()
+
+
+def flush_last_seen():
+    """
+    Write the recorded activity times to the database
+
+    Returns:
+        int: Number of users updated
+    """
+    global _seen
+    with _seen_lock:
+        seen, _seen = _seen, {}
+    if not seen:
+        return 0
+
+    from app.services.db_writer import run_write
+    run_write(_write_last_seen, seen)
+    return len(seen)
+
+
+def _write_last_seen(seen):
+    table = User.__table__
+    db.session.execute(
+        table.update().where(table.c.id == db.bindparam('user_id')).values(last_seen=db.bindparam('seen_at')),
+        [{'user_id': user_id, 'seen_at': seen_at} for user_id, seen_at in seen.items()]
+    )
+    db.session.commit()
+
+
+def _flush_with_context(app):
+    with app.app_context():
+        try:
+            flush_last_seen()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error writing last_seen: {str(e)}")
+        finally:
+            db.session.remove()
+
+
+def _run_writer(app):
+    # Activity is recorded at most once per interval, so writing a few times per interval is plenty
+    while True:
+        time.sleep(max(LAST_SEEN_INTERVAL / 5, 1))
+        _flush_with_context(app)
+
+
+def start_last_seen_writer(app):
+    """Start the background last_seen writer and flush once more at shutdown (once per process)"""
+    global _writer
+    with _seen_lock:
+        if _writer is not None and _writer.is_alive():
+            return
+        _writer = threading.Thread(target=_run_writer, args=(app,), daemon=True, name='LastSeenWriter')
+        _writer.start()
+    atexit.register(_flush_with_context, app)
@@ -0,0 +1,102 @@
+"""
+Buffered question view counts.
+
+Page views are tallied in memory and flushed every VIEW_FLUSH_INTERVAL seconds
+(and at shutdown) as one batch of atomic "views = views + n" UPDATEs, so
+viewing a question never takes the database write lock and concurrent views
+are never lost to a read-modify-write race. A crash loses at most one
+interval of views.
+"""
+import os
+import atexit
+import threading
+import time
+from collections import Counter
+from app import db
+
+# Seconds between flushes of the buffered view counts
+VIEW_FLUSH_INTERVAL = float(os.environ.get('VIEW_FLUSH_INTERVAL', 10))
+
+_pending = Counter()
+_lock = threading.Lock()
+_flusher = None
+
+
+def record_view(question_id):
+    """Count a view of a question; it's written to the database on the next flush"""
+    with _lock:
+        _pending[question_id] += 1
+
+
+def pending_views(question_id):
+    """Views of a question not yet written to the database"""
+    with _lock:
+        return _pending.get(question_id, 0)
+
+
+def flush_views():
+    """
+    Write the buffered view counts to the database
+
+    Returns:
+        int: Number of questions updated
+    """
+    global _pending
+    with _lock:
+        counts, _pending = _pending, Counter()
+    if not counts:
+        return 0
+
+    from app.services.db_writer import run_write
+
+    try:
+        run_write(_write_views, dict(counts))
+    except Exception:
+        db.session.rollback()
+        # Put the counts back so the next flush retries them
+        with _lock:
+            _pending.update(counts)
+        raise
+    return len(counts)
+
+
+def _write_views(counts):
+    from app.models.question import Question
+
+    table = Question.__table__
+    # Views aren't edits, so updated_at is kept
+    db.session.execute(
+        table.update().where(table.c.id == db.bindparam('question_id')).values(
+            views=db.func.coalesce(table.c.views, 0) + db.bindparam('delta'),
+            updated_at=table.c.updated_at
+        ),
+        [{'question_id': question_id, 'delta': delta} for question_id, delta in counts.items()]
+    )
+    db.session.commit()
+
+
+def _flush_with_context(app):
+    with app.app_context():
+        try:
+            flush_views()
+        except Exception as e:
+            app.logger.error(f"Error flushing view counts: {str(e)}")
+        finally:
+            db.session.remove()
+
+
+def _run_flusher(app):
+    while True:
+        time.sleep(VIEW_FLUSH_INTERVAL)
+        _flush_with_context(app)
+
+
+def start_view_counter(app):
+    """Start the background flusher and flush once more at shutdown (once per process)"""
+    global _flusher
+    with _lock:
+        if _flusher is not None and _flusher.is_alive():
+            return
+        _flusher = threading.Thread(target=_run_flusher, args=(app,), daemon=True, name='ViewCounterFlusher')
+        _flusher.start()
+    atexit.register(_flush_with_context, app)
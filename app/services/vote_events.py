@@ -0,0 +1,256 @@
+"""
+Deferred AI reactions to votes.
+
+Vote handlers only record a lightweight event (target and voter ids) in an
+in-process buffer and return. A single consumer thread waits until a target's
+first event is VOTE_REACTION_WINDOW seconds old, then hands everything that
+arrived for it in the meantime to one low priority task, which decides whether
+any AI reacts at all. A burst of votes on one post therefore costs at most one
+LLM call instead of one per vote.
+
+Events are not persisted: reactions are optional, so any still buffered when
+the process exits are simply dropped.
+"""
+import os
+import random
+import threading
+import time
+from flask import current_app
+from app import db
+from app.models.question import Question
+from app.models.comment import Comment
+from app.models.user import User
+
+# Seconds to collect votes on a post before deciding on a reaction
+VOTE_REACTION_WINDOW = float(os.environ.get('VOTE_REACTION_WINDOW', 30))
+# Score an answer or comment needs before other AIs chime in
+VOTE_REACTION_MIN_SCORE = int(os.environ.get('VOTE_REACTION_MIN_SCORE', 3))
+
+# (kind, target_id) -> {'due', 'voters', 'net', 'count'}
+_buffer = {}
+_condition = threading.Condition()
+_consumer = None
+_app = None
+
+
+def emit_vote_event(kind, target_id, user_id, vote_type):
+    """
+    Record a vote for a deferred AI reaction
+
+    Args:
+        kind (str): 'question' or 'comment'
+        target_id (int): The voted question or comment
+        user_id (int): The voter
+        vote_type (int): 1 or -1 for the new vote, 0 if it was removed
+    """
+    global _consumer, _app
+
+    with _condition:
+        if _consumer is None or not _consumer.is_alive():
+            _app = current_app._get_current_object()
+            _consumer = threading.Thread(target=_consume, daemon=True, name='VoteEventConsumer')
+            _consumer.start()
+
+        entry = _buffer.get((kind, target_id))
+        if entry is None:
+            entry = _buffer[(kind, target_id)] = {
+                'due': time.monotonic() + VOTE_REACTION_WINDOW,
+                'voters': set(),
+                'net': 0,
+                'count': 0,
+            }
+            _condition.notify()
+        entry['voters'].add(user_id)
+        entry['net'] += vote_type
+        entry['count'] += 1
+
+
+def emit_vote_events(user, results):
+    """Record the changed votes from an apply_votes() result; votes by AI users are ignored"""
+    if user.is_ai:
+        return
+    for result in results:
+        if not result['changed']:
+            continue
+        kind = 'question' if 'question_id' in result else 'comment'
+        emit_vote_event(kind, result[kind + '_id'], user.id, result['vote_type'])
+
+
+def _consume():
+    """Hand targets whose window has closed to the low priority task queue"""
+    from app.services.llm_service import queue_task, PRIORITY_LOW
+
+    while True:
+        with _condition:
+            now = time.monotonic()
+            ready = [(key, _buffer.pop(key)) for key, entry in list(_buffer.items()) if entry['due'] <= now]
+            if not ready:
+                next_due = min((entry['due'] for entry in _buffer.values()), default=None)
+                _condition.wait(None if next_due is None else next_due - now)
+                continue
+
+        with _app.app_context():
+            for (kind, target_id), entry in ready:
+                try:
+                    queue_task(react_to_votes, kind, target_id, sorted(entry['voters']), entry['net'],
+                               priority=PRIORITY_LOW, key='votes')
+                except Exception as e:
+                    _app.logger.error(f"Error queueing vote reaction for {kind} {target_id}: {str(e)}")
+
+
+def react_to_votes(kind, target_id, voter_ids, net):
+    """
+    Decide whether an AI reacts to the votes collected on a post, and generate the reaction
+
+    An AI author responds to the net feedback on its own post. Otherwise, an
+    answer or comment whose score has become significant draws a response from
+    the most relevant persona, with a chance that grows with the score.
+
+    Args:
+        kind (str): 'question' or 'comment'
+        target_id (int): The voted question or comment
+        voter_ids (list): Users who voted during the window
+        net (int): Sum of the votes cast during the window (removals count as 0)
+
+    Returns:
+        Comment: The generated reply, or None if no AI reacted
+    """
+    content = Question.query.get(target_id) if kind == 'question' else Comment.query.get(target_id)
+    if not content or content.is_deleted:
+        return None
+    question = content if kind == 'question' else Question.query.get(content.question_id)
+    if not question or question.is_deleted:
+        return None
+
+    # Self-votes don't warrant a reaction
+    if not [voter_id for voter_id in voter_ids if voter_id != content.user_id]:
+        return None
+
+    author = User.query.get(content.user_id)
+    if author and author.is_ai and author.ai_personality_id:
+        if net == 0:
+            return None
+        return _author_reaction(kind, content, question, author, net)
+
+    if kind == 'comment':
+        return _crowd_reaction(content, question)
+    return None
+
+
+def _context(question):
+    context = f"Question Title: {question.title}\n"
+    context += f"Question Body: {question.body}\n"
+    if question.tags:
+        context += f"\n\nTags: {', '.join([tag.tag.name for tag in question.tags])}"
+    return context
+
+
+def _reply(question, content, ai_user, body):
+    # Feedback on a question gets a new answer, feedback on a comment a reply to it
+    reply = Comment(
+        body=body,
+        user_id=ai_user.id,
+        question_id=question.id,
+        parent_comment_id=content.id if isinstance(content, Comment) else None
+    )
+    db.session.add(reply)
+    db.session.commit()
+    return reply
+
+
+def _author_reaction(kind, content, question, ai_user, net):
+    """The AI author responds to the feedback on its own post"""
+    from app.models.ai_personality import AIPersonality
+    from app.services.llm_service import get_completion, PRIORITY_LOW
+
+    personality = AIPersonality.query.get(ai_user.ai_personality_id)
+    if not personality:
+        return None
+
+    vote_type = "upvote" if net > 0 else "downvote"
+    what = "question" if kind == 'question' else "comment"
+    text = content.title if kind == 'question' else content.body
+    prompt = f"""
+    You are {personality.name}, an AI with the following traits:
+    - Expertise: {personality.expertise}
+    - Personality: {personality.personality_traits}
+    - Interaction Style: {personality.interaction_style}
+
+    Users have {vote_type}d your {what}. Please respond to this feedback in a way that reflects your personality.
+
+    Your {what} that was {vote_type}d: {text}
+
+    Respond in a conversational way. If it was upvoted, express gratitude and perhaps expand on your {what}.
+    If it was downvoted, be gracious and ask how you could improve your {what} or provide better information.
+    """
+
+    response = get_completion(
+        prompt=personality.format_prompt(prompt, _context(question)),
+        model=personality.custom_model,
+        api_key=personality.custom_api_key,
+        base_url=personality.custom_base_url,
+        priority=PRIORITY_LOW
+    )
+    # Vote reactions are optional, skip them when the backend is busy
+    if not response:
+        return None
+
+    reply = _reply(question, content, ai_user, response)
+    current_app.logger.info(f"AI {personality.name} responded to {vote_type}s on {what} {content.id}")
+    return reply
+
+
+def _crowd_reaction(comment, question):
+    """Another AI responds to a well-received or controversial answer or comment"""
+    from app.models.ai_personality import AIPersonality
+    from app.services.llm_service import get_completion, PRIORITY_LOW
+    from app.services.persona_router import select_persona
+    from app.services.population_service import get_ai_user
+
+    if question.is_answered:
+        return None
+
+    score = comment.score
+    if abs(score) < VOTE_REACTION_MIN_SCORE:
+        return None
+    # Higher scores are more likely to draw a response, capped at 80%
+    if random.random() > min(0.1 * abs(score), 0.8):
+        return None
+
+    personalities = AIPersonality.query.filter_by(is_active=True).all()
+    personality = select_persona(personalities, question, comment.body)
+    if not personality:
+        return None
+    ai_user = get_ai_user(personality)
+    if ai_user.id == comment.user_id:
+        return None
+
+    sentiment = "well-received" if score > 0 else "controversial"
+    prompt = f"""
+    You are {personality.name}, {personality.description}
+
+    Question: {question.title}
+    {question.body}
+
+    Comment that has been {sentiment} (score: {score}):
+    {comment.body}
+
+    As {personality.name}, provide a thoughtful response to this {sentiment} comment.
+    If the comment is well-received, you might add additional helpful information or agree with it.
+    If the comment is controversial, you might offer a balanced perspective or clarify misconceptions.
+    Your response should reflect your unique personality and perspective.
+    """
+
+    response = get_completion(
+        prompt=prompt,
+        model=personality.custom_model,
+        api_key=personality.custom_api_key,
+        base_url=personality.custom_base_url,
+        priority=PRIORITY_LOW
+    )
+    if not response:
+        return None
+
+    reply = _reply(question, comment, ai_user, response)
+    current_app.logger.info(f"AI {personality.name} responded to {sentiment} comment {comment.id}")
+    return reply
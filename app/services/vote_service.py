@@ -0,0 +1,222 @@
+"""
+Batched vote ingestion.
+
+apply_votes() applies any number of votes by one user in a single transaction:
+votes are written with dialect upserts against the uq_user_question_vote and
+uq_user_comment_vote constraints, the denormalized scores are adjusted with
+one set-based UPDATE per table, and the authors' reputation changes are
+appended to the reputation ledger. Statements are issued through Core, so the
+per-row Vote events are not involved.
+"""
+from sqlalchemy import case, and_
+from app import db
+from app.models.question import Question
+from app.models.comment import Comment
+from app.models.vote import Vote
+from app.services.reputation_service import record_reputation_events
+from app.services.page_cache import invalidate_on_commit
+
+# Largest batch accepted in one call
+MAX_BATCH_SIZE = 100
+
+# Reputation awarded to the content author per vote, by content kind
+REPUTATION = {
+    'question': {1: 5, -1: -2},
+    'answer': {1: 10, -1: -2},
+    'comment': {1: 2, -1: -1},
+}
+
+
+def _parse(votes):
+    """Normalize raw vote dicts; the last vote on a target wins"""
+    targets = {}
+    errors = []
+    for index, raw in enumerate(votes):
+        try:
+            vote_type = int(raw.get('vote_type'))
+            question_id = raw.get('question_id')
+            comment_id = raw.get('comment_id')
+            if vote_type not in (1, -1, 0):
+                raise ValueError('vote_type must be 1, -1 or 0')
+            if bool(question_id) == bool(comment_id):
+                raise ValueError('Must specify exactly one of question_id or comment_id')
+            key = ('question', int(question_id)) if question_id else ('comment', int(comment_id))
+        except (AttributeError, TypeError, ValueError) as e:
+            errors.append({'index': index, 'error': str(e)})
+            continue
+        targets.pop(key, None)
+        targets[key] = vote_type
+    return targets, errors
+
+
+def _upsert(rows, target_column):
+    """Insert or update vote rows with a single statement where the dialect allows it"""
+    table = Vote.__table__
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c[target_column]],
+            set_={'vote_type': stmt.excluded.vote_type}
+        )
+        db.session.execute(stmt)
+        return
+
+    # Generic fallback: update the rows that exist, insert the rest
+    for row in rows:
+        result = db.session.execute(
+            table.update()
+            .where(and_(table.c.user_id == row['user_id'], table.c[target_column] == row[target_column]))
+            .values(vote_type=row['vote_type'])
+        )
+        if not result.rowcount:
+            db.session.execute(table.insert().values(**row))
+
+
+def _add_deltas(model, column, deltas):
+    """UPDATE model SET column = column + CASE id ... END for all ids at once"""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    table = model.__table__
+    values = {column: db.func.coalesce(table.c[column], 0) + case(deltas, value=table.c.id, else_=0)}
+    if 'updated_at' in table.c:
+        # Votes are not edits
+        values['updated_at'] = table.c.updated_at
+    db.session.execute(table.update().where(table.c.id.in_(deltas.keys())).values(values))
+
+
+def apply_votes(user_id, votes, commit=True):
+    """
+    Apply a batch of votes by one user
+
+    Args:
+        user_id (int): The voting user
+        votes (list): Dicts with question_id or comment_id and vote_type (1, -1, or 0 to remove)
+        commit (bool): Commit the transaction; pass False to include the votes in a larger one
+
+    Returns:
+        dict: 'results' with one entry per applied target (including the new score
+              and vote id), and 'errors' for entries that were rejected
+    """
+    targets, errors = _parse(votes[:MAX_BATCH_SIZE])
+    if len(votes) > MAX_BATCH_SIZE:
+        errors.append({'index': MAX_BATCH_SIZE, 'error': f'Batches are limited to {MAX_BATCH_SIZE} votes'})
+
+    question_ids = [target_id for kind, target_id in targets if kind == 'question']
+    comment_ids = [target_id for kind, target_id in targets if kind == 'comment']
+
+    # Authors and kinds of the voted content, in one query per table
+    owners = {}
+    threads = {}
+    if question_ids:
+        for target_id, owner_id in db.session.query(Question.id, Question.user_id).filter(
+                Question.id.in_(question_ids), Question.is_deleted == False):
+            owners[('question', target_id)] = (owner_id, 'question')
+    if comment_ids:
+        for target_id, owner_id, parent_id, question_id in db.session.query(
+                Comment.id, Comment.user_id, Comment.parent_comment_id, Comment.question_id).filter(
+                Comment.id.in_(comment_ids), Comment.is_deleted == False):
+            owners[('comment', target_id)] = (owner_id, 'answer' if parent_id is None else 'comment')
+            threads[('comment', target_id)] = question_id
+
+    # The user's current votes on those targets
+    previous = {}
+    if question_ids:
+        for target_id, vote_type in db.session.query(Vote.question_id, Vote.vote_type).filter(
+                Vote.user_id == user_id, Vote.question_id.in_(question_ids)):
+            previous[('question', target_id)] = vote_type
+    if comment_ids:
+        for target_id, vote_type in db.session.query(Vote.comment_id, Vote.vote_type).filter(
+                Vote.user_id == user_id, Vote.comment_id.in_(comment_ids)):
+            previous[('comment', target_id)] = vote_type
+
+    upserts = {'question': [], 'comment': []}
+    removals = {'question': [], 'comment': []}
+    score_deltas = {'question': {}, 'comment': {}}
+    reputation_events = []
+    changed = []
+
+    for key, vote_type in targets.items():
+        kind, target_id = key
+        if key not in owners:
+            errors.append({kind + '_id': target_id, 'error': f'{kind.capitalize()} not found'})
+            continue
+        old_type = previous.get(key, 0)
+        if vote_type == old_type:
+            continue
+
+        owner_id, content_kind = owners[key]
+        if vote_type:
+            upserts[kind].append({'user_id': user_id, kind + '_id': target_id, 'vote_type': vote_type})
+        else:
+            removals[kind].append(target_id)
+
+        score_deltas[kind][target_id] = vote_type - old_type
+        # A changed or withdrawn vote reverses the points of the old one
+        points = REPUTATION[content_kind]
+        reputation_events.append({
+            'user_id': owner_id,
+            'points': points.get(vote_type, 0) - points.get(old_type, 0),
+            'reason': 'vote',
+            'actor_id': user_id,
+            kind + '_id': target_id,
+        })
+        changed.append(key)
+
+    for kind in ('question', 'comment'):
+        column = kind + '_id'
+        if upserts[kind]:
+            _upsert(upserts[kind], column)
+        if removals[kind]:
+            db.session.execute(Vote.__table__.delete().where(and_(
+                Vote.__table__.c.user_id == user_id,
+                Vote.__table__.c[column].in_(removals[kind])
+            )))
+
+    _add_deltas(Question, 'score', score_deltas['question'])
+    _add_deltas(Comment, 'score', score_deltas['comment'])
+    record_reputation_events(reputation_events)
+    # Core statements skip the ORM events the page cache listens to
+    invalidate_on_commit(*{f'question:{threads.get(key, key[1])}' for key in changed})
+
+    # Read back scores and vote ids for the response
+    results = []
+    if targets:
+        scores = {}
+        vote_ids = {}
+        if question_ids:
+            scores.update({('question', i): s for i, s in db.session.query(Question.id, Question.score).filter(
+                Question.id.in_(question_ids))})
+            vote_ids.update({('question', i): v for i, v in db.session.query(Vote.question_id, Vote.id).filter(
+                Vote.user_id == user_id, Vote.question_id.in_(question_ids))})
+        if comment_ids:
+            scores.update({('comment', i): s for i, s in db.session.query(Comment.id, Comment.score).filter(
+                Comment.id.in_(comment_ids))})
+            vote_ids.update({('comment', i): v for i, v in db.session.query(Vote.comment_id, Vote.id).filter(
+                Vote.user_id == user_id, Vote.comment_id.in_(comment_ids))})
+        for key, vote_type in targets.items():
+            if key not in owners:
+                continue
+            kind, target_id = key
+            results.append({
+                kind + '_id': target_id,
+                'vote_type': vote_type,
+                'score': scores.get(key, 0),
+                'vote_id': vote_ids.get(key),
+                'changed': key in changed,
+                'created': key in changed and previous.get(key, 0) == 0,
+            })
+
+    if commit:
+        db.session.commit()
+    else:
+        # Objects loaded earlier in this session don't see the Core UPDATEs;
+        # flush pending changes first so expiring doesn't discard them
+        db.session.flush()
+        db.session.expire_all()
+    return {'results': results, 'errors': errors}
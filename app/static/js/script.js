@@ -183,6 +183,11 @@ function initializeVoteButtons() {
     });
 }
 
+// Pending votes keyed by target; flushed to the server in one batch
+const voteQueue = new Map();
+let voteFlushTimer = null;
+const VOTE_FLUSH_DELAY = 300;
+
 // Handle voting on questions, answers, and comments
 function handleVote(e) {
     e.preventDefault();
@@ -200,16 +205,40 @@ function handleVote(e) {
     const commentId = button.dataset.commentId || null;
     
     // Get the vote count element
-    const voteCount = button.parentElement.querySelector('.vote-count');
-    const upButton = button.parentElement.querySelector('.vote-button[data-vote-type="up"]');
-    const downButton = button.parentElement.querySelector('.vote-button[data-vote-type="down"]');
+    const voteContainer = button.parentElement;
+    const voteCount = voteContainer.querySelector('.vote-count');
+    const upButton = voteContainer.querySelector('.vote-button[data-vote-type="up"]');
+    const downButton = voteContainer.querySelector('.vote-button[data-vote-type="down"]');
+    
+    // Work out the previous and new vote for this target
+    const previousVote = upButton.classList.contains('voted') ? 1 : (downButton.classList.contains('voted') ? -1 : 0);
+    const newVoteType = previousVote === voteType ? 0 : voteType;  // Remove vote if clicking same button
+    
+    // Update the UI right away; the server's score replaces it after the flush
+    voteCount.textContent = parseInt(voteCount.textContent) + newVoteType - previousVote;
+    updateVoteUI(voteContainer, newVoteType);
+    
+    // Only the latest vote per target is sent
+    const key = questionId ? 'q' + questionId : 'c' + commentId;
+    voteQueue.set(key, {
+        vote: {vote_type: newVoteType, question_id: questionId, comment_id: commentId},
+        voteCount: voteCount
+    });
+    
+    clearTimeout(voteFlushTimer);
+    voteFlushTimer = setTimeout(flushVotes, VOTE_FLUSH_DELAY);
+}
+
+// Send all queued votes in a single request
+function flushVotes() {
+    if (voteQueue.size === 0) {
+        return;
+    }
     
-    // Check if clicking the same button
-    const isVoted = button.classList.contains('voted');
-    const newVoteType = isVoted ? 0 : voteType;  // Remove vote if clicking same button
+    const pending = new Map(voteQueue);
+    voteQueue.clear();
     
-    // Send vote to server
-    fetch('/api/vote', {
+    fetch('/api/votes/batch', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json',
@@ -217,11 +246,10 @@ function handleVote(e) {
             'X-CSRFToken': getCsrfToken()
         },
         body: JSON.stringify({
-            vote_type: newVoteType,
-            question_id: questionId,
-            comment_id: commentId
+            votes: Array.from(pending.values()).map(entry => entry.vote)
         }),
-        credentials: 'same-origin'
+        credentials: 'same-origin',
+        keepalive: true
     })
     .then(response => {
         if (!response.ok) {
@@ -231,24 +259,20 @@ function handleVote(e) {
     })
     .then(data => {
         if (data.success) {
-            // Update vote count
-            const currentCount = parseInt(voteCount.textContent);
-            if (isVoted) {
-                // Remove vote
-                voteCount.textContent = currentCount - voteType;
-                button.classList.remove('voted');
+            // Show the authoritative scores, unless a newer vote is already queued
+            data.results.forEach(result => {
+                const key = result.question_id ? 'q' + result.question_id : 'c' + result.comment_id;
+                const entry = pending.get(key);
+                if (entry && !voteQueue.has(key)) {
+                    entry.voteCount.textContent = result.score;
+                }
+            });
+            
+            if (data.errors && data.errors.length) {
+                showNotification('error', data.errors[0].error || 'Some votes could not be recorded');
             } else {
-                // Add new vote
-                voteCount.textContent = currentCount + newVoteType;
-                // Remove voted class from both buttons
-                upButton.classList.remove('voted');
-                downButton.classList.remove('voted');
-                // Add voted class to clicked button
-                button.classList.add('voted');
+                showNotification('success', 'Vote recorded successfully');
             }
-            
-            // Show success message
-            showNotification('success', 'Vote recorded successfully');
         } else {
             showNotification('error', data.error || 'Failed to record vote');
         }
@@ -259,6 +283,15 @@ function handleVote(e) {
     });
 }
 
+// Don't lose queued votes when leaving the page
+window.addEventListener('pagehide', () => {
+    if (voteQueue.size === 0) {
+        return;
+    }
+    clearTimeout(voteFlushTimer);
+    flushVotes();
+});
+
 // Show notification
 function showNotification(type, message) {
     // Remove any existing notifications
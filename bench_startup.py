@@ -0,0 +1,55 @@
+"""
+A utility script to measure how long a process takes to boot the app.
+Each run starts a fresh interpreter (as a gunicorn worker or script would),
+times importing the app package and calling create_app(), and counts the SQL
+statements issued during boot other than SELECTs and PRAGMAs:
+    python bench_startup.py [runs]
+"""
+
+import sys
+import json
+import statistics
+import subprocess
+
+CHILD = r'''
+import json, time
+started = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+writes = []
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_writes(conn, cursor, statement, parameters, context, executemany):
+    if statement.lstrip().split(None, 1)[0].upper() not in ('SELECT', 'PRAGMA'):
+        writes.append(statement.split('\n', 1)[0])
+
+from app import create_app
+imported = time.perf_counter()
+create_app()
+booted = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': booted - imported, 'writes': writes}))
+'''
+
+
+def run_once():
+    output = subprocess.run([sys.executable, '-c', CHILD], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = [run_once() for _ in range(runs)]
+
+    for phase in ('import', 'create_app'):
+        times = [result[phase] * 1000 for result in results]
+        print(f"{phase:>10}: median {statistics.median(times):7.1f} ms, min {min(times):7.1f} ms")
+    total = [(result['import'] + result['create_app']) * 1000 for result in results]
+    print(f"{'total':>10}: median {statistics.median(total):7.1f} ms, min {min(total):7.1f} ms ({runs} runs)")
+
+    writes = results[-1]['writes']
+    if writes:
+        print(f"Boot issued {len(writes)} write statements:")
+        for statement in writes:
+            print(f"  {statement}")
+    else:
+        print("Boot issued no write statements")
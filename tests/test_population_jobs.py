@@ -0,0 +1,201 @@
+"""
+Population jobs run to completion, checkpoint their units and resume after a stop.
+
+The LLM is replaced by a canned completion and queued tasks are collected
+instead of handed to worker threads, so each test drives the job's chunks
+itself.
+"""
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+os.environ.pop('OPENAI_API_KEY', None)
+
+from app import create_app, db  # noqa: E402
+from app.models.ai_personality import AIPersonality  # noqa: E402
+from app.models.comment import Comment  # noqa: E402
+from app.models.population_job import PopulationJob, PopulationUnit  # noqa: E402
+from app.models.question import Question  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import population_service  # noqa: E402
+
+
+def completion(prompt, **kwargs):
+    return "UPVOTE\nA clear and correct explanation."
+
+
+class PopulationJobTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # create_app() writes its log file relative to the working directory
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp)
+        self.app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.tmp, 'overflew.db')}",
+        })
+        self.context = self.app.app_context()
+        self.context.push()
+        from app.schema import init_schema
+        init_schema(log=lambda message: None)
+
+        asker = User(username='asker', email='asker@example.com')
+        asker.set_password('x')
+        db.session.add(asker)
+        db.session.flush()
+        self.question = Question(title='How do I resume a job?', body='It stopped half way.', user_id=asker.id)
+        db.session.add(self.question)
+        db.session.flush()
+        for name in ('Resumer', 'Checkpointer'):
+            db.session.add(AIPersonality(
+                name=name, description=f'{name} persona', expertise='jobs, queues',
+                personality_traits='careful', interaction_style='direct', helpfulness_level=8,
+                strictness_level=5, verbosity_level=5, prompt_template='{{content}} {{context}}',
+                activity_frequency=1.0, is_active=True))
+        db.session.commit()
+        random.seed(7)
+
+        # Queued chunks are collected and run by drain()
+        self.queued = []
+        collect = lambda func, *args, **kwargs: self.queued.append((func, args))
+        collect_later = lambda delay, func, *args, **kwargs: self.queued.append((func, args))
+        self.patches = [
+            mock.patch.object(population_service, 'get_completion', side_effect=completion),
+            mock.patch.object(population_service, 'queue_task', side_effect=collect),
+            mock.patch.object(population_service, 'queue_task_later', side_effect=collect_later),
+            mock.patch.object(population_service, 'DISCUSSION_MAX_ROUNDS', 1),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        db.session.remove()
+        db.engine.dispose()
+        self.context.pop()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def create_ai_users(self):
+        for personality in AIPersonality.query.all():
+            population_service.get_ai_user(personality)
+
+    def start_job(self):
+        success, message, job = population_service.start_population_job(
+            self.question.id, max_comments=50, num_personalities=2)
+        self.assertTrue(success, message)
+        return job.id
+
+    def drain(self, limit=100):
+        while self.queued and limit:
+            func, args = self.queued.pop(0)
+            func(*args)
+            limit -= 1
+
+    def run_job(self, job_id):
+        population_service.run_population_job(job_id)
+        self.drain()
+        return db.session.get(PopulationJob, job_id)
+
+    def test_stopped_job_resumes_to_completion(self):
+        self.create_ai_users()
+        job_id = self.start_job()
+
+        # One chunk runs, then the worker dies before the next chunk is picked up
+        with mock.patch.object(population_service, 'POPULATE_CHUNK_SIZE', 2):
+            population_service.run_population_job(job_id)
+        self.queued.clear()
+        job = db.session.get(PopulationJob, job_id)
+        self.assertEqual(job.status, 'running')
+        finished = {unit.id: unit.comment_id for unit in job.units if unit.status == 'done'}
+        self.assertTrue(finished)
+        calls = population_service.get_completion.call_count
+
+        # Stale jobs are claimed and re-queued, e.g. on the next startup
+        job.heartbeat_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+        self.assertEqual(population_service.resume_population_jobs(stale_after=60), 1)
+        self.drain()
+
+        job = db.session.get(PopulationJob, job_id)
+        self.assertEqual(job.status, 'completed')
+        self.assertIsNone(job.last_error)
+        self.assertEqual(job.progress()['pending'], 0)
+        self.assertEqual(job.progress()['failed'], 0)
+        # Finished units were not run again
+        for unit_id, comment_id in finished.items():
+            self.assertEqual(db.session.get(PopulationUnit, unit_id).comment_id, comment_id)
+        units = job.units.all()
+        self.assertEqual(population_service.get_completion.call_count - calls,
+                         sum(1 + bool(unit.comment_id and unit.kind == 'review')
+                             for unit in units if unit.id not in finished and unit.status == 'done'))
+        self.assertEqual(job.comments_created, sum(1 for unit in units if unit.comment_id))
+        self.assertEqual(Comment.query.filter(Comment.user_id != self.question.user_id).count(),
+                         job.comments_created)
+
+    def test_job_completes_with_stop_reason(self):
+        self.create_ai_users()
+        job = self.run_job(self.start_job())
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.stop_reason, 'max rounds')
+        self.assertIsNone(job.last_error)
+        self.assertEqual(job.round, 1)
+        self.assertEqual(job.progress()['done'], job.units.count())
+
+    def test_comment_limit_completes_and_skips_pending_units(self):
+        self.create_ai_users()
+        for body in ('First human answer', 'Second human answer'):
+            db.session.add(Comment(body=body, user_id=self.question.user_id, question_id=self.question.id))
+        db.session.commit()
+        success, message, job = population_service.start_population_job(
+            self.question.id, max_comments=1, num_personalities=2)
+        # Every review votes and replies, so the first reply reaches the limit
+        with mock.patch.object(population_service.random, 'random', return_value=0.0):
+            job = self.run_job(job.id)
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.stop_reason, 'comment limit')
+        self.assertEqual(job.comments_created, 1)
+        self.assertEqual(job.progress()['pending'], 0)
+        skipped = job.units.filter_by(status='skipped').all()
+        self.assertTrue(skipped)
+        self.assertEqual({unit.last_error for unit in skipped}, {'Discussion stopped: comment limit'})
+
+    def test_token_budget_completes(self):
+        self.create_ai_users()
+        with mock.patch.object(population_service, 'DISCUSSION_TOKEN_BUDGET', 1):
+            job_id = self.start_job()
+        job = self.run_job(job_id)
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.stop_reason, 'token budget')
+        self.assertEqual(population_service.get_completion.call_count, 1)
+
+    def test_first_answer_creates_the_ai_user(self):
+        # No AI accounts yet: the answer unit creates one before posting
+        job = self.run_job(self.start_job())
+        self.assertEqual(job.status, 'completed')
+        answer = job.units.filter_by(kind='answer').one()
+        self.assertEqual(answer.status, 'done')
+        self.assertEqual(answer.attempts or 0, 0)
+        self.assertIsNotNone(answer.comment_id)
+        author = db.session.get(Comment, answer.comment_id).author
+        self.assertTrue(author.is_ai)
+        self.assertEqual(author.ai_personality_id, answer.personality_id)
+
+    def test_completed_job_is_not_resumed(self):
+        self.create_ai_users()
+        job = self.run_job(self.start_job())
+        self.assertEqual(job.status, 'completed')
+        self.assertFalse(population_service.resume_population_job(job.id))
+        job.heartbeat_at = datetime.utcnow() - timedelta(hours=1)
+        db.session.commit()
+        self.assertEqual(population_service.resume_population_jobs(stale_after=60), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
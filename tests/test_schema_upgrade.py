@@ -0,0 +1,161 @@
+"""
+Upgrading a database created before the versioned migrations existed.
+
+The schema below is what the models created before schema_version was
+introduced. `flask upgrade-db` must bring it to the current models: every
+table and column present, and the question page rendering from it.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from sqlalchemy import inspect, text
+
+os.environ.pop('OPENAI_API_KEY', None)
+
+from app import create_app, db  # noqa: E402
+
+BASELINE_SCHEMA = [
+    """CREATE TABLE tags (
+        id INTEGER NOT NULL, name VARCHAR(50) NOT NULL, description TEXT,
+        PRIMARY KEY (id), UNIQUE (name))""",
+    """CREATE TABLE ai_personalities (
+        id INTEGER NOT NULL, name VARCHAR(64) NOT NULL, description TEXT NOT NULL,
+        expertise VARCHAR(128) NOT NULL, personality_traits VARCHAR(256) NOT NULL,
+        interaction_style VARCHAR(128) NOT NULL, helpfulness_level INTEGER NOT NULL,
+        strictness_level INTEGER NOT NULL, verbosity_level INTEGER NOT NULL, avatar_url VARCHAR(256),
+        prompt_template TEXT NOT NULL, use_custom_prompt BOOLEAN, custom_api_key VARCHAR(256),
+        custom_base_url VARCHAR(256), custom_model VARCHAR(128), activity_frequency FLOAT, is_active BOOLEAN,
+        PRIMARY KEY (id), UNIQUE (name))""",
+    """CREATE TABLE site_settings (
+        id INTEGER NOT NULL, "key" VARCHAR(64) NOT NULL, value VARCHAR(255) NOT NULL,
+        description VARCHAR(255), created_at DATETIME, updated_at DATETIME,
+        PRIMARY KEY (id), UNIQUE ("key"))""",
+    """CREATE TABLE users (
+        id INTEGER NOT NULL, username VARCHAR(64) NOT NULL, email VARCHAR(120) NOT NULL,
+        password_hash VARCHAR(128), reputation INTEGER, about_me TEXT, profile_image VARCHAR(256),
+        is_admin BOOLEAN, is_ai BOOLEAN, ai_personality_id INTEGER, created_at DATETIME, last_seen DATETIME,
+        PRIMARY KEY (id), UNIQUE (username), UNIQUE (email),
+        FOREIGN KEY(ai_personality_id) REFERENCES ai_personalities (id))""",
+    """CREATE TABLE questions (
+        id INTEGER NOT NULL, title VARCHAR(120) NOT NULL, body TEXT NOT NULL, user_id INTEGER NOT NULL,
+        created_at DATETIME, updated_at DATETIME, views INTEGER, is_closed BOOLEAN, close_reason VARCHAR(120),
+        is_deleted BOOLEAN, is_answered BOOLEAN,
+        PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))""",
+    """CREATE TABLE user_tag (
+        user_id INTEGER NOT NULL, tag_id INTEGER NOT NULL, PRIMARY KEY (user_id, tag_id),
+        FOREIGN KEY(user_id) REFERENCES users (id) ON DELETE CASCADE,
+        FOREIGN KEY(tag_id) REFERENCES tags (id) ON DELETE CASCADE)""",
+    """CREATE TABLE answers (
+        id INTEGER NOT NULL, body TEXT NOT NULL, user_id INTEGER NOT NULL, question_id INTEGER NOT NULL,
+        created_at DATETIME, updated_at DATETIME, is_accepted BOOLEAN, is_deleted BOOLEAN,
+        PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id),
+        FOREIGN KEY(question_id) REFERENCES questions (id))""",
+    """CREATE TABLE question_tags (
+        id INTEGER NOT NULL, question_id INTEGER NOT NULL, tag_id INTEGER NOT NULL,
+        PRIMARY KEY (id), CONSTRAINT uq_question_tag UNIQUE (question_id, tag_id),
+        FOREIGN KEY(question_id) REFERENCES questions (id), FOREIGN KEY(tag_id) REFERENCES tags (id))""",
+    """CREATE TABLE comments (
+        id INTEGER NOT NULL, body TEXT NOT NULL, user_id INTEGER NOT NULL, question_id INTEGER NOT NULL,
+        parent_comment_id INTEGER, answer_id INTEGER, created_at DATETIME, updated_at DATETIME,
+        is_deleted BOOLEAN, is_accepted BOOLEAN,
+        PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id),
+        FOREIGN KEY(question_id) REFERENCES questions (id),
+        FOREIGN KEY(parent_comment_id) REFERENCES comments (id), FOREIGN KEY(answer_id) REFERENCES answers (id))""",
+    """CREATE TABLE votes (
+        id INTEGER NOT NULL, user_id INTEGER NOT NULL, question_id INTEGER, comment_id INTEGER,
+        vote_type INTEGER NOT NULL, created_at DATETIME,
+        PRIMARY KEY (id), CONSTRAINT uq_user_question_vote UNIQUE (user_id, question_id),
+        CONSTRAINT uq_user_comment_vote UNIQUE (user_id, comment_id),
+        FOREIGN KEY(user_id) REFERENCES users (id), FOREIGN KEY(question_id) REFERENCES questions (id),
+        FOREIGN KEY(comment_id) REFERENCES comments (id))""",
+]
+
+
+class SchemaUpgradeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # create_app() writes its log file relative to the working directory
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp)
+        self.app = create_app({
+            'TESTING': True,
+            'WTF_CSRF_ENABLED': False,
+            'SQLALCHEMY_DATABASE_URI': f"sqlite:///{os.path.join(self.tmp, 'overflew.db')}",
+        })
+        with self.app.app_context():
+            for statement in BASELINE_SCHEMA:
+                db.session.execute(text(statement))
+            now = datetime(2024, 1, 1)
+            db.session.execute(text(
+                "INSERT INTO users (id, username, email, password_hash, reputation, is_admin, is_ai) "
+                "VALUES (1, 'asker', 'asker@example.com', 'x', 15, 0, 0), "
+                "(2, 'helper', 'helper@example.com', 'x', 10, 0, 0)"))
+            db.session.execute(text(
+                "INSERT INTO questions (id, title, body, user_id, created_at, updated_at, views, "
+                "is_closed, is_deleted, is_answered) "
+                "VALUES (1, 'How do I upgrade?', 'Question body', 1, :now, :now, 3, 0, 0, 0)"), {'now': now})
+            db.session.execute(text(
+                "INSERT INTO answers (id, body, user_id, question_id, created_at, updated_at, is_accepted, is_deleted) "
+                "VALUES (1, 'Legacy answer body', 2, 1, :now, :now, 0, 0)"), {'now': now})
+            db.session.execute(text(
+                "INSERT INTO comments (body, user_id, question_id, answer_id, created_at, updated_at, "
+                "is_deleted, is_accepted) VALUES ('Reply on the answer', 1, 1, 1, :now, :now, 0, 0)"), {'now': now})
+            db.session.execute(text(
+                "INSERT INTO votes (user_id, question_id, vote_type, created_at) VALUES (2, 1, 1, :now)"),
+                {'now': now})
+            db.session.commit()
+
+    def tearDown(self):
+        from app.services.view_counter import flush_views
+        with self.app.app_context():
+            # Buffered page views would otherwise be written at exit, after the database is gone
+            flush_views()
+            db.session.remove()
+            db.engine.dispose()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def upgrade(self):
+        from app.schema import run_migrations, latest_version
+        applied = run_migrations(log=lambda message: None)
+        self.assertEqual(applied[-1], latest_version())
+
+    def test_upgrade_creates_every_model_table_and_column(self):
+        with self.app.app_context():
+            self.upgrade()
+            inspector = inspect(db.engine)
+            for table in db.metadata.sorted_tables:
+                self.assertTrue(inspector.has_table(table.name), f'{table.name} is missing')
+                live = {column['name'] for column in inspector.get_columns(table.name)}
+                missing = {column.name for column in table.columns} - live
+                self.assertFalse(missing, f'{table.name} is missing columns {sorted(missing)}')
+
+    def test_question_page_renders_after_upgrade(self):
+        with self.app.app_context():
+            self.upgrade()
+        response = self.app.test_client().get('/questions/1')
+        self.assertEqual(response.status_code, 200)
+        page = response.get_data(as_text=True)
+        self.assertIn('How do I upgrade?', page)
+        self.assertIn('Legacy answer body', page)
+        self.assertIn('Reply on the answer', page)
+
+    def test_upgrade_is_repeatable(self):
+        from app.schema import run_migrations
+        with self.app.app_context():
+            self.upgrade()
+            self.assertEqual(run_migrations(log=lambda message: None), [])
+
+    def test_add_column_refuses_missing_table(self):
+        from app.schema import Migration
+        with self.app.app_context():
+            migration = Migration(999, 'test', log=lambda message: None)
+            with self.assertRaises(RuntimeError):
+                migration.add_column('no_such_table', 'flag', 'BOOLEAN')
+
+
+if __name__ == '__main__':
+    unittest.main()